@@ -1,5 +1,7 @@
 VERSION = (0, 0, 8, 'final', 0)
 
+default_app_config = 'keybase_proofs.apps.KeybaseProofsConfig'
+
 
 def get_version():
     "Returns a PEP 386-compliant version number from VERSION."
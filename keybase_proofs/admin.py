@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib import messages
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+
+DEFAULT_ADMIN_RECHECK_WORKERS = 8
+
+
+@admin.register(KeybaseProof)
+class KeybaseProofAdmin(admin.ModelAdmin):
+    """
+    Admin for large proof tables: users are joined into the changelist query,
+    result counts are not computed over the whole table and searches are
+    exact matches that can use the indexes.
+    """
+    list_display = ('kb_username', 'user', 'sig_hash', 'is_verified', 'is_pending', 'is_live', 'created_at')
+    list_filter = ('is_verified', 'is_pending', 'is_live')
+    list_select_related = ('user',)
+    show_full_result_count = False
+    raw_id_fields = ('user',)
+    search_fields = ('kb_username', 'user__username', 'sig_hash')
+    actions = ['recheck_liveness']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Exact lookups instead of the default `icontains` table scans.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        user_ids = UserModel().objects.filter(username=search_term).values('pk')
+        matches = queryset.filter(kb_username=search_term) | queryset.filter(user__in=user_ids)
+        queryset = matches | queryset.by_sig_hash(search_term)
+        return queryset, False
+
+    def recheck_liveness(self, request, queryset):
+        # Imported on use, `bulk` pulls in the views and the HTTP client.
+        from keybase_proofs.bulk import VerifiedFlagWriter
+        from keybase_proofs.bulk import check_proofs_live
+
+        workers = getattr(settings, 'KEYBASE_PROOFS_ADMIN_RECHECK_WORKERS',
+                          DEFAULT_ADMIN_RECHECK_WORKERS)
+        writer = VerifiedFlagWriter()
+        checked = failed = 0
+        try:
+            for proof, proof_valid, _ in check_proofs_live(queryset.select_related('user'), workers=workers):
+                checked += 1
+                if proof_valid is None:
+                    failed += 1
+                else:
+                    writer.add(proof, proof_valid)
+        except KeybaseUnavailable as e:
+            self.message_user(request, '{}, try again shortly.'.format(e), level=messages.ERROR)
+        writer.flush()
+        self.message_user(request, 'Re-checked {} proofs, {} changed, {} failed.'.format(
+            checked, writer.changed, failed))
+    recheck_liveness.short_description = 'Re-check liveness with Keybase'
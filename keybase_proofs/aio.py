@@ -0,0 +1,337 @@
+"""
+Non-blocking variants of the Keybase verification helpers,
+`KeybaseProofView` and `KeybaseProofListView` for ASGI deployments.
+
+Requires Python 3.5+, Django 3.1+ (async views) and `httpx`, installable with
+`pip install django-keybase-proofs[async]`. The sync API in
+`keybase_proofs.views` is unaffected and does not import this module.
+"""
+import asyncio
+import logging
+import weakref
+from time import monotonic
+
+import httpx
+from asgiref.sync import sync_to_async
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:
+    # asgiref < 3.6
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import render
+
+from keybase_proofs import cache
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.breaker import bounded_timeout
+from keybase_proofs.breaker import deadline
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.client import get_keybase_client
+from keybase_proofs.instrumentation import collect_timings
+from keybase_proofs.instrumentation import record_coalesced
+from keybase_proofs.instrumentation import record_keybase_call
+from keybase_proofs.instrumentation import start_query_timers
+from keybase_proofs.instrumentation import stop_query_timers
+from keybase_proofs.routers import is_sticky
+from keybase_proofs.routers import use_replica
+from keybase_proofs.sites import get_request_site
+from keybase_proofs.sites import use_site
+from keybase_proofs.verifiers import PROOF_LIVE_ENDPOINT
+from keybase_proofs.verifiers import PROOF_VALID_ENDPOINT
+from keybase_proofs.verifiers import HTTPVerifier
+from keybase_proofs.verifiers import get_verifier
+from keybase_proofs.views import KeybaseProofListView
+from keybase_proofs.views import KeybaseProofView
+from keybase_proofs.views import get_domain
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncKeybaseClient(object):
+    """
+    Pooled `httpx.AsyncClient` wrapper configured with the same
+    `KEYBASE_PROOFS_HTTP_*` settings as `keybase_proofs.client.KeybaseClient`.
+
+    httpx connection pools are bound to the event loop that created them, so
+    one pool is kept per running loop and site (see `keybase_proofs.sites`).
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _get_client(self):
+        loop = asyncio.get_event_loop()
+        # Like the sync clients, each site gets its own pool.
+        keybase_client = get_keybase_client()
+        clients = self._clients.setdefault(loop, {})
+        client = clients.get(keybase_client)
+        if client is None:
+            connect_timeout, read_timeout = keybase_client.timeout
+            pool_size = keybase_client.pool_size
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size),
+            )
+            clients[keybase_client] = client
+        return client
+
+    async def get(self, url, params=None):
+        # Same breaker and deadline handling as `KeybaseClient.get`.
+        timeout = get_keybase_client().timeout
+        try:
+            connect_timeout, read_timeout = bounded = bounded_timeout(timeout)
+            keybase_breaker.allow()
+        except KeybaseUnavailable:
+            record_keybase_call(url, 'unavailable', 0)
+            raise
+        start = monotonic()
+        try:
+            r = await self._get_client().get(url, params=params, timeout=httpx.Timeout(
+                read_timeout, connect=connect_timeout))
+        except Exception as e:
+            elapsed = monotonic() - start
+            record_keybase_call(url, 'error', elapsed)
+            if isinstance(e, httpx.TimeoutException) and bounded != tuple(timeout):
+                keybase_breaker.record_cut_short(elapsed)
+                raise DeadlineExceeded('Deadline exceeded calling Keybase')
+            keybase_breaker.record_failure()
+            raise
+        elapsed = monotonic() - start
+        if r.status_code >= 500:
+            keybase_breaker.record_failure()
+        else:
+            keybase_breaker.record_success(elapsed)
+        record_keybase_call(url, r.status_code, elapsed)
+        return r
+
+    async def aclose(self):
+        clients = self._clients.pop(asyncio.get_event_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+
+async_keybase_client = AsyncKeybaseClient()
+
+
+class AsyncSingleFlight(object):
+    """
+    `keybase_proofs.memoize.SingleFlight` for coroutines: concurrent calls
+    with the same key on one event loop await a single task running the
+    coroutine function. The task is shielded, so a caller that is cancelled
+    (e.g. by a client disconnect) doesn't fail the others.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._tasks = weakref.WeakKeyDictionary()
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is None:
+            task = tasks[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda task: tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+            if self.name is not None:
+                record_coalesced(self.name)
+        return await asyncio.shield(task)
+
+
+async_proof_list_flight = AsyncSingleFlight(name='proof_list')
+
+
+def _threaded_verifier():
+    # Verifier backends other than HTTP are sync only and run in a thread.
+    verifier = get_verifier()
+    if isinstance(verifier, HTTPVerifier):
+        return None
+    return verifier
+
+
+async def is_proof_valid(username, sig_hash, kb_username):
+    """
+    Async version of `keybase_proofs.views.is_proof_valid`.
+    """
+    domain = get_domain()
+    verifier = _threaded_verifier()
+    try:
+        if verifier is not None:
+            return await sync_to_async(verifier.proof_valid, thread_sensitive=False)(
+                domain, username, sig_hash, kb_username)
+        r = await async_keybase_client.get(PROOF_VALID_ENDPOINT, params={
+            'domain': domain,
+            'username': username,
+            'kb_username': kb_username,
+            'sig_hash': sig_hash,
+        })
+        if r.status_code != 200:
+            logger.warning('Invalid response from Keybase: %s', r)
+            return False
+        r_json = r.json()
+        return r_json.get('proof_valid', False)
+    except KeybaseUnavailable:
+        raise
+    except Exception:
+        return False
+
+
+async def is_proof_live(user, sig_hash, kb_username):
+    """
+    Async version of `keybase_proofs.views.is_proof_live`.
+    """
+    domain = get_domain()
+    verifier = _threaded_verifier()
+    try:
+        if verifier is not None:
+            return await sync_to_async(verifier.proof_live, thread_sensitive=False)(
+                domain, user.username, sig_hash, kb_username)
+        r = await async_keybase_client.get(PROOF_LIVE_ENDPOINT, params={
+            'domain': domain,
+            'username': user.username,
+            'kb_username': kb_username,
+            'sig_hash': sig_hash,
+        })
+        if r.status_code != 200:
+            logger.warning('Invalid response from Keybase: %s', r)
+            return False, False
+        r_json = r.json()
+        return r_json.get('proof_valid', False), r_json.get('proof_live', False)
+    except KeybaseUnavailable:
+        raise
+    except Exception:
+        return False, False
+
+
+class AsyncViewMixin(object):
+    """
+    Marks the view as async so that Django awaits its async `dispatch`.
+    Django only detects async class-based views from 4.1, and then only if
+    all their handlers are async.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return markcoroutinefunction(super(AsyncViewMixin, cls).as_view(**initkwargs))
+
+
+class AsyncKeybaseProofView(AsyncViewMixin, KeybaseProofView):
+    """
+    `KeybaseProofView` with async handlers. The Keybase round trip does not
+    block a worker, database access and template rendering run in a thread
+    via `sync_to_async`.
+
+    Route it in place of `KeybaseProofView` when serving over ASGI.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Like `InstrumentedViewMixin`, which the sync dispatch is bypassed
+        # with. Database access runs in the thread of `sync_to_async`, whose
+        # connections get the query timers.
+        with collect_timings() as timings:
+            start = monotonic()
+            wrappers = await sync_to_async(start_query_timers)()
+            try:
+                response = await self.dispatch_handler(request, *args, **kwargs)
+            finally:
+                await sync_to_async(stop_query_timers)(wrappers)
+            duration = monotonic() - start
+        return self.record_timing(response, timings, duration)
+
+    async def dispatch_handler(self, request, *args, **kwargs):
+        # Equivalent of `login_required` that does not load the user from the
+        # event loop.
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        else:
+            handler = self.http_method_not_allowed
+        # Like `CurrentSiteMixin`.
+        with use_site(await sync_to_async(get_request_site)(request)):
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        return response
+
+    async def get(self, request, *args, **kwargs):
+        return await sync_to_async(super(AsyncKeybaseProofView, self).get)(
+            request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        sig_hash = request.POST.get('sig_hash')
+        kb_username = request.POST.get('kb_username')
+        username = request.POST.get('username')
+        kb_ua = request.POST.get('kb_ua')
+        error = self._validate(request.user, username, sig_hash, kb_username)
+        if error is None and self.is_deferred():
+            await sync_to_async(self.save_proof)(
+                request.user, kb_username, sig_hash, False, is_pending=True)
+            return self.success_redirect(request, kb_ua, kb_username, sig_hash)
+        if error is None:
+            try:
+                with deadline(self.get_verify_deadline()):
+                    proof_valid = await is_proof_valid(username, sig_hash, kb_username)
+            except KeybaseUnavailable as e:
+                return await sync_to_async(self.unavailable_response)(request, e)
+            if not proof_valid:
+                error = "Invalid signature, please retry"
+            else:
+                await sync_to_async(self.save_proof)(request.user, kb_username, sig_hash, proof_valid)
+                return self.success_redirect(request, kb_ua, kb_username, sig_hash)
+
+        return await sync_to_async(render)(request, self.template_name, {'error': error}, status=400)
+
+
+class AsyncKeybaseProofListView(AsyncViewMixin, KeybaseProofListView):
+    """
+    `KeybaseProofListView` for ASGI deployments. Concurrent cache misses for
+    the same user are coalesced on the event loop, so that they don't queue
+    up one database fetch each for the thread running sync code. The
+    response is then built by the sync view.
+
+    Route it in place of `KeybaseProofListView` when serving over ASGI.
+    """
+
+    def load_proof_list(self, username):
+        # Runs outside of the sync view's dispatch, route reads like
+        # `ReplicaReadMixin` does.
+        load = super(AsyncKeybaseProofListView, self).load_proof_list
+        if is_sticky(self.request):
+            return load(username)
+        with use_replica():
+            return load(username)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.proof_list = self.proof_list_error = None
+        if request.method in ('GET', 'HEAD'):
+            username = self.kwargs.get('username', '')
+            try:
+                with use_site(await sync_to_async(get_request_site)(request)):
+                    self.proof_list = await sync_to_async(cache.get_proof_list)(username)
+                    if self.proof_list is None:
+                        self.proof_list = await async_proof_list_flight.do(
+                            self.get_proof_list_flight_key(username),
+                            sync_to_async(self.load_proof_list), username)
+            except Http404 as e:
+                # Raised again from the sync view to get its 404 response.
+                self.proof_list_error = e
+        return await sync_to_async(super(AsyncKeybaseProofListView, self).dispatch)(
+            request, *args, **kwargs)
+
+    def get_proof_list(self):
+        if self.proof_list_error is not None:
+            raise self.proof_list_error
+        if self.proof_list is None:
+            return super(AsyncKeybaseProofListView, self).get_proof_list()
+        return self.proof_list
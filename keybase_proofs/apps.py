@@ -0,0 +1,28 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+
+
+class KeybaseProofsConfig(AppConfig):
+    name = 'keybase_proofs'
+    verbose_name = 'Keybase proofs'
+
+    def ready(self):
+        from keybase_proofs.models import KeybaseProof
+        from keybase_proofs.signals import delete_user_snapshot
+        from keybase_proofs.signals import invalidate_proof_caches
+        from keybase_proofs.signals import invalidate_user_caches
+        from keybase_proofs.signals import refresh_proof_snapshot
+        from keybase_proofs.signals import remember_username
+        from keybase_proofs.signals import sync_user_lookup_key
+        from keybase_proofs.users import UserModel
+
+        post_save.connect(refresh_proof_snapshot, sender=KeybaseProof)
+        post_delete.connect(refresh_proof_snapshot, sender=KeybaseProof)
+        post_save.connect(invalidate_proof_caches, sender=KeybaseProof)
+        post_delete.connect(invalidate_proof_caches, sender=KeybaseProof)
+        post_delete.connect(delete_user_snapshot, sender=UserModel())
+        post_delete.connect(invalidate_user_caches, sender=UserModel())
+        pre_save.connect(remember_username, sender=UserModel())
+        post_save.connect(sync_user_lookup_key, sender=UserModel())
@@ -0,0 +1,191 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from keybase_proofs.compat import ContextVar
+from keybase_proofs.compat import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the `KEYBASE_PROOFS_BREAKER_*` settings.
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+DEFAULT_SLOW_CALL_THRESHOLD = 5
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class KeybaseUnavailable(Exception):
+    """
+    Raised instead of calling Keybase while the circuit breaker is open.
+    `retry_after` is the number of seconds until the next probe.
+    """
+
+    def __init__(self, message='Keybase is temporarily unavailable', retry_after=None):
+        super(KeybaseUnavailable, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(KeybaseUnavailable):
+    """
+    Raised instead of calling Keybase once the request's deadline budget is
+    spent.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Fails Keybase calls fast after repeated failures instead of letting every
+    request wait on a slow or broken upstream.
+
+    The breaker opens after `KEYBASE_PROOFS_BREAKER_FAILURE_THRESHOLD`
+    consecutive failures, where errors, 5xx responses and calls slower than
+    `KEYBASE_PROOFS_BREAKER_SLOW_CALL_THRESHOLD` seconds count as failures.
+    After `KEYBASE_PROOFS_BREAKER_RESET_TIMEOUT` seconds a single probe call
+    is let through (half open), which closes the breaker again on success.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, 'KEYBASE_PROOFS_BREAKER_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD)
+
+    @property
+    def reset_timeout(self):
+        return getattr(settings, 'KEYBASE_PROOFS_BREAKER_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT)
+
+    @property
+    def slow_call_threshold(self):
+        return getattr(settings, 'KEYBASE_PROOFS_BREAKER_SLOW_CALL_THRESHOLD', DEFAULT_SLOW_CALL_THRESHOLD)
+
+    def _retry_after(self, now):
+        return max(self.opened_at + self.reset_timeout - now, 0)
+
+    def allow(self):
+        """
+        Must be called before each Keybase call, raises `KeybaseUnavailable`
+        if the call should not be made.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = monotonic()
+            if self.state == OPEN and self._retry_after(now) <= 0:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise KeybaseUnavailable(retry_after=self._retry_after(now))
+
+    def record_success(self, elapsed):
+        if elapsed > self.slow_call_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def record_cut_short(self, elapsed):
+        """
+        Records a call that timed out because the deadline clamped its
+        timeout. Such a call only counts as a (slow) failure if it already
+        took `slow_call_threshold` seconds, otherwise it says nothing about
+        Keybase and just gives up its half-open probe.
+        """
+        if elapsed >= self.slow_call_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        logger.warning('Keybase circuit breaker %s -> %s', self.state, state)
+        self.state = state
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def stats(self):
+        """
+        Snapshot of the breaker state for monitoring.
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'retry_after': self._retry_after(monotonic()) if self.state == OPEN else 0,
+            }
+
+
+keybase_breaker = CircuitBreaker()
+
+
+_deadline = ContextVar('keybase_proofs_deadline')
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Bounds the total time Keybase calls made within the block may take, e.g.
+    to fit verification into a request's latency budget. Nested deadlines can
+    only shorten the budget. A `seconds` of None leaves it unbounded.
+    """
+    previous = _deadline.get(None)
+    current = previous
+    if seconds is not None:
+        current = monotonic() + seconds
+        if previous is not None:
+            current = min(current, previous)
+    _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.set(previous)
+
+
+def remaining_budget():
+    """
+    Seconds left in the current deadline, or None if there is no deadline.
+    """
+    current = _deadline.get(None)
+    if current is None:
+        return None
+    return current - monotonic()
+
+
+def bounded_timeout(timeout):
+    """
+    Clamps a `(connect, read)` timeout to the remaining deadline budget.
+    Raises `DeadlineExceeded` if the budget is spent.
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded('Deadline exceeded before calling Keybase')
+    return tuple(min(t, remaining) for t in timeout)
@@ -0,0 +1,353 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Q
+from django.utils import timezone
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.cache import invalidate_user
+from keybase_proofs.compat import monotonic
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.models import sig_hash_to_bytes
+from keybase_proofs.scheduler import first_check
+from keybase_proofs.scheduler import liveness_update
+from keybase_proofs.sites import NO_SITE
+from keybase_proofs.sites import use_site
+from keybase_proofs.snapshots import refresh_snapshots
+from keybase_proofs.users import UserModel
+from keybase_proofs.users import username_lookup_key
+from keybase_proofs.verifiers import PROOF_LIVE
+from keybase_proofs.verifiers import PROOF_VALID
+from keybase_proofs.verifiers import get_verifier
+from keybase_proofs.views import get_domain
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls to `wait` so that at most `rate` calls per second get
+    through. A falsy `rate` disables limiting.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def map_concurrent(func, iterable, workers=8, rate=None):
+    """
+    Calls `func` on each item of `iterable` using a pool of `workers` threads
+    and yields `(item, result)` pairs as they complete.
+
+    At most `2 * workers` items are in flight at a time, so `iterable` is
+    consumed lazily and memory stays flat for arbitrarily large inputs.
+    """
+    limiter = RateLimiter(rate)
+    max_pending = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for item in iterable:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+            limiter.wait()
+            pending[executor.submit(func, item)] = item
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+class VerifiedFlagWriter(object):
+    """
+    Buffers changes to `KeybaseProof.is_verified` from liveness checks and
+    writes them in chunks. Since `is_verified` is the only column written,
+    each chunk is a plain `UPDATE ... WHERE id IN (...)` per value.
+    """
+
+    def __init__(self, chunk_size=500, dry_run=False):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.changed = 0
+        self._pending = {True: [], False: []}
+
+    def add(self, proof, proof_valid):
+        """
+        Records the result of checking `proof`, returns whether its
+        `is_verified` flag changed.
+        """
+        proof_valid = bool(proof_valid)
+        if proof.is_verified == proof_valid:
+            return False
+        self._pending[proof_valid].append(proof)
+        if len(self._pending[proof_valid]) >= self.chunk_size:
+            self._flush(proof_valid)
+        return True
+
+    def _flush(self, is_verified):
+        proofs = self._pending[is_verified]
+        if proofs and not self.dry_run:
+            KeybaseProof.objects.filter(pk__in=[proof.pk for proof in proofs]).update(
+                is_verified=is_verified)
+            refresh_snapshots(proof.user_id for proof in proofs)
+            # `update` skips the `post_save` signal, so invalidate by hand.
+            for user_id, username, site_id in set(
+                    (proof.user_id, proof.user.username, proof.site_id) for proof in proofs):
+                with use_site(site_id):
+                    invalidate_user(username, user_id)
+        self.changed += len(proofs)
+        self._pending[is_verified] = []
+
+    def flush(self):
+        self._flush(True)
+        self._flush(False)
+
+
+def check_proofs_live(proofs, workers=8, rate=None):
+    """
+    Checks many proofs against Keybase's `sig/proof_live` endpoint in
+    parallel. Yields `(proof, proof_valid, proof_live)` in completion order,
+    with `(proof, None, None)` for each failed check.
+
+    Unlike `is_proof_live` errors are not taken as a revocation, so callers
+    can skip the proofs that could not be checked. `KeybaseUnavailable` is
+    raised as usual.
+
+    `proofs` should have their `user` preloaded (e.g. via `select_related`)
+    since worker threads read `proof.user.username`.
+    """
+    verifier = get_verifier()
+
+    def check(proof):
+        try:
+            with use_site(proof.site_id):
+                return verifier.proof_live(
+                    get_domain(), proof.user.username, proof.sig_hash, proof.kb_username)
+        except KeybaseUnavailable:
+            raise
+        except Exception:
+            logger.warning('Checking proof %s failed', proof.pk, exc_info=True)
+            return None, None
+
+    for proof, (proof_valid, proof_live) in map_concurrent(check, proofs, workers, rate):
+        yield proof, proof_valid, proof_live
+
+
+def _process_claimed(queryset, method, write, batch_size, workers):
+    """
+    Claims up to `batch_size` rows of `queryset` with `SELECT ... FOR UPDATE
+    SKIP LOCKED`, checks them in parallel with the verifier's `method` and
+    passes the `(proof, result)` pairs to `write`, which returns the ids of
+    the users whose displayed proofs changed. The result of a failed check
+    is None.
+
+    Rows stay locked until their results are written, so any number of
+    workers can run concurrently without checking a proof twice. If Keybase
+    becomes unavailable the results so far are written and
+    `KeybaseUnavailable` is raised.
+    """
+    verifier = get_verifier()
+    with transaction.atomic():
+        proofs = list(queryset.select_for_update(skip_locked=True)[:batch_size])
+        if not proofs:
+            return []
+        usernames = dict(UserModel().objects.filter(
+            pk__in=set(proof.user_id for proof in proofs)).values_list('pk', 'username'))
+        # Proofs are checked for the domain of their site.
+        domains = {}
+        for site_id in set(proof.site_id for proof in proofs):
+            with use_site(site_id):
+                domains[site_id] = get_domain()
+
+        def check(proof):
+            # Unlike `is_proof_valid` errors are not taken as a rejection.
+            try:
+                with use_site(proof.site_id):
+                    return getattr(verifier, method)(
+                        domains[proof.site_id], usernames[proof.user_id], proof.sig_hash, proof.kb_username)
+            except KeybaseUnavailable:
+                raise
+            except Exception:
+                logger.warning('Checking proof %s failed', proof.pk, exc_info=True)
+                return None
+
+        results = []
+        unavailable = None
+        try:
+            for proof, result in map_concurrent(check, proofs, workers=workers):
+                results.append((proof, result))
+        except KeybaseUnavailable as e:
+            # Raised after the transaction commits the results so far.
+            unavailable = e
+        changed_user_ids = write(results)
+        refresh_snapshots(changed_user_ids)
+    # `update` skips the `post_save` signal, so invalidate by hand once the
+    # results are committed.
+    for user_id, site_id in set((proof.user_id, proof.site_id) for proof, _ in results
+                                if proof.user_id in changed_user_ids):
+        with use_site(site_id):
+            invalidate_user(usernames[user_id], user_id)
+    if unavailable is not None:
+        raise unavailable
+    return results
+
+
+def _update_grouped(updates):
+    """
+    Writes `(pk, fields)` pairs with one UPDATE per distinct `fields`.
+    """
+    groups = OrderedDict()
+    for pk, fields in updates:
+        groups.setdefault(tuple(sorted(fields.items())), []).append(pk)
+    for fields, pks in groups.items():
+        KeybaseProof.objects.filter(pk__in=pks).update(**dict(fields))
+
+
+def upsert_proofs(records):
+    """
+    Inserts or updates proofs on the (user, kb_username, site) unique key,
+    from dicts with `user_id`, `username`, `kb_username`, `sig_hash`,
+    `is_verified` and optionally `created_at` and `site_id` (see
+    `keybase_proofs.sites`). Later records for the same key
+    win. Runs in a single transaction with one query for existing proofs, one
+    INSERT for the new ones and one UPDATE per distinct set of values for the
+    others. Returns `(created, updated)` counts.
+    """
+    records = OrderedDict(
+        ((record['user_id'], record['kb_username'], record.get('site_id', NO_SITE)), record) for record in records)
+    if not records:
+        return 0, 0
+    now = timezone.now()
+    # Shared by the whole batch so that updates can be grouped.
+    schedule = first_check(now)
+    with transaction.atomic():
+        existing = dict(
+            (key[1:], key[0]) for key in KeybaseProof.objects.filter(
+                user_id__in=set(key[0] for key in records),
+                kb_username__in=set(key[1] for key in records),
+            ).values_list('pk', 'user_id', 'kb_username', 'site_id'))
+        new = []
+        updates = []
+        for key, record in records.items():
+            fields = {
+                'sig_hash': record['sig_hash'],
+                'sig_hash_bin': sig_hash_to_bytes(record['sig_hash']),
+                'is_verified': record['is_verified'],
+                'is_pending': False,
+            }
+            fields.update(schedule if record['is_verified'] else {'is_live': False, 'next_check_at': None})
+            if key in existing:
+                updates.append((existing[key], fields))
+            else:
+                new.append(KeybaseProof(
+                    user_id=record['user_id'],
+                    kb_username=record['kb_username'],
+                    site_id=record.get('site_id', NO_SITE),
+                    user_lookup_key=username_lookup_key(record['username']),
+                    created_at=record.get('created_at') or now,
+                    **fields))
+        KeybaseProof.objects.bulk_create(new)
+        _update_grouped(updates)
+        refresh_snapshots(record['user_id'] for record in records.values())
+    # `bulk_create` and `update` skip the model signals.
+    for user_id, username, site_id in set(
+            (record['user_id'], record['username'], record.get('site_id', NO_SITE)) for record in records.values()):
+        with use_site(site_id):
+            invalidate_user(username, user_id)
+    return len(new), len(updates)
+
+
+def verify_pending(batch_size=50, workers=8):
+    """
+    Claims up to `batch_size` pending proofs that are due, those never
+    checked first (oldest first) and then those whose retry is most overdue,
+    and verifies them against Keybase in parallel. Returns `(verified,
+    rejected, failed)` counts of the claimed proofs, all 0 when nothing was
+    due.
+
+    Verified proofs are scheduled for liveness checks. Rejected proofs are
+    kept but not displayed, like proofs revoked on Keybase. Proofs whose
+    check failed stay pending and are retried with the backoff of failed
+    liveness checks (see `keybase_proofs.scheduler`), so that they don't
+    hold up newer proofs. Raises `KeybaseUnavailable` like
+    `_process_claimed`, leaving the remaining proofs pending.
+    """
+    counts = {True: 0, False: 0, None: 0}
+
+    def write(results):
+        now = timezone.now()
+        # Proofs with the same failure count share their retry time, so they
+        # are written together.
+        retries = {}
+        updates = []
+        for proof, proof_valid in results:
+            if proof_valid is None:
+                counts[None] += 1
+                if proof.check_failures not in retries:
+                    retries[proof.check_failures] = liveness_update(proof.check_failures, None, now)
+                updates.append((proof.pk, retries[proof.check_failures]))
+                continue
+            counts[bool(proof_valid)] += 1
+            fields = first_check(now) if proof_valid else {'check_failures': 0, 'next_check_at': None}
+            fields.update(is_verified=bool(proof_valid), is_pending=False)
+            updates.append((proof.pk, fields))
+        _update_grouped(updates)
+        return set(proof.user_id for proof, proof_valid in results if proof_valid)
+
+    queryset = KeybaseProof.objects.pending().filter(
+        Q(next_check_at=None) | Q(next_check_at__lte=timezone.now())
+    ).order_by(F('next_check_at').asc(nulls_first=True), 'created_at')
+    _process_claimed(queryset, PROOF_VALID, write, batch_size, workers)
+    return counts[True], counts[False], counts[None]
+
+
+def check_due_proofs(batch_size=50, workers=8):
+    """
+    Claims up to `batch_size` proofs whose liveness check is due, most
+    overdue first, checks them against Keybase's `sig/proof_live` endpoint
+    in parallel and reschedules them (see `keybase_proofs.scheduler`).
+    Returns the number of proofs checked.
+
+    Raises `KeybaseUnavailable` like `_process_claimed`, the remaining proofs
+    stay due.
+    """
+    def write(results):
+        now = timezone.now()
+        # Proofs with the same outcome and failure count share their next
+        # check time, so they are written together.
+        groups = OrderedDict()
+        for proof, result in results:
+            groups.setdefault((result, proof.check_failures), []).append(proof)
+        updates = []
+        changed_user_ids = set()
+        for (result, check_failures), proofs in groups.items():
+            fields = liveness_update(check_failures, result, now)
+            for proof in proofs:
+                updates.append((proof.pk, fields))
+                if 'is_verified' in fields and fields['is_verified'] != proof.is_verified:
+                    changed_user_ids.add(proof.user_id)
+        _update_grouped(updates)
+        return changed_user_ids
+
+    return len(_process_claimed(KeybaseProof.objects.due().order_by('next_check_at'),
+                                PROOF_LIVE, write, batch_size, workers))
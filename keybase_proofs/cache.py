@@ -0,0 +1,193 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import caches
+from django.utils.http import quote_etag
+
+from keybase_proofs.instrumentation import record_cache_access
+from keybase_proofs.serializers import dumps
+from keybase_proofs.sites import NO_SITE
+from keybase_proofs.sites import get_current_config
+from keybase_proofs.sites import get_sites
+from keybase_proofs.sites import use_site
+from keybase_proofs.users import is_case_insensitive
+from keybase_proofs.users import username_lookup_key
+
+DEFAULT_CACHE_TIMEOUT = 300
+
+
+def get_cache():
+    """
+    Cache used by `keybase_proofs`, configured with the optional
+    `KEYBASE_PROOFS_CACHE` setting (a key of `CACHES`, default 'default'),
+    which can be overridden per site (see `keybase_proofs.sites`).
+    """
+    return caches[get_current_config().get('CACHE', 'default')]
+
+
+def get_cache_timeout():
+    return get_current_config().get('CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+
+
+def _namespace():
+    # Each site's entries are kept apart, even in a shared cache.
+    site_id = get_current_config().site_id
+    if site_id == NO_SITE:
+        return 'keybase_proofs'
+    return 'keybase_proofs:site{}'.format(site_id)
+
+
+def _username_key(prefix, username):
+    # Hash the username so arbitrary URL input always makes a valid key.
+    digest = hashlib.md5(username.encode('utf-8')).hexdigest()
+    return '{}:{}:{}'.format(_namespace(), prefix, digest)
+
+
+def proof_list_cache_key(username):
+    # Keyed on the exact username requested, so that a list is never served
+    # for another user whose username only differs in case.
+    return _username_key('list', username)
+
+
+def proof_list_generation_key(username):
+    # With case-insensitive usernames all spellings share a generation, so
+    # that `invalidate_user` drops the entries of spellings resolved by
+    # lookup key too.
+    if is_case_insensitive():
+        username = username_lookup_key(username)
+    return _username_key('listgen', username)
+
+
+def _new_generation(invalidated_at=0):
+    # Generations record when they were started by `invalidate_user`, see
+    # `get_invalidated_at`.
+    return '{:.3f}:{}'.format(invalidated_at, uuid.uuid4().hex)
+
+
+def get_proof_list_generation(username):
+    """
+    Returns the current generation of the list entries of `username`, to be
+    read before loading a list and stored with it by `set_proof_list`.
+    """
+    cache = get_cache()
+    key = proof_list_generation_key(username)
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        # Another process may have set the generation in the meantime.
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def get_invalidated_at(generation):
+    """
+    Returns the timestamp of the `invalidate_user` call that started
+    `generation`, or 0 if it wasn't started by one.
+    """
+    try:
+        return float(generation.split(':', 1)[0])
+    except ValueError:
+        return 0
+
+
+def get_proof_list(username):
+    """
+    Returns the cached list api entry for `username`, or None on a miss. An
+    entry is a dict with the encoded json `content` of the response, its
+    `etag` and a `last_modified` timestamp. Entries of an older generation
+    are misses.
+    """
+    key = proof_list_cache_key(username)
+    generation_key = proof_list_generation_key(username)
+    values = get_cache().get_many([key, generation_key])
+    entry = values.get(key)
+    if entry is not None and entry['generation'] != values.get(generation_key):
+        entry = None
+    record_cache_access('proof_list', entry is not None)
+    return entry
+
+
+def set_proof_list(username, keybase_sigs, generation=None):
+    return set_proof_list_content(username, dumps({'keybase_sigs': keybase_sigs}), generation=generation)
+
+
+def set_proof_list_content(username, content, last_modified=None, generation=None):
+    """
+    Caches the already encoded list api response `content` for `username`,
+    modified at the `last_modified` timestamp (default now), as of
+    `generation` (default the current one, see `get_proof_list_generation`).
+    """
+    entry = {
+        'content': content,
+        'etag': quote_etag(hashlib.sha1(content).hexdigest()),
+        'last_modified': int(time.time()) if last_modified is None else last_modified,
+        'generation': generation or get_proof_list_generation(username),
+    }
+    get_cache().set(proof_list_cache_key(username), entry, get_cache_timeout())
+    return entry
+
+
+def proof_version_key(user_id):
+    return '{}:version:{}'.format(_namespace(), user_id)
+
+
+def get_proof_version(user_id):
+    """
+    Returns an opaque version of the proofs of the user with pk `user_id`,
+    which changes whenever one of them is saved or deleted. Caches keyed on
+    it are invalidated by `invalidate_user` without deleting their entries.
+    """
+    cache = get_cache()
+    key = proof_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have set the version in the meantime.
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def proof_fragment_cache_key(user_id, version):
+    return '{}:fragment:{}:{}'.format(_namespace(), user_id, version)
+
+
+def get_proof_fragment(user_id):
+    """
+    Returns a `(key, html)` tuple for the cached `{% keybase_proofs %}`
+    fragment of the user with pk `user_id`, `html` is None on a miss and the
+    fragment can be stored under `key` with `set_proof_fragment`.
+    """
+    key = proof_fragment_cache_key(user_id, get_proof_version(user_id))
+    html = get_cache().get(key)
+    record_cache_access('proof_fragment', html is not None)
+    return key, html
+
+
+def set_proof_fragment(key, html):
+    get_cache().set(key, html, get_cache_timeout())
+
+
+def invalidate_user(username, user_id=None):
+    """
+    Drops all cached data of the current site for `username`, and bumps the
+    proof version of `user_id` if given. Called whenever one of the user's
+    proofs is saved or deleted.
+    """
+    cache = get_cache()
+    cache.delete(proof_list_cache_key(username))
+    cache.set(proof_list_generation_key(username), _new_generation(time.time()), None)
+    if user_id is not None:
+        cache.set(proof_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_user_on_all_sites(username, user_id=None):
+    """
+    `invalidate_user` for changes of the user itself, which affect the
+    cached data of every site.
+    """
+    for site in [None] + get_sites():
+        with use_site(site):
+            invalidate_user(username, user_id)
@@ -0,0 +1,162 @@
+import threading
+import weakref
+
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.breaker import bounded_timeout
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.compat import monotonic
+from keybase_proofs.instrumentation import record_keybase_call
+from keybase_proofs.sites import get_current_config
+from keybase_proofs.sites import get_site_config
+
+# Defaults for the `KEYBASE_PROOFS_HTTP_*` settings.
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+
+
+def guarded_call(endpoint, send, timeout):
+    """
+    Calls `send(timeout)`, which must return a response with a
+    `status_code`, through the circuit breaker and with `timeout` clamped to
+    the current deadline budget, and records the call for instrumentation.
+    Shared by `KeybaseClient` and the stand-in verifiers, so that they fail
+    and are measured the same way.
+
+    A call timing out after its timeout was clamped raises `DeadlineExceeded`,
+    and only counts as a breaker failure if it was slow anyway (see
+    `CircuitBreaker.record_cut_short`).
+    """
+    try:
+        bounded = bounded_timeout(timeout)
+        keybase_breaker.allow()
+    except KeybaseUnavailable:
+        record_keybase_call(endpoint, 'unavailable', 0)
+        raise
+    start = monotonic()
+    try:
+        r = send(bounded)
+    except Exception as e:
+        elapsed = monotonic() - start
+        record_keybase_call(endpoint, 'error', elapsed)
+        import requests
+        if isinstance(e, requests.Timeout) and bounded != tuple(timeout):
+            keybase_breaker.record_cut_short(elapsed)
+            raise DeadlineExceeded('Deadline exceeded calling Keybase')
+        keybase_breaker.record_failure()
+        raise
+    elapsed = monotonic() - start
+    if r.status_code >= 500:
+        keybase_breaker.record_failure()
+    else:
+        keybase_breaker.record_success(elapsed)
+    record_keybase_call(endpoint, r.status_code, elapsed)
+    return r
+
+
+class KeybaseClient(object):
+    """
+    Pooled HTTP client for talking to the Keybase API.
+
+    All sessions created by the client share a single `HTTPAdapter`, so
+    keep-alive connections to keybase.io are reused across requests and
+    threads. `requests.Session` itself is not guaranteed to be thread safe
+    (cookies, redirects), so each thread gets its own session mounted on the
+    shared adapter, whose urllib3 pool is.
+
+    Configured with the following optional settings:
+
+    `KEYBASE_PROOFS_HTTP_CONNECT_TIMEOUT`: seconds to wait for a connection.
+    `KEYBASE_PROOFS_HTTP_READ_TIMEOUT`: seconds to wait for a response.
+    `KEYBASE_PROOFS_HTTP_POOL_SIZE`: maximum number of pooled connections.
+
+    A client created with a site's `config` reads that site's settings, see
+    `get_keybase_client`.
+    """
+
+    def __init__(self, config=None):
+        self._config = config
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapter = None
+
+    @property
+    def config(self):
+        return self._config or get_site_config()
+
+    @property
+    def timeout(self):
+        return (
+            self.config.get('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+            self.config.get('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        )
+
+    @property
+    def pool_size(self):
+        return self.config.get('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)
+
+    def _get_adapter(self):
+        # Settings are read lazily so the client can be created at import
+        # time, and `requests` is only imported once it is used.
+        if self._adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    from requests.adapters import HTTPAdapter
+                    self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        return self._adapter
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.mount('https://', self._get_adapter())
+            self._local.session = session
+        return session
+
+    def get(self, url, params=None):
+        """
+        GETs `url` through the circuit breaker, within the current deadline
+        budget (see `keybase_proofs.breaker`). Raises `KeybaseUnavailable`
+        without making a request if either does not allow the call.
+        """
+        return guarded_call(url, lambda timeout: self.session.get(
+            url, params=params, timeout=timeout), self.timeout)
+
+    def close(self):
+        """
+        Drops all pooled connections; sessions are recreated on next use.
+        """
+        with self._lock:
+            if self._adapter is not None:
+                self._adapter.close()
+            self._adapter = None
+            self._local = threading.local()
+
+
+keybase_client = KeybaseClient()
+
+# Clients of the sites in `keybase_proofs.sites`, dropped along with their
+# config when the settings change.
+_site_clients = weakref.WeakKeyDictionary()
+_site_clients_lock = threading.Lock()
+
+
+def get_keybase_client():
+    """
+    The pooled client of the current site, so that each site's connections
+    are configured and limited separately. `keybase_client` outside of a
+    site.
+    """
+    config = get_current_config()
+    if config.site is None:
+        return keybase_client
+    client = _site_clients.get(config)
+    if client is None:
+        with _site_clients_lock:
+            client = _site_clients.get(config)
+            if client is None:
+                client = _site_clients[config] = KeybaseClient(config)
+    return client
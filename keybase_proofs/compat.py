@@ -0,0 +1,43 @@
+import threading
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from django.urls import re_path
+except ImportError:
+    # Django < 2.0
+    from django.conf.urls import url as re_path
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    class ContextVar(object):
+        """
+        Minimal `contextvars.ContextVar` stand-in for Python 2, backed by a
+        thread local.
+        """
+
+        def __init__(self, name):
+            self.name = name
+            self._local = threading.local()
+
+        def get(self, default=None):
+            return getattr(self._local, 'value', default)
+
+        def set(self, value):
+            self._local.value = value
+
+__all__ = ['ContextVar', 'monotonic', 'queue', 're_path', 'text_type']
@@ -0,0 +1,205 @@
+"""
+Hooks for measuring where `keybase_proofs` spends time.
+
+Every measurement is sent as a Django signal and, if configured, forwarded to
+the metrics backend named by `KEYBASE_PROOFS_METRICS_BACKEND` (a dotted path
+to a `MetricsBackend` subclass).
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from keybase_proofs.compat import ContextVar
+from keybase_proofs.compat import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Sent after each Keybase API call with `endpoint`, `status` (the HTTP status
+# code, 'error' or 'unavailable') and `duration` in seconds.
+keybase_call = Signal()
+# Sent after each instrumented view with `view`, `status`, `duration`,
+# `db_queries` and `db_duration`.
+view_timing = Signal()
+# Sent on each lookup in one of the app's caches with `cache` and `hit`.
+cache_access = Signal()
+# Sent when a call waits on an identical one already in flight (see
+# `keybase_proofs.memoize.SingleFlight`) with `flight`.
+call_coalesced = Signal()
+
+
+class MetricsBackend(object):
+    """
+    Interface for metrics backends, e.g. a statsd or Prometheus adapter. The
+    default implementation discards everything.
+    """
+
+    def timing(self, name, seconds, tags):
+        pass
+
+    def increment(self, name, tags, value=1):
+        pass
+
+
+class LoggingMetricsBackend(MetricsBackend):
+    """
+    Logs every metric at debug level to the `keybase_proofs.instrumentation`
+    logger.
+    """
+
+    def timing(self, name, seconds, tags):
+        logger.debug('%s %.1fms %s', name, seconds * 1000, tags)
+
+    def increment(self, name, tags, value=1):
+        logger.debug('%s +%s %s', name, value, tags)
+
+
+_backends = {}
+
+
+def get_metrics_backend():
+    path = getattr(settings, 'KEYBASE_PROOFS_METRICS_BACKEND', None)
+    if path not in _backends:
+        _backends[path] = import_string(path)() if path else MetricsBackend()
+    return _backends[path]
+
+
+class Timings(object):
+    """
+    Collects the durations of one request's database and Keybase calls, for
+    the `Server-Timing` header.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, name, duration):
+        count, total = self.entries.get(name, (0, 0))
+        self.entries[name] = (count + 1, total + duration)
+
+    def count(self, name):
+        return self.entries.get(name, (0, 0))[0]
+
+    def duration(self, name):
+        return self.entries.get(name, (0, 0))[1]
+
+    def header(self, total):
+        metrics = ['{};dur={:.1f};desc="{} calls"'.format(name, duration * 1000, count)
+                   for name, (count, duration) in sorted(self.entries.items())]
+        metrics.append('total;dur={:.1f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+
+_timings = ContextVar('keybase_proofs_timings')
+
+
+def record_keybase_call(endpoint, status, duration):
+    keybase_call.send(sender=None, endpoint=endpoint, status=status, duration=duration)
+    get_metrics_backend().timing('keybase_proofs.keybase_call', duration, {
+        'endpoint': endpoint,
+        'status': status,
+    })
+    timings = _timings.get(None)
+    if timings is not None:
+        timings.add('keybase', duration)
+
+
+def record_cache_access(cache, hit):
+    cache_access.send(sender=None, cache=cache, hit=hit)
+    get_metrics_backend().increment(
+        'keybase_proofs.cache.{}'.format('hit' if hit else 'miss'), {'cache': cache})
+
+
+def record_coalesced(flight):
+    call_coalesced.send(sender=None, flight=flight)
+    get_metrics_backend().increment('keybase_proofs.singleflight.coalesced', {'flight': flight})
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects the database and Keybase calls made in the block, also in
+    threads started with `sync_to_async`, into the yielded `Timings`.
+    """
+    timings = Timings()
+    previous = _timings.get(None)
+    _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.set(previous)
+
+
+class _QueryTimer(object):
+    """
+    `execute_wrapper` that adds each query's duration to the `Timings` of the
+    context running it.
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        start = monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings = _timings.get(None)
+            if timings is not None:
+                timings.add('db', monotonic() - start)
+
+
+def start_query_timers():
+    """
+    Starts timing the queries of the current thread's connections, returns
+    the timers to pass to `stop_query_timers` from the same thread.
+    """
+    # `execute_wrapper` was added in Django 2.0, older versions only get the
+    # total view duration.
+    wrappers = [c.execute_wrapper(_QueryTimer()) for c in connections.all()
+                if hasattr(c, 'execute_wrapper')]
+    for wrapper in wrappers:
+        wrapper.__enter__()
+    return wrappers
+
+
+def stop_query_timers(wrappers):
+    for wrapper in reversed(wrappers):
+        wrapper.__exit__(None, None, None)
+
+
+class InstrumentedViewMixin(object):
+    """
+    Times the view, counts its database queries and Keybase calls and sends
+    `view_timing`. Adds a `Server-Timing` header to the response when the
+    `KEYBASE_PROOFS_SERVER_TIMING` setting is True.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with collect_timings() as timings:
+            start = monotonic()
+            wrappers = start_query_timers()
+            try:
+                response = super(InstrumentedViewMixin, self).dispatch(request, *args, **kwargs)
+            finally:
+                stop_query_timers(wrappers)
+            duration = monotonic() - start
+        return self.record_timing(response, timings, duration)
+
+    def record_timing(self, response, timings, duration):
+        """
+        Sends the `timings` of a request that took `duration` seconds to
+        respond with `response`, and returns the response.
+        """
+        view = self.__class__.__name__
+        view_timing.send(
+            sender=self.__class__, view=view, status=response.status_code, duration=duration,
+            db_queries=timings.count('db'), db_duration=timings.duration('db'))
+        backend = get_metrics_backend()
+        tags = {'view': view, 'status': response.status_code}
+        backend.timing('keybase_proofs.view', duration, tags)
+        backend.timing('keybase_proofs.view.db', timings.duration('db'), tags)
+        backend.increment('keybase_proofs.view.db_queries', tags, value=timings.count('db'))
+        if getattr(settings, 'KEYBASE_PROOFS_SERVER_TIMING', False):
+            response['Server-Timing'] = timings.header(duration)
+        return response
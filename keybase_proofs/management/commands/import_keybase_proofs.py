@@ -0,0 +1,195 @@
+import gzip
+import json
+import logging
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.bulk import map_concurrent
+from keybase_proofs.bulk import upsert_proofs
+from keybase_proofs.compat import text_type
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.sites import NO_SITE
+from keybase_proofs.sites import get_site_id
+from keybase_proofs.sites import use_site
+from keybase_proofs.users import UserModel
+from keybase_proofs.verifiers import get_verifier
+from keybase_proofs.views import fullmatch
+from keybase_proofs.views import get_domain
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Imports proofs from NDJSON files, one object per line with "
+            "`username`, `kb_username`, `sig_hash` and optionally `is_verified` "
+            "and `created_at`, such as written by `export_keybase_proofs`. "
+            "Proofs are upserted on (user, kb_username) in chunks. Lines that "
+            "don't validate or name unknown users are reported and skipped, as are "
+            "proofs that could not be checked with --verify.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='NDJSON files to import, - for stdin. Files ending in .gz are decompressed.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of proofs to write per transaction (default 500).')
+        parser.add_argument(
+            '--site',
+            help='Import the proofs into the site with this domain (see KEYBASE_PROOFS_SITES).')
+        parser.add_argument(
+            '--verify', action='store_true',
+            help=('Check each proof with Keybase and import only valid ones as '
+                  'verified, instead of trusting `is_verified`.'))
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent requests to Keybase with --verify (default 8).')
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum number of checks per second with --verify, 0 for no limit (default 0).')
+
+    def handle(self, *args, **options):
+        self.counts = {'created': 0, 'updated': 0, 'skipped': 0, 'rejected': 0, 'failed': 0}
+        options['site_id'] = get_site_id(options['site']) if options['site'] else NO_SITE
+        chunk = []
+        try:
+            for record in self.iter_records(options['paths']):
+                chunk.append(record)
+                if len(chunk) >= options['chunk_size']:
+                    self.import_chunk(chunk, options)
+                    chunk = []
+            self.import_chunk(chunk, options)
+        except KeybaseUnavailable as e:
+            # The chunks written so far are kept.
+            raise CommandError('Stopping, {}'.format(e))
+        finally:
+            self.stdout.write('created {created} proofs, updated {updated}, '
+                              'skipped {skipped}, rejected {rejected}, failed {failed}'.format(**self.counts))
+
+    def skip(self, location, error):
+        self.counts['skipped'] += 1
+        self.stderr.write('{}: {}'.format(location, error))
+
+    def iter_records(self, paths):
+        for path in paths:
+            if path == '-':
+                f = getattr(sys.stdin, 'buffer', sys.stdin)
+            elif path.endswith('.gz'):
+                f = gzip.open(path, 'rb')
+            else:
+                f = open(path, 'rb')
+            try:
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    location = '{}:{}'.format(path, lineno)
+                    try:
+                        record = self.parse(line)
+                    except ValueError as e:
+                        self.skip(location, e)
+                        continue
+                    record['location'] = location
+                    yield record
+            finally:
+                if path != '-':
+                    f.close()
+
+    def parse(self, line):
+        """
+        Decodes and validates a line like `KeybaseProofView` validates a
+        posted proof, raising `ValueError` for invalid lines.
+        """
+        data = json.loads(line.decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError('expected a json object')
+        record = {}
+        max_lengths = {
+            'username': UserModel()._meta.get_field('username').max_length,
+            'kb_username': KeybaseProof._meta.get_field('kb_username').max_length,
+            'sig_hash': KeybaseProof._meta.get_field('sig_hash').max_length,
+        }
+        for field, max_length in max_lengths.items():
+            value = data.get(field)
+            if not value or not isinstance(value, text_type):
+                raise ValueError('{} is required'.format(field))
+            if len(value) > max_length:
+                raise ValueError('{} is longer than {} characters'.format(field, max_length))
+            record[field] = value
+        if fullmatch(r'^[0-9a-fA-F]+$', record['sig_hash']) is None:
+            raise ValueError('sig_hash must be a hex string')
+        record['is_verified'] = bool(data.get('is_verified', False))
+        if data.get('created_at'):
+            record['created_at'] = self.parse_created_at(data['created_at'])
+        return record
+
+    def parse_created_at(self, value):
+        created_at = parse_datetime(value) if isinstance(value, text_type) else None
+        if created_at is None:
+            raise ValueError('created_at must be an ISO 8601 timestamp')
+        if settings.USE_TZ and timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, timezone.utc)
+        elif not settings.USE_TZ and timezone.is_aware(created_at):
+            created_at = timezone.make_naive(created_at)
+        return created_at
+
+    def import_chunk(self, chunk, options):
+        if not chunk:
+            return
+        # Users are resolved with one query per chunk.
+        user_ids = dict(UserModel().objects.filter(
+            username__in=set(record['username'] for record in chunk)).values_list('username', 'pk'))
+        records = []
+        for record in chunk:
+            if record['username'] not in user_ids:
+                self.skip(record['location'], 'unknown user {}'.format(record['username']))
+                continue
+            record['user_id'] = user_ids[record['username']]
+            record['site_id'] = options['site_id']
+            records.append(record)
+
+        if options['verify']:
+            verifier = get_verifier()
+
+            def check(record):
+                # Unlike `is_proof_valid` errors are not taken as a rejection,
+                # the proof is reported so that it can be imported again.
+                try:
+                    # Checked for the domain of the site.
+                    with use_site(record['site_id']):
+                        return verifier.proof_valid(
+                            get_domain(), record['username'], record['sig_hash'], record['kb_username'])
+                except KeybaseUnavailable:
+                    raise
+                except Exception as e:
+                    logger.warning('Checking proof at %s failed', record['location'], exc_info=True)
+                    return e
+
+            results = map_concurrent(check, records, workers=options['workers'], rate=options['rate'])
+            records = []
+            try:
+                for record, proof_valid in results:
+                    if isinstance(proof_valid, Exception):
+                        self.counts['failed'] += 1
+                        self.stderr.write('{}: could not be verified, {}'.format(record['location'], proof_valid))
+                    elif proof_valid:
+                        record['is_verified'] = True
+                        records.append(record)
+                    else:
+                        self.counts['rejected'] += 1
+                        self.stderr.write('{}: invalid signature'.format(record['location']))
+            except KeybaseUnavailable:
+                # Keep the proofs verified so far.
+                self.write(records)
+                raise
+        self.write(records)
+
+    def write(self, records):
+        created, updated = upsert_proofs(records)
+        self.counts['created'] += created
+        self.counts['updated'] += updated
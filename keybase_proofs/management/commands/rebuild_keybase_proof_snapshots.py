@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from keybase_proofs.cache import invalidate_user
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.models import KeybaseProofSnapshot
+from keybase_proofs.snapshots import is_enabled
+from keybase_proofs.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the list api snapshots (`KEYBASE_PROOFS_LIST_SNAPSHOTS`) "
+            "of all users with proofs, and drops snapshots of users without.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of users to rebuild per transaction (default 500).')
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            raise CommandError('KEYBASE_PROOFS_LIST_SNAPSHOTS is not enabled '
+                               '(snapshots are not used with KEYBASE_PROOFS_SITES).')
+        chunk_size = options['chunk_size']
+        # Users are paged by pk so memory stays flat.
+        user_ids = KeybaseProof.objects.order_by('user').values_list('user', flat=True).distinct()
+        rebuilt = 0
+        last = None
+        while True:
+            chunk = user_ids if last is None else user_ids.filter(user__gt=last)
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+            for user_id, username in refresh_snapshots(chunk).items():
+                invalidate_user(username, user_id)
+            rebuilt += len(chunk)
+            last = chunk[-1]
+        stale = KeybaseProofSnapshot.objects.exclude(
+            user__in=KeybaseProof.objects.values('user')).delete()[0]
+        self.stdout.write('rebuilt {} snapshots, deleted {} stale'.format(rebuilt, stale))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.bulk import VerifiedFlagWriter
+from keybase_proofs.bulk import check_proofs_live
+from keybase_proofs.compat import monotonic
+from keybase_proofs.models import KeybaseProof
+
+
+class Command(BaseCommand):
+    help = ("Re-checks the liveness of every stored Keybase proof in parallel "
+            "and updates `is_verified` to match Keybase's `proof_valid`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent requests to Keybase (default 8).')
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum number of checks per second, 0 for no limit (default 0).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of changed proofs to write per UPDATE (default 500).')
+        parser.add_argument(
+            '--progress-every', type=int, default=1000,
+            help='Report progress after this many checks (default 1000).')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Check proofs without writing any changes.')
+
+    def handle(self, *args, **options):
+        progress_every = options['progress_every']
+        writer = VerifiedFlagWriter(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+
+        queryset = KeybaseProof.objects.select_related('user').only(
+            'id', 'site_id', 'kb_username', 'sig_hash', 'is_verified', 'user__username')
+        total = queryset.count()
+
+        checked = 0
+        self.failed = 0
+        start = monotonic()
+        results = check_proofs_live(queryset.iterator(),
+                                    workers=options['workers'], rate=options['rate'])
+        try:
+            for proof, proof_valid, _ in results:
+                checked += 1
+                if proof_valid is None:
+                    # Leave proofs that could not be checked as they are.
+                    self.failed += 1
+                else:
+                    writer.add(proof, proof_valid)
+                if checked % progress_every == 0:
+                    self.report(writer, checked, total, start)
+        except KeybaseUnavailable as e:
+            # Stop rather than treat an outage as mass revocation.
+            raise CommandError('Stopping, {}'.format(e))
+        finally:
+            writer.flush()
+            self.report(writer, checked, total, start)
+
+    def report(self, writer, checked, total, start):
+        elapsed = max(monotonic() - start, 1e-6)
+        self.stdout.write('checked {}/{} proofs ({:.1f}/s), {} changed, {} failed{}'.format(
+            checked, total, checked / elapsed, writer.changed, self.failed,
+            ' (dry run)' if writer.dry_run else ''))
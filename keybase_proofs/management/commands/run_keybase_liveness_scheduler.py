@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.bulk import check_due_proofs
+
+
+class Command(BaseCommand):
+    help = ("Re-checks the liveness of proofs whose next check is due, backing "
+            "off for proofs that are not live yet (see `keybase_proofs.scheduler`). "
+            "Run more processes to scale out, due proofs are claimed with SKIP LOCKED.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Number of due proofs to claim at a time (default 50).')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent requests to Keybase (default 8).')
+        parser.add_argument(
+            '--poll-interval', type=float, default=5,
+            help='Seconds to sleep when no proofs are due (default 5).')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no proofs are due instead of polling.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                checked = check_due_proofs(
+                    batch_size=options['batch_size'], workers=options['workers'])
+            except KeybaseUnavailable as e:
+                if options['once']:
+                    raise CommandError('Stopping, {}'.format(e))
+                self.stderr.write('{}, retrying in {:.0f}s'.format(e, e.retry_after or 0))
+                time.sleep(e.retry_after or options['poll_interval'])
+                continue
+            if checked:
+                self.stdout.write('checked {} proofs'.format(checked))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
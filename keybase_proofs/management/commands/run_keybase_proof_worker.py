@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.bulk import verify_pending
+
+
+class Command(BaseCommand):
+    help = ("Verifies proofs stored as pending in deferred verification mode "
+            "(`KEYBASE_PROOFS_DEFERRED_VERIFICATION`). Run more processes to "
+            "scale out, pending proofs are claimed with SKIP LOCKED.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Number of pending proofs to claim at a time (default 50).')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent requests to Keybase (default 8).')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Seconds to sleep when no proofs are pending (default 1).')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no proofs are pending instead of polling.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                verified, rejected, failed = verify_pending(
+                    batch_size=options['batch_size'], workers=options['workers'])
+            except KeybaseUnavailable as e:
+                if options['once']:
+                    raise CommandError('Stopping, {}'.format(e))
+                self.stderr.write('{}, retrying in {:.0f}s'.format(e, e.retry_after or 0))
+                time.sleep(e.retry_after or options['poll_interval'])
+                continue
+            # Proofs whose check failed are retried later, the next batch may
+            # hold more pending proofs.
+            if verified or rejected or failed:
+                self.stdout.write('verified {} proofs, rejected {}, failed {}'.format(
+                    verified, rejected, failed))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+
+from keybase_proofs.compat import monotonic
+from keybase_proofs.instrumentation import record_cache_access
+from keybase_proofs.instrumentation import record_coalesced
+
+# Defaults for the `KEYBASE_PROOFS_VERIFY_CACHE_*` settings.
+DEFAULT_VERIFY_CACHE_SIZE = 1024
+DEFAULT_VERIFY_CACHE_TTL = 60
+DEFAULT_VERIFY_CACHE_NEGATIVE_TTL = 10
+
+_missing = object()
+
+
+class TTLCache(object):
+    """
+    Thread safe in-process cache whose entries expire after a per-entry ttl.
+    Once `maxsize` entries are stored the least recently used one is evicted.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[1] <= monotonic():
+                return default
+            # Re-insert to mark the key as recently used.
+            self._data[key] = item
+            return item[0]
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, monotonic() + ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function while the others wait and share its result (or exception).
+    `coalesced` counts the calls that waited on another one, which are also
+    reported with `record_coalesced` if the flight has a `name`.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            if self.name is not None:
+                record_coalesced(self.name)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+def _is_positive(result):
+    # `is_proof_live` returns a tuple, a proof that is valid but not yet live
+    # is expected to change soon so it's cached like a negative result.
+    if isinstance(result, tuple):
+        return all(result)
+    return bool(result)
+
+
+def memoize_verification(key_func):
+    """
+    Decorates a Keybase verification helper with a bounded TTL cache and
+    in-flight deduplication keyed on `key_func(*args)`. Positive and
+    negative results are cached for different durations, configured with
+    the optional settings:
+
+    `KEYBASE_PROOFS_VERIFY_CACHE_SIZE`: maximum number of cached results.
+    `KEYBASE_PROOFS_VERIFY_CACHE_TTL`: seconds to cache positive results.
+    `KEYBASE_PROOFS_VERIFY_CACHE_NEGATIVE_TTL`: seconds to cache negative results.
+
+    A ttl of 0 disables caching, concurrent calls are still coalesced. The
+    decorated function exposes `cache_clear()`.
+    """
+    def decorator(func):
+        cache = TTLCache(DEFAULT_VERIFY_CACHE_SIZE)
+        flight = SingleFlight(name=func.__name__)
+
+        def call_and_cache(key, *args):
+            result = func(*args)
+            if _is_positive(result):
+                ttl = getattr(settings, 'KEYBASE_PROOFS_VERIFY_CACHE_TTL', DEFAULT_VERIFY_CACHE_TTL)
+            else:
+                ttl = getattr(settings, 'KEYBASE_PROOFS_VERIFY_CACHE_NEGATIVE_TTL',
+                              DEFAULT_VERIFY_CACHE_NEGATIVE_TTL)
+            cache.maxsize = getattr(settings, 'KEYBASE_PROOFS_VERIFY_CACHE_SIZE', DEFAULT_VERIFY_CACHE_SIZE)
+            cache.set(key, result, ttl)
+            return result
+
+        @wraps(func)
+        def wrapper(*args):
+            key = key_func(*args)
+            result = cache.get(key, _missing)
+            record_cache_access(func.__name__, result is not _missing)
+            if result is _missing:
+                result = flight.do(key, call_and_cache, key, *args)
+            return result
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0002_keybaseproof_is_verified'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['user', 'is_verified', 'kb_username', 'sig_hash'], name='kbproof_user_verified_idx'),
+        ),
+    ]
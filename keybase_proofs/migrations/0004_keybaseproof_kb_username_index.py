@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0003_keybaseproof_user_verified_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keybaseproof',
+            name='kb_username',
+            field=models.CharField(db_index=True, max_length=128),
+        ),
+    ]
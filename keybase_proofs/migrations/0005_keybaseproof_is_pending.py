@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0004_keybaseproof_kb_username_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='is_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['is_pending', 'created_at'], name='kbproof_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0005_keybaseproof_is_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='check_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='is_live',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['next_check_at'], name='kbproof_next_check_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:37
+
+from py2casefold import casefold
+
+from django.db import migrations, models
+
+
+def populate_user_lookup_key(apps, schema_editor):
+    KeybaseProof = apps.get_model('keybase_proofs', 'KeybaseProof')
+    # One UPDATE per user with proofs.
+    users = KeybaseProof.objects.values_list('user_id', 'user__username').distinct()
+    for user_id, username in users.iterator():
+        KeybaseProof.objects.filter(user_id=user_id).update(user_lookup_key=casefold(username))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0006_keybaseproof_liveness_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='user_lookup_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_user_lookup_key, migrations.RunPython.noop),
+    ]
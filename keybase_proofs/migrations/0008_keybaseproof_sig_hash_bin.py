@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:40
+
+from django.db import migrations, models
+import keybase_proofs.models
+
+
+# Proofs per UPDATE, small enough for SQLite's limit of 999 query
+# parameters.
+BATCH_SIZE = 300
+
+
+def populate_sig_hash_bin(apps, schema_editor):
+    KeybaseProof = apps.get_model('keybase_proofs', 'KeybaseProof')
+    # One UPDATE per batch of proofs, paged by pk.
+    last_pk = None
+    while True:
+        proofs = KeybaseProof.objects.order_by('pk')
+        if last_pk is not None:
+            proofs = proofs.filter(pk__gt=last_pk)
+        rows = list(proofs.values_list('pk', 'sig_hash')[:BATCH_SIZE])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        values = {}
+        for pk, sig_hash in rows:
+            sig_hash_bin = keybase_proofs.models.sig_hash_to_bytes(sig_hash)
+            if sig_hash_bin is not None:
+                values[pk] = sig_hash_bin
+        if values:
+            KeybaseProof.objects.filter(pk__in=list(values)).update(sig_hash_bin=models.Case(*[
+                models.When(pk=pk, then=models.Value(sig_hash_bin, output_field=models.BinaryField()))
+                for pk, sig_hash_bin in values.items()
+            ], output_field=models.BinaryField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0007_keybaseproof_user_lookup_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='sig_hash_bin',
+            field=keybase_proofs.models.SigHashField(max_length=33, null=True),
+        ),
+        # Populated before the index is created.
+        migrations.RunPython(populate_sig_hash_bin, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['sig_hash_bin'], name='kbproof_sig_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0008_keybaseproof_sig_hash_bin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['created_at', 'id'], name='kbproof_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-17 19:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('keybase_proofs', '0009_keybaseproof_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeybaseProofSnapshot',
+            fields=[
+                ('username', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('updated_at', models.DateTimeField()),
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('keybase_proofs', '0010_keybaseproofsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproof',
+            name='site_id',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='keybaseproof',
+            unique_together={('user', 'kb_username', 'site_id')},
+        ),
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['site_id', 'user'], name='kbproof_site_user_idx'),
+        ),
+    ]
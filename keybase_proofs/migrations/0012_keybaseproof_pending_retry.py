@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0011_keybaseproof_site'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='keybaseproof',
+            name='kbproof_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='keybaseproof',
+            index=models.Index(fields=['is_pending', 'next_check_at', 'created_at'], name='kbproof_pending_idx'),
+        ),
+    ]
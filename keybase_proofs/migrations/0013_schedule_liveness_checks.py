@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+# Proofs per UPDATE, small enough for SQLite's limit of 999 query
+# parameters.
+BATCH_SIZE = 300
+
+
+def schedule_liveness_checks(apps, schema_editor):
+    KeybaseProof = apps.get_model('keybase_proofs', 'KeybaseProof')
+    # Verified proofs stored before 0006 were never scheduled. Make them due
+    # now, one UPDATE per batch of proofs, paged by pk.
+    unscheduled = KeybaseProof.objects.filter(
+        is_verified=True, is_pending=False, next_check_at=None).order_by('pk')
+    last_pk = None
+    while True:
+        proofs = unscheduled
+        if last_pk is not None:
+            proofs = proofs.filter(pk__gt=last_pk)
+        pks = list(proofs.values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        last_pk = pks[-1]
+        KeybaseProof.objects.filter(pk__in=pks, next_check_at=None).update(next_check_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0012_keybaseproof_pending_retry'),
+    ]
+
+    operations = [
+        migrations.RunPython(schedule_liveness_checks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:40
+
+from py2casefold import casefold
+
+from django.db import migrations, models
+
+
+# Snapshots per UPDATE, small enough for SQLite's limit of 999 query
+# parameters.
+BATCH_SIZE = 300
+
+
+def populate_lookup_key(apps, schema_editor):
+    KeybaseProofSnapshot = apps.get_model('keybase_proofs', 'KeybaseProofSnapshot')
+    # One UPDATE per batch of snapshots, paged by username.
+    last_username = None
+    while True:
+        snapshots = KeybaseProofSnapshot.objects.order_by('username')
+        if last_username is not None:
+            snapshots = snapshots.filter(username__gt=last_username)
+        usernames = list(snapshots.values_list('username', flat=True)[:BATCH_SIZE])
+        if not usernames:
+            return
+        last_username = usernames[-1]
+        KeybaseProofSnapshot.objects.filter(username__in=usernames).update(lookup_key=models.Case(*[
+            models.When(username=username, then=models.Value(casefold(username)))
+            for username in usernames
+        ], output_field=models.CharField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keybase_proofs', '0013_schedule_liveness_checks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keybaseproofsnapshot',
+            name='lookup_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_lookup_key, migrations.RunPython.noop),
+    ]
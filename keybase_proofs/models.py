@@ -1,7 +1,99 @@
+import binascii
+
 from django.db import models
 from django.utils import timezone
 
+from . import sites
 from .users import UserModelString
+from .users import username_lookup_key
+
+
+def sig_hash_to_bytes(sig_hash):
+    """
+    Binary form of the hex string `sig_hash`, or None if it can't be decoded
+    (e.g. odd-length hex, which the views accept).
+    """
+    try:
+        return binascii.unhexlify(sig_hash)
+    except (TypeError, ValueError):
+        return None
+
+
+class SigHashField(models.BinaryField):
+    """
+    A `BinaryField` that can be indexed on MySQL, which needs a prefix length
+    to index its default BLOB columns.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'mysql':
+            return 'varbinary({})'.format(self.max_length)
+        return super(SigHashField, self).db_type(connection)
+
+
+class KeybaseProofQuerySet(models.QuerySet):
+
+    def verified(self):
+        return self.filter(is_verified=True)
+
+    def pending(self):
+        return self.filter(is_pending=True)
+
+    def due(self, now=None):
+        """
+        Proofs whose next liveness check is due, see `keybase_proofs.scheduler`.
+        """
+        # Pending proofs use `next_check_at` for retries, see `verify_pending`.
+        return self.filter(is_pending=False, next_check_at__lte=now or timezone.now())
+
+    def for_user(self, user):
+        return self.filter(user=user)
+
+    def for_username(self, username):
+        return self.filter(user__username=username)
+
+    def for_lookup_key(self, username):
+        """
+        Proofs of the user whose username matches `username` ignoring case,
+        via the indexed `user_lookup_key` column.
+        """
+        return self.filter(user_lookup_key=username_lookup_key(username))
+
+    def by_sig_hash(self, sig_hash):
+        """
+        Proofs with `sig_hash` (in any case), via the index on its binary
+        form. Hashes that can't be decoded are matched as text among the
+        proofs without a binary form, which the same index covers.
+        """
+        sig_hash_bin = sig_hash_to_bytes(sig_hash)
+        if sig_hash_bin is None:
+            return self.filter(sig_hash_bin=None, sig_hash=sig_hash)
+        return self.filter(sig_hash_bin=sig_hash_bin)
+
+    def on_current_site(self):
+        """
+        Proofs of the current site (see `keybase_proofs.sites`), all proofs
+        unless proofs are scoped to sites.
+        """
+        if not sites.is_enabled():
+            return self
+        return self.filter(site_id=sites.get_current_site_id())
+
+    def displayed(self):
+        """
+        The proofs to display on the current site. Also usable as the
+        queryset of a `Prefetch` of users' proofs, see
+        `keybase_proofs.prefetch`.
+        """
+        return self.verified().on_current_site()
+
+    def verified_for(self, user):
+        """
+        The proofs to display for `user` on the current site. Served by the
+        (user, is_verified, kb_username, sig_hash) index, which covers the
+        list api fields.
+        """
+        return self.for_user(user).displayed()
 
 
 class KeybaseProof(models.Model):
@@ -13,24 +105,73 @@ class KeybaseProof(models.Model):
         UserModelString(),
         on_delete=models.CASCADE,
     )
+    # The pk of the `django.contrib.sites` site the proof was posted on, see
+    # `keybase_proofs.sites`. `NO_SITE` unless proofs are scoped to sites. A
+    # plain column rather than a foreign key, so that `django.contrib.sites`
+    # is only needed when scoping, and never NULL, so that the unique key
+    # also holds for proofs without a site.
+    site_id = models.PositiveIntegerField(default=sites.NO_SITE, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
-    kb_username = models.CharField(max_length=128)
+    kb_username = models.CharField(max_length=128, db_index=True)
+    # Casefolded username of `user`, denormalized for indexed case-insensitive
+    # lookups. Set on save and kept in sync when the username changes, callers
+    # of `bulk_create` must set it and `sig_hash_bin` themselves.
+    user_lookup_key = models.CharField(max_length=255, db_index=True, default='', editable=False)
     sig_hash = models.CharField(max_length=66)
+    # Decoded `sig_hash` for reverse lookups with `by_sig_hash`, set on save.
+    # NULL if `sig_hash` isn't valid even-length hex.
+    sig_hash_bin = SigHashField(max_length=33, null=True, editable=False)
     # Flag indicating if the profile page should display this proof. Set once
     # the keybase servers have verified it.
     is_verified = models.BooleanField(default=False)
+    # Set for proofs stored without verification in deferred mode, until
+    # `run_keybase_proof_worker` has checked them with Keybase.
+    is_pending = models.BooleanField(default=False)
+    # Liveness check state, maintained by `run_keybase_liveness_scheduler`.
+    # Proofs without `next_check_at` are not scheduled. For pending proofs
+    # the retry state of failed verifications instead.
+    is_live = models.BooleanField(default=False)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    next_check_at = models.DateTimeField(null=True, blank=True)
+    check_failures = models.PositiveIntegerField(default=0)
+
+    objects = KeybaseProofQuerySet.as_manager()
+
+    # Fields exposed by the list api, see `to_dict`.
+    LIST_FIELDS = ('kb_username', 'sig_hash')
 
     class Meta:
-        unique_together = (('user', 'kb_username'),)
+        # A user can link the same Keybase account on several sites.
+        unique_together = (('user', 'kb_username', 'site_id'),)
+        indexes = [
+            models.Index(fields=['user', 'is_verified', 'kb_username', 'sig_hash'],
+                         name='kbproof_user_verified_idx'),
+            models.Index(fields=['is_pending', 'next_check_at', 'created_at'], name='kbproof_pending_idx'),
+            models.Index(fields=['next_check_at'], name='kbproof_next_check_idx'),
+            models.Index(fields=['sig_hash_bin'], name='kbproof_sig_hash_idx'),
+            models.Index(fields=['created_at', 'id'], name='kbproof_created_idx'),
+            models.Index(fields=['site_id', 'user'], name='kbproof_site_user_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the denormalized fields in sync with the fields being saved.
+        update_fields = kwargs.get('update_fields')
+        derived = set()
+        if update_fields is None or 'user' in update_fields:
+            self.user_lookup_key = username_lookup_key(self.user.username)
+            derived.add('user_lookup_key')
+        if update_fields is None or 'sig_hash' in update_fields:
+            self.sig_hash_bin = sig_hash_to_bytes(self.sig_hash)
+            derived.add('sig_hash_bin')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | derived
+        super(KeybaseProof, self).save(*args, **kwargs)
 
     def to_dict(self):
         """
         Serialization format for the list api.
         """
-        return {
-            'kb_username': self.kb_username,
-            'sig_hash': self.sig_hash,
-        }
+        return {field: getattr(self, field) for field in self.LIST_FIELDS}
 
     def __str__(self):
         return '<KeybaseProof username:{}, kb_username:{}, sig_hash:{}, is_verified:{}'.format(
@@ -39,3 +180,28 @@ class KeybaseProof(models.Model):
             self.sig_hash,
             self.is_verified,
         )
+
+
+class KeybaseProofSnapshot(models.Model):
+    """
+    The pre-rendered list api response for a user, keyed by their username
+    and looked up by `lookup_key`. Only maintained with `KEYBASE_PROOFS_LIST_SNAPSHOTS` enabled, see
+    `keybase_proofs.snapshots`.
+    """
+    username = models.CharField(max_length=255, primary_key=True)
+    # `username_lookup_key` of the username, so that requests in another
+    # case find the snapshot.
+    lookup_key = models.CharField(max_length=255, db_index=True, default='', editable=False)
+    # Not a constraint, snapshots are rewritten while a user's proofs are
+    # deleted along with the user and removed once the user is gone.
+    user = models.OneToOneField(
+        UserModelString(),
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    # Encoded json `{"keybase_sigs": [...]}` of the user's verified proofs.
+    content = models.TextField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return '<KeybaseProofSnapshot username:{}, updated_at:{}>'.format(self.username, self.updated_at)
@@ -0,0 +1,46 @@
+"""
+Loading the proofs of a whole page of users at once, for pages that show
+Keybase badges next to many users (directories, comments, search results):
+
+    users = prefetch_keybase_proofs(User.objects.filter(...))
+    comments = Comment.objects.prefetch_related(keybase_proofs_prefetch('author'))
+
+Each user gets the list of their proofs displayed on the current site (see
+`keybase_proofs.sites`) in `user.keybase_proofs`, loaded with one query for
+all users. `{% keybase_proofs %}` renders prefetched proofs without
+querying.
+"""
+from django.db.models import Prefetch
+from django.db.models import QuerySet
+from django.db.models import prefetch_related_objects
+
+from keybase_proofs.models import KeybaseProof
+
+# The user attribute the proofs are stored in.
+PREFETCH_ATTR = 'keybase_proofs'
+
+
+def keybase_proofs_prefetch(through=None):
+    """
+    A `Prefetch` of users' displayed proofs into `PREFETCH_ATTR`, for
+    `prefetch_related`. `through` is the lookup of the users from the
+    queryset's model, e.g. 'author' for comments, None for users.
+    """
+    lookup = KeybaseProof._meta.get_field('user').remote_field.get_accessor_name()
+    if through:
+        lookup = '{}__{}'.format(through, lookup)
+    return Prefetch(lookup, queryset=KeybaseProof.objects.displayed(), to_attr=PREFETCH_ATTR)
+
+
+def prefetch_keybase_proofs(users):
+    """
+    Attaches the displayed proofs of `users` with a single query. A
+    queryset is returned with the prefetch added, and loads the proofs when
+    it is evaluated. Other iterables of users are loaded right away and
+    returned as a list.
+    """
+    if isinstance(users, QuerySet):
+        return users.prefetch_related(keybase_proofs_prefetch())
+    users = list(users)
+    prefetch_related_objects(users, keybase_proofs_prefetch())
+    return users
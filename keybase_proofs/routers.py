@@ -0,0 +1,105 @@
+"""
+Database router that serves the reads of the proof list, batch and profile
+views from read replicas. Enable it with:
+
+    DATABASE_ROUTERS = ['keybase_proofs.routers.ReplicaRouter']
+    # Aliases of `DATABASES` to read from.
+    KEYBASE_PROOFS_REPLICAS = ['replica1', 'replica2']
+
+Only reads of proofs and users inside `use_replica` blocks are routed, all
+other queries go to the default database. After a user posts a proof their
+reads stay on the primary for `KEYBASE_PROOFS_REPLICA_STICKY_SECONDS`
+(default 10), so they see the new proof despite replication lag. Lists
+that are cached for everyone are loaded from the primary within as long
+after a change.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from keybase_proofs.compat import ContextVar
+from keybase_proofs.users import UserModel
+
+DEFAULT_REPLICA_STICKY_SECONDS = 10
+STICKY_COOKIE_NAME = 'keybase_proofs_primary'
+
+_replica = ContextVar('keybase_proofs_replica')
+
+
+def get_replicas():
+    return list(getattr(settings, 'KEYBASE_PROOFS_REPLICAS', ()))
+
+
+@contextmanager
+def _use_database(alias):
+    previous = _replica.get(None)
+    _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.set(previous)
+
+
+def use_replica():
+    """
+    Routes reads in the block to one randomly chosen replica, if any are
+    configured.
+    """
+    replicas = get_replicas()
+    return _use_database(random.choice(replicas) if replicas else None)
+
+
+def use_primary():
+    """
+    Routes reads in the block to the primary, also inside a `use_replica`
+    block.
+    """
+    return _use_database(None)
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'KEYBASE_PROOFS_REPLICA_STICKY_SECONDS',
+                   DEFAULT_REPLICA_STICKY_SECONDS)
+
+
+def may_lag(written_at):
+    """
+    Whether replicas may not have caught up yet with a write made at the
+    `written_at` timestamp.
+    """
+    return time.time() - written_at < get_sticky_seconds()
+
+
+def is_sticky(request):
+    """
+    Whether `request` comes from a client that wrote recently and must read
+    from the primary.
+    """
+    return STICKY_COOKIE_NAME in request.COOKIES
+
+
+def stick_to_primary(response):
+    """
+    Keeps the client's reads on the primary for a while after a write, by
+    setting a cookie on `response`.
+    """
+    if get_replicas():
+        response.set_cookie(STICKY_COOKIE_NAME, '1', max_age=get_sticky_seconds(), httponly=True)
+    return response
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get(None)
+        # Sessions and other apps' models are always read from the primary.
+        if replica and (model._meta.app_label == 'keybase_proofs' or model is UserModel()):
+            return replica
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,90 @@
+"""
+Scheduling of periodic liveness checks, see `is_proof_live`.
+
+Keybase reports a new proof as valid but not live until it has crawled this
+service's list api. Until then proofs are re-checked with exponential
+backoff, starting at `KEYBASE_PROOFS_LIVENESS_INITIAL_INTERVAL` seconds and
+capped at `KEYBASE_PROOFS_LIVENESS_MAX_INTERVAL`. Live proofs are re-checked
+every `KEYBASE_PROOFS_LIVENESS_LIVE_INTERVAL` seconds to notice revocations,
+revoked proofs are not checked again until they are reposted. Failed checks
+back off like proofs that are not live yet.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+DEFAULT_LIVENESS_INITIAL_INTERVAL = 60
+DEFAULT_LIVENESS_MAX_INTERVAL = 6 * 60 * 60
+DEFAULT_LIVENESS_LIVE_INTERVAL = 24 * 60 * 60
+
+# Intervals are randomly stretched or shrunk by up to this fraction, so that
+# proofs created together don't stay in lockstep.
+JITTER = 0.1
+
+
+def next_check_delay(is_live, check_failures):
+    """
+    Seconds until the next liveness check of a proof.
+    """
+    if is_live:
+        delay = getattr(settings, 'KEYBASE_PROOFS_LIVENESS_LIVE_INTERVAL',
+                        DEFAULT_LIVENESS_LIVE_INTERVAL)
+    else:
+        initial = getattr(settings, 'KEYBASE_PROOFS_LIVENESS_INITIAL_INTERVAL',
+                          DEFAULT_LIVENESS_INITIAL_INTERVAL)
+        maximum = getattr(settings, 'KEYBASE_PROOFS_LIVENESS_MAX_INTERVAL',
+                          DEFAULT_LIVENESS_MAX_INTERVAL)
+        # Cap the exponent as well, the failure count is unbounded.
+        delay = min(initial * 2 ** min(check_failures, 32), maximum)
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def first_check(now=None):
+    """
+    Field values for a proof that was just found valid, which schedule its
+    first liveness check.
+    """
+    now = now or timezone.now()
+    return {
+        'is_live': False,
+        'check_failures': 0,
+        'last_checked_at': now,
+        'next_check_at': now + timedelta(seconds=next_check_delay(False, 0)),
+    }
+
+
+def liveness_update(check_failures, result, now=None):
+    """
+    Field values to store after a liveness check of a proof with
+    `check_failures`. `result` is the `(proof_valid, proof_live)` tuple of
+    `is_proof_live`, or None if the check failed.
+    """
+    now = now or timezone.now()
+    if result is None:
+        failures = check_failures + 1
+        return {
+            'check_failures': failures,
+            'next_check_at': now + timedelta(seconds=next_check_delay(False, failures - 1)),
+        }
+    proof_valid, proof_live = result
+    if not proof_valid:
+        return {
+            'is_verified': False,
+            'is_live': False,
+            'check_failures': 0,
+            'last_checked_at': now,
+            'next_check_at': None,
+        }
+    if proof_live:
+        failures = 0
+    else:
+        failures = check_failures + 1
+    return {
+        'is_verified': True,
+        'is_live': bool(proof_live),
+        'check_failures': failures,
+        'last_checked_at': now,
+        'next_check_at': now + timedelta(seconds=next_check_delay(proof_live, failures - 1)),
+    }
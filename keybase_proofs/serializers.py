@@ -0,0 +1,27 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from keybase_proofs.models import KeybaseProof
+
+
+def dumps(data):
+    """
+    Encodes `data` as compact JSON bytes, using `orjson` when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def proof_rows_to_dicts(rows):
+    """
+    Converts `values_list(*KeybaseProof.LIST_FIELDS)` rows to the list api
+    format of `KeybaseProof.to_dict` without building model instances. Rows
+    of `None`, as produced by an outer join for users without proofs, are
+    skipped.
+    """
+    return [dict(zip(KeybaseProof.LIST_FIELDS, row)) for row in rows if row[0] is not None]
@@ -0,0 +1,89 @@
+from functools import partial
+
+from django.db import transaction
+
+from keybase_proofs.cache import invalidate_user
+from keybase_proofs.cache import invalidate_user_on_all_sites
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.models import KeybaseProofSnapshot
+from keybase_proofs.sites import use_site
+from keybase_proofs.snapshots import refresh_snapshots
+from keybase_proofs.users import username_lookup_key
+
+
+def _invalidate(using, func, *args):
+    # Again once the transaction commits, or a concurrent request could
+    # cache the data from before the change until then. Also right away for
+    # reads in the same transaction, and because `on_commit` callbacks never
+    # run in `TestCase`s before Django 3.2.
+    func(*args)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(partial(func, *args), using=using)
+
+
+def _invalidate_user_on_site(site_id, username, user_id):
+    with use_site(site_id):
+        invalidate_user(username, user_id)
+
+
+def refresh_proof_snapshot(sender, instance, **kwargs):
+    """
+    Connected to `post_save` and `post_delete` of `KeybaseProof` ahead of
+    `invalidate_proof_caches`, so the cache is refilled from the new
+    snapshot.
+    """
+    refresh_snapshots([instance.user_id])
+
+
+def delete_user_snapshot(sender, instance, **kwargs):
+    """
+    Connected to `post_delete` of the user model.
+    """
+    KeybaseProofSnapshot.objects.filter(user=instance.pk).delete()
+
+
+def invalidate_proof_caches(sender, instance, using=None, **kwargs):
+    """
+    Connected to `post_save` and `post_delete` of `KeybaseProof`.
+    """
+    _invalidate(using, _invalidate_user_on_site, instance.site_id, instance.user.username, instance.user_id)
+
+
+def invalidate_user_caches(sender, instance, using=None, **kwargs):
+    """
+    Connected to `post_delete` of the user model, so deleted users without
+    proofs stop being served from the cache.
+    """
+    _invalidate(using, invalidate_user_on_all_sites, instance.username, instance.pk)
+
+
+def remember_username(sender, instance, raw=False, update_fields=None, using=None, **kwargs):
+    """
+    Connected to `pre_save` of the user model, notes the stored username so
+    that `sync_user_lookup_key` can invalidate it after a rename.
+    """
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    instance._keybase_proofs_username = sender._default_manager.using(using).filter(
+        pk=instance.pk).values_list('username', flat=True).first()
+
+
+def sync_user_lookup_key(sender, instance, created=False, update_fields=None, using=None, **kwargs):
+    """
+    Connected to `post_save` of the user model, keeps
+    `KeybaseProof.user_lookup_key` in sync when a username changes and
+    invalidates the cached data of the old and new username.
+    """
+    old_username = instance.__dict__.pop('_keybase_proofs_username', None)
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    key = username_lookup_key(instance.username)
+    updated = KeybaseProof.objects.filter(user=instance).exclude(user_lookup_key=key).update(user_lookup_key=key)
+    renamed = old_username is not None and old_username != instance.username
+    if updated or renamed:
+        # Snapshots are keyed by and rendered fragments contain the username.
+        refresh_snapshots([instance.pk])
+        _invalidate(using, invalidate_user_on_all_sites, instance.username, instance.pk)
+    if renamed:
+        # The old username would keep serving the proofs from the cache.
+        _invalidate(using, invalidate_user_on_all_sites, old_username)
@@ -0,0 +1,169 @@
+"""
+Scoping of proofs to the sites of `django.contrib.sites`, for serving
+several branded domains from one deployment. Enable it with:
+
+    # Overrides of `KEYBASE_PROOFS_*` settings per `Site.domain`, without
+    # the prefix. Sites that aren't listed use the global settings.
+    KEYBASE_PROOFS_SITES = {
+        'brand-a.com': {'CACHE': 'brand_a', 'HTTP_POOL_SIZE': 20},
+        'brand-b.com': {'DOMAIN': 'keybase.brand-b.com'},
+    }
+
+`django.contrib.sites` must then be installed, it isn't needed otherwise.
+The views resolve the current site from the request with
+`django.contrib.sites.shortcuts.get_current_site`, other code scopes itself
+to a site with `use_site`. Proofs posted on a site are stored with its pk
+and only listed on it. Each site gets its own resolved config, pooled Keybase
+client (see `keybase_proofs.client.get_keybase_client`) and cache namespace
+(see `keybase_proofs.cache`). A site's Keybase domain is its `Site.domain`
+unless overridden with `DOMAIN`.
+
+Without the setting nothing is scoped and the global settings are used.
+"""
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+
+from keybase_proofs.compat import ContextVar
+
+# `KeybaseProof.site_id` of the proofs without a site.
+NO_SITE = 0
+
+_config = ContextVar('keybase_proofs_site_config')
+# Resolved `SiteConfig`s by site pk, `NO_SITE` for the global config.
+_configs = {}
+
+
+def is_enabled():
+    return getattr(settings, 'KEYBASE_PROOFS_SITES', None) is not None
+
+
+class SiteConfig(object):
+    """
+    The `KEYBASE_PROOFS_*` settings of one site, its overrides from
+    `KEYBASE_PROOFS_SITES` falling back to the global settings. The global
+    config has no `site`.
+    """
+
+    def __init__(self, site=None):
+        self.site = site
+        self.overrides = {}
+        if site is not None:
+            self.overrides = dict((getattr(settings, 'KEYBASE_PROOFS_SITES', None) or {}).get(site.domain, {}))
+
+    @property
+    def site_id(self):
+        return self.site.pk if self.site is not None else NO_SITE
+
+    def get(self, name, default=None):
+        if name in self.overrides:
+            return self.overrides[name]
+        return getattr(settings, 'KEYBASE_PROOFS_' + name, default)
+
+    @property
+    def domain(self):
+        if self.site is None or 'DOMAIN' in self.overrides:
+            return self.get('DOMAIN')
+        return self.site.domain
+
+
+def get_site_config(site=None):
+    """
+    Returns the `SiteConfig` of `site`, a `Site` or its pk, resolved once per
+    process. None, `NO_SITE` and sites without scoping get the global config.
+    """
+    if not site or not is_enabled():
+        site, site_id = None, NO_SITE
+    else:
+        site_id = getattr(site, 'pk', site)
+    config = _configs.get(site_id)
+    if config is None:
+        if site_id != NO_SITE and getattr(site, 'pk', None) is None:
+            from django.contrib.sites.models import Site
+            site = Site.objects.get(pk=site_id)
+        config = _configs[site_id] = SiteConfig(site)
+    return config
+
+
+def _clear_configs(setting, **kwargs):
+    if setting.startswith('KEYBASE_PROOFS_'):
+        _configs.clear()
+
+
+setting_changed.connect(_clear_configs)
+
+
+def get_current_config():
+    """
+    The config of the current site, see `use_site`.
+    """
+    config = _config.get(None)
+    if config is None:
+        return get_site_config()
+    return config
+
+
+def get_current_site_id():
+    return get_current_config().site_id
+
+
+def get_request_site(request):
+    """
+    The site `request` is made to, None without scoping.
+    """
+    if not is_enabled():
+        return None
+    if not apps.is_installed('django.contrib.sites'):
+        raise ImproperlyConfigured('KEYBASE_PROOFS_SITES requires django.contrib.sites in INSTALLED_APPS.')
+    from django.contrib.sites.shortcuts import get_current_site
+    return get_current_site(request)
+
+
+@contextmanager
+def use_site(site):
+    """
+    Scopes the block to `site`, a `Site` or its pk. None or `NO_SITE` scopes
+    it to the proofs without a site.
+    """
+    previous = _config.get(None)
+    _config.set(get_site_config(site))
+    try:
+        yield
+    finally:
+        _config.set(previous)
+
+
+def get_site_id(domain):
+    """
+    The pk of the site with `domain`, for management commands. Raises
+    `CommandError` if there is none.
+    """
+    from django.contrib.sites.models import Site
+    from django.core.management.base import CommandError
+    try:
+        return Site.objects.get(domain=domain).pk
+    except Site.DoesNotExist:
+        raise CommandError('No site with domain {}'.format(domain))
+
+
+def get_sites():
+    """
+    All sites when scoping is enabled, for work that spans them.
+    """
+    if not is_enabled():
+        return []
+    from django.contrib.sites.models import Site
+    return list(Site.objects.all())
+
+
+class CurrentSiteMixin(object):
+    """
+    Scopes the view to the site of the request.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_site(get_request_site(request)):
+            return super(CurrentSiteMixin, self).dispatch(request, *args, **kwargs)
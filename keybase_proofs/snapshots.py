@@ -0,0 +1,97 @@
+"""
+Materialized list api responses, enabled with the optional
+`KEYBASE_PROOFS_LIST_SNAPSHOTS` setting (default False).
+
+Each user with proofs gets a `KeybaseProofSnapshot` row, keyed by username,
+with the encoded `keybase_sigs` of their verified proofs. A list api request
+that misses the cache reads it with a single indexed lookup of the
+`username_lookup_key` and serves its content without serializing. Unlike the cache, snapshots survive cache
+flushes and restarts.
+
+Snapshots are refreshed whenever proofs are saved or deleted, in the same
+transaction as the change when one is open, and by the bulk writers in
+`keybase_proofs.bulk`.
+`manage.py rebuild_keybase_proof_snapshots` rebuilds all of them, e.g. after
+enabling the setting.
+"""
+import calendar
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from keybase_proofs import sites
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.models import KeybaseProofSnapshot
+from keybase_proofs.serializers import dumps
+from keybase_proofs.serializers import proof_rows_to_dicts
+from keybase_proofs.users import UserModel
+from keybase_proofs.users import is_case_insensitive
+from keybase_proofs.users import username_lookup_key
+
+
+def is_enabled():
+    # Snapshots hold the proofs of all sites, they aren't used when proofs
+    # are scoped to sites (see `keybase_proofs.sites`).
+    return getattr(settings, 'KEYBASE_PROOFS_LIST_SNAPSHOTS', False) and not sites.is_enabled()
+
+
+def get_snapshot(username):
+    """
+    Returns the encoded content of the snapshot for `username` and the
+    timestamp it was last updated at, or None if there is none. Usernames
+    without an exact match are resolved case-insensitively like
+    `KeybaseProofListView.get_keybase_sigs`.
+    """
+    rows = KeybaseProofSnapshot.objects.filter(lookup_key=username_lookup_key(username)).values_list(
+        'username', 'content', 'updated_at')
+    snapshots = dict((row[0], row[1:]) for row in rows)
+    if username in snapshots:
+        content, updated_at = snapshots[username]
+    elif is_case_insensitive() and len(snapshots) == 1:
+        content, updated_at = list(snapshots.values())[0]
+    else:
+        # None, or several users differing only in case are ambiguous.
+        return None
+    if timezone.is_aware(updated_at):
+        timestamp = calendar.timegm(updated_at.utctimetuple())
+    else:
+        timestamp = time.mktime(updated_at.timetuple())
+    return content.encode('utf-8'), int(timestamp)
+
+
+def refresh_snapshots(user_ids):
+    """
+    Rewrites the snapshots of the users with pks `user_ids` from their
+    current proofs, with a constant number of queries, and returns the
+    usernames of the users by pk. Does nothing unless snapshots are enabled.
+    """
+    user_ids = set(user_ids)
+    if not user_ids or not is_enabled():
+        return {}
+    with transaction.atomic():
+        # Locking the users serializes concurrent refreshes of a snapshot.
+        usernames = dict(UserModel().objects.select_for_update().filter(
+            pk__in=user_ids).values_list('pk', 'username'))
+        rows = {user_id: [] for user_id in usernames}
+        proofs = KeybaseProof.objects.verified().filter(user__in=list(usernames)).values_list(
+            'user', *KeybaseProof.LIST_FIELDS)
+        for row in proofs:
+            rows[row[0]].append(row[1:])
+        now = timezone.now()
+        # Replacing the rows also moves snapshots of renamed users.
+        KeybaseProofSnapshot.objects.filter(
+            Q(user__in=list(usernames)) | Q(username__in=list(usernames.values()))).delete()
+        KeybaseProofSnapshot.objects.bulk_create([
+            KeybaseProofSnapshot(
+                username=username,
+                lookup_key=username_lookup_key(username),
+                user_id=user_id,
+                content=dumps({'keybase_sigs': proof_rows_to_dicts(rows[user_id])}).decode('utf-8'),
+                updated_at=now,
+            )
+            for user_id, username in usernames.items()
+        ])
+    return usernames
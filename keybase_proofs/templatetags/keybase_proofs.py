@@ -0,0 +1,50 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from keybase_proofs.cache import get_proof_fragment
+from keybase_proofs.cache import set_proof_fragment
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.prefetch import PREFETCH_ATTR
+from keybase_proofs.sites import get_request_site
+from keybase_proofs.sites import use_site
+from keybase_proofs.views import get_domain
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def keybase_proofs(context, user):
+    """
+    Renders the verified proofs of `user` with `keybase_proofs/_proofs.html`,
+    for embedding into existing profile pages:
+
+        {% load keybase_proofs %}
+        {% keybase_proofs profile_user %}
+
+    The rendered fragment is cached until one of the user's proofs is saved
+    or deleted, so cached renders don't query the database, nor do renders
+    of users with proofs from `keybase_proofs.prefetch`. When proofs are
+    scoped to sites, those of the site of the context's `request` are shown
+    (see `keybase_proofs.sites`).
+    """
+    request = context.get('request')
+    if request is None:
+        return _render_proofs(user)
+    with use_site(get_request_site(request)):
+        return _render_proofs(user)
+
+
+def _render_proofs(user):
+    key, html = get_proof_fragment(user.pk)
+    if html is None:
+        proofs = getattr(user, PREFETCH_ATTR, None)
+        if proofs is None:
+            proofs = KeybaseProof.objects.verified_for(user).values(*KeybaseProof.LIST_FIELDS)
+        html = render_to_string('keybase_proofs/_proofs.html', {
+            'proofs': proofs,
+            'username': user.username,
+            'domain': get_domain(),
+        })
+        set_proof_fragment(key, html)
+    return mark_safe(html)
@@ -0,0 +1,67 @@
+from django.contrib.admin import helpers
+from django.test import TestCase
+from django.urls import reverse
+
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_live
+
+try:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+
+
+class TestKeybaseProofAdmin(TestCase):
+
+    def setUp(self):
+        is_proof_live.cache_clear()
+        self.admin = UserModel().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.admin)
+        self.changelist_url = reverse('admin:keybase_proofs_keybaseproof_changelist')
+
+    def create_proofs(self, count):
+        for i in range(count):
+            user = UserModel().objects.create_user('user{}_{}'.format(KeybaseProof.objects.count(), i))
+            KeybaseProof.objects.create(user=user, kb_username='kb_{}'.format(user.username),
+                                        sig_hash='abc123', is_verified=True)
+
+    def test_changelist_queries(self):
+        # session, user, page count and a single joined page query, no
+        # matter how many rows are rendered.
+        self.create_proofs(2)
+        with self.assertNumQueries(4):
+            self.client.get(self.changelist_url)
+        self.create_proofs(10)
+        with self.assertNumQueries(4):
+            resp = self.client.get(self.changelist_url)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_search(self):
+        self.create_proofs(3)
+        proof = KeybaseProof.objects.first()
+        resp = self.client.get(self.changelist_url, {'q': proof.kb_username})
+        self.assertEqual(list(resp.context['cl'].result_list), [proof])
+        resp = self.client.get(self.changelist_url, {'q': proof.user.username})
+        self.assertEqual(list(resp.context['cl'].result_list), [proof])
+        resp = self.client.get(self.changelist_url, {'q': proof.kb_username[:-1]})
+        self.assertEqual(list(resp.context['cl'].result_list), [])
+        proof.sig_hash = 'def456'
+        proof.save()
+        resp = self.client.get(self.changelist_url, {'q': 'DEF456'})
+        self.assertEqual(list(resp.context['cl'].result_list), [proof])
+
+    @patch('requests.Session.get')
+    def test_recheck_liveness_action(self, mock_requests):
+        mock_requests.return_value = MagicMock(status_code=200,
+                                               json=lambda: {'proof_valid': False, 'proof_live': False})
+        self.create_proofs(3)
+        resp = self.client.post(self.changelist_url, {
+            'action': 'recheck_liveness',
+            helpers.ACTION_CHECKBOX_NAME: list(KeybaseProof.objects.values_list('pk', flat=True)[:2]),
+        }, follow=True)
+        self.assertContains(resp, 'Re-checked 2 proofs, 2 changed, 0 failed.')
+        self.assertEqual(mock_requests.call_count, 2)
+        self.assertEqual(KeybaseProof.objects.filter(is_verified=True).count(), 1)
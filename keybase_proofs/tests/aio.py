@@ -0,0 +1,231 @@
+import asyncio
+import json
+from unittest import skipIf
+
+import django
+from django.conf import settings
+from django.http import Http404
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import deadline
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.cache import get_cache
+from keybase_proofs.instrumentation import view_timing
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+
+try:
+    from unittest.mock import ANY
+    from unittest.mock import AsyncMock
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+    from urllib.parse import urlencode
+
+    import httpx
+    from asgiref.sync import async_to_sync
+
+    from keybase_proofs import aio
+    from keybase_proofs.compat import re_path
+except (ImportError, SyntaxError):
+    aio = None
+
+requires_aio = skipIf(aio is None, 'requires Python 3.8+ and httpx')
+
+if aio is not None:
+    # Routes the async views for requests through Django's ASGI handler.
+    urlpatterns = [
+        re_path(r'^api/(?P<username>.+)?', aio.AsyncKeybaseProofListView.as_view(), name='list-proofs-api'),
+        re_path(r'^new-proof/?', aio.AsyncKeybaseProofView.as_view(), name='new-proof'),
+    ]
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def asgi_get(path):
+    """
+    GETs `path` through Django's ASGI handler.
+    """
+    from django.test import AsyncClient
+
+    async def get():
+        return await AsyncClient().get(path)
+    # `async_to_sync` keeps thread sensitive DB calls on the test's connection.
+    return async_to_sync(get)()
+
+
+@requires_aio
+class TestAsyncHelpers(TestCase):
+
+    def tearDown(self):
+        keybase_breaker.reset()
+
+    def test_is_proof_valid(self):
+        with patch.object(httpx.AsyncClient, 'get', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+            self.assertTrue(run(aio.is_proof_valid('bob', 'abc123', 'kb_bob')))
+            mock_get.assert_awaited_once_with(aio.PROOF_VALID_ENDPOINT, params={
+                'domain': settings.KEYBASE_PROOFS_DOMAIN,
+                'username': 'bob',
+                'kb_username': 'kb_bob',
+                'sig_hash': 'abc123',
+            }, timeout=ANY)
+
+            mock_get.return_value = MagicMock(status_code=500)
+            self.assertFalse(run(aio.is_proof_valid('bob', 'abc123', 'kb_bob')))
+
+            mock_get.side_effect = httpx.ConnectTimeout('timed out')
+            self.assertFalse(run(aio.is_proof_valid('bob', 'abc123', 'kb_bob')))
+
+            # Timeouts cut short by the deadline aren't breaker failures.
+            failures = keybase_breaker.failures
+            with deadline(1):
+                with self.assertRaises(DeadlineExceeded):
+                    run(aio.is_proof_valid('bob', 'abc123', 'kb_bob'))
+            self.assertEqual(keybase_breaker.failures, failures)
+
+    def test_is_proof_live(self):
+        user = UserModel()(username='bob')
+        with patch.object(httpx.AsyncClient, 'get', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = MagicMock(status_code=200,
+                                              json=lambda: {'proof_valid': True, 'proof_live': False})
+            self.assertEqual(run(aio.is_proof_live(user, 'abc123', 'kb_bob')), (True, False))
+
+            mock_get.return_value = MagicMock(status_code=400)
+            self.assertEqual(run(aio.is_proof_live(user, 'abc123', 'kb_bob')), (False, False))
+
+    @override_settings(KEYBASE_PROOFS_HTTP_CONNECT_TIMEOUT=1,
+                       KEYBASE_PROOFS_HTTP_READ_TIMEOUT=2)
+    def test_client_per_loop(self):
+        client = aio.AsyncKeybaseClient()
+
+        async def get_client():
+            return client._get_client()
+
+        loop = asyncio.new_event_loop()
+        c1 = loop.run_until_complete(get_client())
+        self.assertIs(c1, loop.run_until_complete(get_client()))
+        self.assertEqual(c1.timeout.connect, 1)
+        self.assertEqual(c1.timeout.read, 2)
+        self.assertIsNot(c1, run(get_client()))
+
+
+@requires_aio
+@skipIf(django.VERSION < (3, 1), 'async views require Django 3.1+')
+class TestAsyncKeybaseProofView(TestCase):
+
+    def setUp(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.test import AsyncRequestFactory
+        self.factory = AsyncRequestFactory()
+        self.session_store = SessionStore
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+
+    def request(self, data, user=None):
+        from django.contrib.auth.models import AnonymousUser
+        request = self.factory.post(reverse('keybase_proofs:new-proof'), data=urlencode(data),
+                                    content_type='application/x-www-form-urlencoded')
+        request.user = user or AnonymousUser()
+        request.session = self.session_store()
+        # `async_to_sync` keeps thread sensitive DB calls on the test's connection.
+        return async_to_sync(aio.AsyncKeybaseProofView.as_view())(request)
+
+    def test_post(self):
+        data = {
+            'username': 'bob',
+            'kb_username': 'kb_bob',
+            'sig_hash': 'abc123',
+            'kb_ua': 'ua',
+        }
+        resp = self.request(data)
+        self.assertEqual(resp.status_code, 302)
+
+        with patch.object(httpx.AsyncClient, 'get', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': False})
+            resp = self.request(data, user=self.user)
+            self.assertEqual(resp.status_code, 400)
+            self.assertFalse(KeybaseProof.objects.exists())
+
+            mock_get.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+            resp = self.request(data, user=self.user)
+            self.assertEqual(resp.status_code, 301)
+            self.assertTrue(KeybaseProof.objects.filter(
+                user=self.user, kb_username='kb_bob', sig_hash='abc123', is_verified=True).exists())
+
+    @override_settings(KEYBASE_PROOFS_SERVER_TIMING=True)
+    def test_instrumented(self):
+        events = []
+
+        def receiver(signal, sender, **kwargs):
+            events.append(kwargs)
+        view_timing.connect(receiver)
+        self.addCleanup(view_timing.disconnect, receiver)
+        data = {'username': 'bob', 'kb_username': 'kb_bob', 'sig_hash': 'abc123'}
+        with patch.object(httpx.AsyncClient, 'get', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+            resp = self.request(data, user=self.user)
+        self.assertEqual(resp.status_code, 301)
+        self.assertIn('keybase;dur=', resp['Server-Timing'])
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertEqual([(e['view'], e['status']) for e in events], [('AsyncKeybaseProofView', 301)])
+        self.assertGreater(events[0]['db_queries'], 0)
+
+    @override_settings(ROOT_URLCONF='keybase_proofs.tests.aio')
+    def test_asgi(self):
+        resp = asgi_get('/new-proof/')
+        self.assertEqual(resp.status_code, 302)
+
+
+@requires_aio
+@skipIf(django.VERSION < (3, 1), 'async views require Django 3.1+')
+class TestAsyncKeybaseProofListView(TestCase):
+
+    def setUp(self):
+        from django.test import AsyncRequestFactory
+        self.factory = AsyncRequestFactory()
+        get_cache().clear()
+
+    def request_concurrently(self, count):
+        view = aio.AsyncKeybaseProofListView.as_view()
+
+        async def requests():
+            return await asyncio.gather(*[
+                view(self.factory.get('/'), username='bob') for _ in range(count)])
+        return async_to_sync(requests)()
+
+    def test_coalesced(self):
+        sigs = [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]
+        coalesced = aio.async_proof_list_flight.coalesced
+        with patch.object(aio.AsyncKeybaseProofListView, 'get_keybase_sigs',
+                          return_value=sigs) as mock_sigs:
+            responses = self.request_concurrently(3)
+        mock_sigs.assert_called_once_with('bob')
+        self.assertEqual(aio.async_proof_list_flight.coalesced, coalesced + 2)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content.decode('utf-8')), {'keybase_sigs': sigs})
+
+        # Later requests are served from the cache.
+        with patch.object(aio.AsyncKeybaseProofListView, 'get_keybase_sigs') as mock_sigs:
+            responses = self.request_concurrently(2)
+        mock_sigs.assert_not_called()
+        self.assertEqual(responses[0].content, responses[1].content)
+
+    @override_settings(ROOT_URLCONF='keybase_proofs.tests.aio')
+    def test_asgi(self):
+        user = UserModel().objects.create_user('bob')
+        KeybaseProof.objects.create(user=user, kb_username='kb_bob', sig_hash='abc123', is_verified=True)
+        resp = asgi_get('/api/bob')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]})
+
+    def test_not_found(self):
+        with patch.object(aio.AsyncKeybaseProofListView, 'get_keybase_sigs',
+                          side_effect=Http404) as mock_sigs:
+            responses = self.request_concurrently(2)
+        mock_sigs.assert_called_once_with('bob')
+        self.assertEqual([r.status_code for r in responses], [404, 404])
@@ -0,0 +1,194 @@
+"""
+Throughput and latency benchmarks against a large seeded dataset, with
+Keybase replaced by an in-process stub so everything runs offline.
+
+Skipped unless the `KEYBASE_PROOFS_BENCHMARK` environment variable is set:
+
+    KEYBASE_PROOFS_BENCHMARK=1 pytest -s keybase_proofs/tests/benchmarks.py
+
+The dataset size and load can be tuned with `KEYBASE_PROOFS_BENCHMARK_USERS`
+(default 100000), `KEYBASE_PROOFS_BENCHMARK_PROOFS` (default 1000000),
+`KEYBASE_PROOFS_BENCHMARK_REQUESTS` (requests per view, default 1000),
+`KEYBASE_PROOFS_BENCHMARK_RECHECK` (proofs re-checked, default 10000) and
+`KEYBASE_PROOFS_BENCHMARK_LATENCY` (seconds per stubbed Keybase call,
+default 0). Point `DATABASES` at Postgres to benchmark against it instead of
+SQLite.
+"""
+import os
+import random
+import sys
+import time
+import unittest
+
+from django.test import TestCase
+from django.urls import reverse
+
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.bulk import VerifiedFlagWriter
+from keybase_proofs.bulk import check_proofs_live
+from keybase_proofs.cache import get_cache
+from keybase_proofs.compat import monotonic
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_live
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+BENCHMARK = os.environ.get('KEYBASE_PROOFS_BENCHMARK')
+USERS = int(os.environ.get('KEYBASE_PROOFS_BENCHMARK_USERS', 100000))
+PROOFS = int(os.environ.get('KEYBASE_PROOFS_BENCHMARK_PROOFS', 1000000))
+REQUESTS = int(os.environ.get('KEYBASE_PROOFS_BENCHMARK_REQUESTS', 1000))
+RECHECK = int(os.environ.get('KEYBASE_PROOFS_BENCHMARK_RECHECK', 10000))
+LATENCY = float(os.environ.get('KEYBASE_PROOFS_BENCHMARK_LATENCY', 0))
+
+BATCH_SIZE = 5000
+
+
+class StubResponse(object):
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def stub_keybase(url, params=None, timeout=None):
+    # Signature hashes are hex encoded counters, every tenth proof has been
+    # revoked on Keybase.
+    if LATENCY:
+        time.sleep(LATENCY)
+    proof_valid = int(params['sig_hash'], 16) % 10 != 3
+    return StubResponse({'proof_valid': proof_valid, 'proof_live': proof_valid})
+
+
+def percentile(latencies, p):
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+
+def report(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    sys.stdout.write(
+        '\n{}: {} in {:.2f}s, {:.0f}/s, p50 {:.2f}ms, p95 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms\n'.format(
+            name, len(latencies), elapsed, len(latencies) / max(elapsed, 1e-6),
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+            percentile(latencies, 0.99) * 1000, latencies[-1] * 1000))
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@unittest.skipUnless(BENCHMARK, 'set KEYBASE_PROOFS_BENCHMARK=1 to run the benchmarks')
+@patch('requests.Session.get', side_effect=stub_keybase)
+class TestBenchmarks(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = UserModel()
+        start = monotonic()
+        for batch in batched(range(USERS), BATCH_SIZE):
+            # An unusable password, hashing would dominate the seeding time.
+            User.objects.bulk_create([User(username='user{}'.format(i), password='!')
+                                      for i in batch])
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        proofs = (KeybaseProof(user_id=user_ids[i % USERS],
+                               kb_username='kb_{}'.format(i // USERS),
+                               user_lookup_key='user{}'.format(i % USERS),
+                               sig_hash='{:064x}'.format(i),
+                               is_verified=i % 10 != 0)
+                  for i in range(PROOFS))
+        for batch in batched(proofs, BATCH_SIZE):
+            KeybaseProof.objects.bulk_create(batch)
+        sys.stdout.write('\nseeded {} users and {} proofs in {:.1f}s\n'.format(
+            USERS, PROOFS, monotonic() - start))
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        is_proof_live.cache_clear()
+        keybase_breaker.reset()
+        self.random = random.Random(0)
+
+    def random_username(self):
+        return 'user{}'.format(self.random.randrange(USERS))
+
+    def run_requests(self, name, request):
+        latencies = []
+        start = monotonic()
+        for i in range(REQUESTS):
+            request_start = monotonic()
+            request(i)
+            latencies.append(monotonic() - request_start)
+        report(name, latencies, monotonic() - start)
+
+    def test_list_view(self, mock_requests):
+        def url(username):
+            return reverse('keybase_proofs:list-proofs-api', kwargs={'username': username})
+
+        # The query budget holds at scale.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url(self.random_username())).status_code, 200)
+
+        self.run_requests('list view (cold cache)',
+                          lambda i: self.client.get(url(self.random_username())))
+        hot = url(self.random_username())
+        self.run_requests('list view (warm cache)', lambda i: self.client.get(hot))
+        etag = self.client.get(hot)['ETag']
+        self.run_requests('list view (conditional)',
+                          lambda i: self.client.get(hot, HTTP_IF_NONE_MATCH=etag))
+
+    def test_profile_view(self, mock_requests):
+        def url(username):
+            return reverse('keybase_proofs:profile', kwargs={'username': username})
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url(self.random_username())).status_code, 200)
+        self.run_requests('profile view', lambda i: self.client.get(url(self.random_username())))
+
+    def test_new_proof_view(self, mock_requests):
+        user = UserModel().objects.get(username=self.random_username())
+        self.client.force_login(user)
+        url = reverse('keybase_proofs:new-proof')
+
+        def post(i, kb_username):
+            resp = self.client.post(url, data={
+                'username': user.username,
+                'kb_username': kb_username,
+                'sig_hash': '{:064x}'.format(i * 10 + 1),
+            })
+            self.assertEqual(resp.status_code, 301)
+
+        self.run_requests('new proof view (insert)',
+                          lambda i: post(i, 'kb_new_{}'.format(i)))
+        is_proof_valid.cache_clear()
+        self.run_requests('new proof view (update)',
+                          lambda i: post(i, 'kb_new_{}'.format(i)))
+
+    def test_recheck(self, mock_requests):
+        # The same path as the `recheck_keybase_proofs` command.
+        queryset = KeybaseProof.objects.select_related('user').only(
+            'id', 'site_id', 'kb_username', 'sig_hash', 'is_verified', 'user__username')[:RECHECK]
+        writer = VerifiedFlagWriter()
+        latencies = []
+        start = last = monotonic()
+        for proof, proof_valid, _ in check_proofs_live(queryset.iterator(), workers=8):
+            writer.add(proof, proof_valid)
+            now = monotonic()
+            latencies.append(now - last)
+            last = now
+        writer.flush()
+        report('recheck ({} changed)'.format(writer.changed), latencies, monotonic() - start)
+        self.assertEqual(mock_requests.call_count, min(RECHECK, PROOFS))
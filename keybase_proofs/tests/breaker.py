@@ -0,0 +1,156 @@
+import requests
+
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.breaker import CLOSED
+from keybase_proofs.breaker import HALF_OPEN
+from keybase_proofs.breaker import OPEN
+from keybase_proofs.breaker import CircuitBreaker
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.breaker import deadline
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.client import keybase_client
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+
+
+@override_settings(KEYBASE_PROOFS_BREAKER_FAILURE_THRESHOLD=2,
+                   KEYBASE_PROOFS_BREAKER_RESET_TIMEOUT=30,
+                   KEYBASE_PROOFS_BREAKER_SLOW_CALL_THRESHOLD=5)
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        keybase_breaker.reset()
+        is_proof_valid.cache_clear()
+
+    def tearDown(self):
+        keybase_breaker.reset()
+
+    @patch('keybase_proofs.breaker.monotonic')
+    def test_state_transitions(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        breaker = CircuitBreaker()
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        # Slow calls count as failures.
+        breaker.record_success(elapsed=10)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(KeybaseUnavailable) as ctx:
+            breaker.allow()
+        self.assertEqual(ctx.exception.retry_after, 30)
+        self.assertEqual(breaker.stats(), {'state': OPEN, 'consecutive_failures': 2, 'retry_after': 30})
+
+        # After the reset timeout a single probe is let through.
+        mock_monotonic.return_value = 130
+        breaker.allow()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(KeybaseUnavailable):
+            breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        mock_monotonic.return_value = 160
+        breaker.allow()
+        breaker.record_success(elapsed=1)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.allow()
+
+    @patch('requests.Session.get')
+    def test_view_fails_fast_when_open(self, mock_requests):
+        mock_requests.side_effect = requests.ConnectionError()
+        UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        self.client.login(username='bob', password='bobo')
+        data = {'username': 'bob', 'kb_username': 'kb_bob', 'sig_hash': 'abc123'}
+
+        for _ in range(2):
+            is_proof_valid.cache_clear()
+            resp = self.client.post(reverse('keybase_proofs:new-proof'), data=data)
+            self.assertEqual(resp.status_code, 400)
+        self.assertEqual(keybase_breaker.state, OPEN)
+
+        mock_requests.reset_mock()
+        is_proof_valid.cache_clear()
+        resp = self.client.post(reverse('keybase_proofs:new-proof'), data=data)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], '30')
+        self.assertContains(resp, 'try again shortly', status_code=503)
+        mock_requests.assert_not_called()
+
+    @patch('requests.Session.get')
+    def test_deadline(self, mock_requests):
+        mock_requests.return_value = MagicMock(status_code=200)
+        connect_timeout, read_timeout = keybase_client.timeout
+        with deadline(2):
+            keybase_client.get('https://keybase.io/')
+            self.assertLessEqual(max(mock_requests.call_args[1]['timeout']), 2)
+
+            # Nested deadlines can't extend the budget.
+            with deadline(60):
+                keybase_client.get('https://keybase.io/')
+                self.assertLessEqual(mock_requests.call_args[1]['timeout'][1], 2)
+
+            with deadline(0):
+                with self.assertRaises(DeadlineExceeded):
+                    keybase_client.get('https://keybase.io/')
+
+        keybase_client.get('https://keybase.io/')
+        self.assertEqual(mock_requests.call_args[1]['timeout'], (connect_timeout, read_timeout))
+        self.assertEqual(keybase_breaker.state, CLOSED)
+
+    @patch('requests.Session.get')
+    def test_deadline_timeout(self, mock_requests):
+        mock_requests.side_effect = requests.Timeout('timed out')
+        # Timeouts cut short by the deadline don't trip the breaker.
+        for i in range(2):
+            with deadline(1):
+                with self.assertRaises(DeadlineExceeded):
+                    keybase_client.get('https://keybase.io/')
+        self.assertEqual(keybase_breaker.state, CLOSED)
+
+        for i in range(2):
+            with self.assertRaises(requests.Timeout):
+                keybase_client.get('https://keybase.io/')
+        self.assertEqual(keybase_breaker.state, OPEN)
+
+    @patch('requests.Session.get', side_effect=requests.Timeout('timed out'))
+    def test_deadline_timeout_slow(self, mock_requests):
+        # Clamped calls that took the slow call threshold still count.
+        with self.settings(KEYBASE_PROOFS_BREAKER_SLOW_CALL_THRESHOLD=0):
+            for i in range(2):
+                with deadline(1):
+                    with self.assertRaises(DeadlineExceeded):
+                        keybase_client.get('https://keybase.io/')
+        self.assertEqual(keybase_breaker.state, OPEN)
+
+    @patch('keybase_proofs.breaker.monotonic')
+    @patch('requests.Session.get')
+    def test_deadline_timeout_probe(self, mock_requests, mock_monotonic):
+        mock_monotonic.return_value = 0
+        keybase_breaker.record_failure()
+        keybase_breaker.record_failure()
+        self.assertEqual(keybase_breaker.state, OPEN)
+        mock_monotonic.return_value = 30
+
+        # A probe cut short by the deadline leaves the breaker half open for
+        # the next probe.
+        mock_requests.side_effect = requests.Timeout('timed out')
+        with deadline(1):
+            with self.assertRaises(DeadlineExceeded):
+                keybase_client.get('https://keybase.io/')
+        self.assertEqual(keybase_breaker.state, HALF_OPEN)
+
+        mock_requests.side_effect = None
+        mock_requests.return_value = MagicMock(status_code=200)
+        keybase_client.get('https://keybase.io/')
+        self.assertEqual(keybase_breaker.state, CLOSED)
@@ -0,0 +1,170 @@
+import json
+
+from django.db import transaction
+from django.template import Context
+from django.template import Template
+from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.cache import get_proof_list
+from keybase_proofs.cache import set_proof_list
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.serializers import dumps
+from keybase_proofs.users import UserModel
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestListCache(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        self.proof = KeybaseProof.objects.create(
+            user=self.user, kb_username='kb_bob', sig_hash='abc123', is_verified=True)
+        self.url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+
+    def test_cached_list(self):
+        # A miss resolves the user and serializes their proofs in one query.
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        etag = resp['ETag']
+        last_modified = resp['Last-Modified']
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]})
+        self.assertEqual(resp['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 304)
+
+        # Saving a proof invalidates the user's cached list.
+        self.proof.sig_hash = 'def456'
+        self.proof.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'def456'}]})
+
+        self.proof.delete()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.json(), {'keybase_sigs': []})
+
+        self.user.delete()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_username_case(self):
+        UserModel().objects.create_user('BOB')
+
+        def get_list(username):
+            url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': username})
+            return self.client.get(url).json()['keybase_sigs']
+
+        bob = [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]
+        self.assertEqual(get_list('bob'), bob)
+        # Another user's spelling doesn't get bob's cached list.
+        self.assertEqual(get_list('BOB'), [])
+        self.assertEqual(get_list('Bob'), bob)
+
+        # Saving a proof invalidates all spellings resolved to the user.
+        self.proof.sig_hash = 'def456'
+        self.proof.save()
+        self.assertEqual(get_list('Bob'), [{'kb_username': 'kb_bob', 'sig_hash': 'def456'}])
+        self.assertEqual(get_list('BOB'), [])
+
+    def test_renamed_user(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.username = 'alice'
+        self.user.save()
+        # The old username no longer serves the proofs.
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        alice_url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'alice'})
+        self.assertEqual(len(self.client.get(alice_url).json()['keybase_sigs']), 1)
+
+        # Also when only the case changes.
+        with override_settings(KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES=False):
+            self.user.username = 'Alice'
+            self.user.save()
+            self.assertEqual(self.client.get(alice_url).status_code, 404)
+
+        # Other updates don't look up the username.
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['email'])
+
+    def test_dumps_fallback(self):
+        data = {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]}
+        with patch('keybase_proofs.serializers.orjson', None):
+            self.assertEqual(json.loads(dumps(data).decode('utf-8')), data)
+        self.assertEqual(json.loads(dumps(data).decode('utf-8')), data)
+
+
+class TestInvalidateOnCommit(TransactionTestCase):
+
+    def test_invalidated_on_commit(self):
+        get_cache().clear()
+        user = UserModel().objects.create_user('bob')
+        proof = KeybaseProof.objects.create(user=user, kb_username='kb_bob', sig_hash='abc123', is_verified=True)
+        with transaction.atomic():
+            proof.sig_hash = 'def456'
+            proof.save()
+            # A concurrent request still reads the proof from before the save.
+            set_proof_list('bob', [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}])
+            self.assertIsNotNone(get_proof_list('bob'))
+        self.assertIsNone(get_proof_list('bob'))
+
+
+class TestProofFragmentCache(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        self.proof = KeybaseProof.objects.create(
+            user=self.user, kb_username='kb_bob', sig_hash='abc123', is_verified=True)
+        self.template = Template('{% load keybase_proofs %}{% keybase_proofs profile_user %}')
+
+    def render(self):
+        return self.template.render(Context({'profile_user': self.user}))
+
+    def test_cached_fragment(self):
+        with self.assertNumQueries(1):
+            html = self.render()
+        self.assertIn('kb_bob', html)
+        self.assertIn('username=bob', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+
+        # Saving or deleting a proof bumps the user's version.
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob2', sig_hash='abc456')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render(), html)
+        self.proof.delete()
+        with self.assertNumQueries(1):
+            self.assertNotIn('kb_bob', self.render())
+
+        # Other users' fragments are unaffected.
+        other = UserModel().objects.create_user('alice')
+        with self.assertNumQueries(1):
+            Template('{% load keybase_proofs %}{% keybase_proofs u %}').render(Context({'u': other}))
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob3', sig_hash='abc789',
+                                    is_verified=True)
+        with self.assertNumQueries(0):
+            Template('{% load keybase_proofs %}{% keybase_proofs u %}').render(Context({'u': other}))
+
+    def test_renamed_user(self):
+        self.render()
+        self.user.username = 'robert'
+        self.user.save()
+        self.assertIn('username=robert', self.render())
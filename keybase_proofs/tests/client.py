@@ -0,0 +1,35 @@
+import threading
+
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from keybase_proofs.client import KeybaseClient
+
+
+class TestKeybaseClient(SimpleTestCase):
+
+    @override_settings(KEYBASE_PROOFS_HTTP_CONNECT_TIMEOUT=1,
+                       KEYBASE_PROOFS_HTTP_READ_TIMEOUT=2,
+                       KEYBASE_PROOFS_HTTP_POOL_SIZE=4)
+    def test_settings(self):
+        client = KeybaseClient()
+        self.assertEqual(client.timeout, (1, 2))
+        adapter = client.session.get_adapter('https://keybase.io/')
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    def test_sessions_share_pool(self):
+        client = KeybaseClient()
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(client.session))
+        thread.start()
+        thread.join()
+
+        # Each thread gets its own session, backed by the same connection pool.
+        self.assertIs(client.session, client.session)
+        self.assertIsNot(sessions[0], client.session)
+        self.assertIs(sessions[0].get_adapter('https://keybase.io/'),
+                      client.session.get_adapter('https://keybase.io/'))
+
+        client.close()
+        self.assertIsNot(sessions[0].get_adapter('https://keybase.io/'),
+                         client.session.get_adapter('https://keybase.io/'))
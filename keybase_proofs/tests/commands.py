@@ -0,0 +1,314 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+import requests
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.bulk import verify_pending
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_live
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from io import StringIO
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+    from StringIO import StringIO
+
+
+def proof_live_response(url, params=None, timeout=None):
+    # Only proofs for `kb_good` are valid in this fake Keybase.
+    proof_valid = params['kb_username'] == 'kb_good'
+    return MagicMock(status_code=200,
+                     json=lambda: {'proof_valid': proof_valid, 'proof_live': proof_valid})
+
+
+class TestRecheckCommand(TestCase):
+
+    def setUp(self):
+        is_proof_live.cache_clear()
+        for i in range(5):
+            user = UserModel().objects.create_user('user{}'.format(i))
+            KeybaseProof.objects.create(user=user, kb_username='kb_good',
+                                        sig_hash='abc{}'.format(i), is_verified=i % 2 == 0)
+            KeybaseProof.objects.create(user=user, kb_username='kb_revoked',
+                                        sig_hash='def{}'.format(i), is_verified=True)
+
+    @patch('requests.Session.get', side_effect=proof_live_response)
+    def test_recheck(self, mock_requests):
+        out = StringIO()
+        call_command('recheck_keybase_proofs', workers=3, chunk_size=2, dry_run=True, stdout=out)
+        self.assertIn('checked 10/10 proofs', out.getvalue())
+        self.assertIn('7 changed, 0 failed (dry run)', out.getvalue())
+        self.assertEqual(KeybaseProof.objects.filter(is_verified=True).count(), 8)
+
+        is_proof_live.cache_clear()
+        out = StringIO()
+        call_command('recheck_keybase_proofs', workers=3, chunk_size=2, stdout=out)
+        self.assertEqual(mock_requests.call_count, 20)
+        self.assertIn('7 changed', out.getvalue())
+        self.assertEqual(
+            set(KeybaseProof.objects.filter(is_verified=True).values_list('kb_username', flat=True)),
+            {'kb_good'})
+        self.assertEqual(KeybaseProof.objects.filter(is_verified=True).count(), 5)
+
+    @patch('requests.Session.get')
+    def test_recheck_errors(self, mock_requests):
+        def response(url, params=None, timeout=None):
+            # Server errors for the revoked proofs are not a revocation.
+            if params['kb_username'] == 'kb_revoked':
+                return MagicMock(status_code=503)
+            return proof_live_response(url, params, timeout)
+        mock_requests.side_effect = response
+        out = StringIO()
+        call_command('recheck_keybase_proofs', workers=3, stdout=out)
+        self.assertIn('2 changed, 5 failed', out.getvalue())
+        self.assertEqual(KeybaseProof.objects.filter(kb_username='kb_revoked', is_verified=True).count(), 5)
+        self.assertEqual(KeybaseProof.objects.filter(kb_username='kb_good', is_verified=True).count(), 5)
+
+
+def proof_valid_response(url, params=None, timeout=None):
+    return MagicMock(status_code=200, json=lambda: {'proof_valid': params['kb_username'] == 'kb_good'})
+
+
+@override_settings(KEYBASE_PROOFS_DEFERRED_VERIFICATION=True)
+class TestProofWorker(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        keybase_breaker.reset()
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+
+    def tearDown(self):
+        keybase_breaker.reset()
+
+    @patch('requests.Session.get', side_effect=proof_valid_response)
+    def test_worker(self, mock_requests):
+        self.client.login(username='bob', password='bobo')
+        list_url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+        for kb_username in ('kb_good', 'kb_bad'):
+            resp = self.client.post(reverse('keybase_proofs:new-proof'), data={
+                'username': 'bob',
+                'kb_username': kb_username,
+                'sig_hash': 'abc123',
+            })
+            # Stored as pending without calling Keybase.
+            self.assertEqual(resp.status_code, 301)
+        mock_requests.assert_not_called()
+        self.assertEqual(KeybaseProof.objects.pending().count(), 2)
+        self.assertEqual(self.client.get(list_url).json(), {'keybase_sigs': []})
+
+        out = StringIO()
+        call_command('run_keybase_proof_worker', once=True, batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().count('verified'), 2)
+        self.assertEqual(mock_requests.call_count, 2)
+        self.assertFalse(KeybaseProof.objects.pending().exists())
+        self.assertEqual(list(KeybaseProof.objects.verified().values_list('kb_username', flat=True)),
+                         ['kb_good'])
+        # The cached list was invalidated.
+        self.assertEqual(self.client.get(list_url).json(),
+                         {'keybase_sigs': [{'kb_username': 'kb_good', 'sig_hash': 'abc123'}]})
+
+    @patch('requests.Session.get')
+    def test_worker_retries(self, mock_requests):
+        def response(url, params=None, timeout=None):
+            if params['kb_username'] == 'kb_failing':
+                raise requests.ConnectionError()
+            return proof_valid_response(url, params, timeout)
+        mock_requests.side_effect = response
+        failing = KeybaseProof.objects.create(user=self.user, kb_username='kb_failing', sig_hash='abc',
+                                              is_pending=True, created_at=timezone.now() - timedelta(hours=1))
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_good', sig_hash='abc', is_pending=True)
+
+        self.assertEqual(verify_pending(batch_size=1), (0, 0, 1))
+        failing.refresh_from_db()
+        self.assertTrue(failing.is_pending)
+        self.assertEqual(failing.check_failures, 1)
+        self.assertGreater(failing.next_check_at, timezone.now())
+        # The failed proof backs off instead of holding up newer ones.
+        self.assertEqual(verify_pending(batch_size=1), (1, 0, 0))
+        self.assertEqual(verify_pending(batch_size=1), (0, 0, 0))
+        self.assertEqual(mock_requests.call_count, 2)
+        # Retries aren't liveness checks.
+        self.assertFalse(KeybaseProof.objects.due(failing.next_check_at).filter(pk=failing.pk).exists())
+
+        # Once due it's retried.
+        KeybaseProof.objects.filter(pk=failing.pk).update(next_check_at=timezone.now())
+        self.assertEqual(verify_pending(batch_size=1), (0, 0, 1))
+        failing.refresh_from_db()
+        self.assertEqual(failing.check_failures, 2)
+
+    @patch('requests.Session.get')
+    def test_worker_once_after_failures(self, mock_requests):
+        def response(url, params=None, timeout=None):
+            if params['kb_username'] == 'kb_failing':
+                raise requests.ConnectionError()
+            return proof_valid_response(url, params, timeout)
+        mock_requests.side_effect = response
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_failing', sig_hash='abc',
+                                    is_pending=True, created_at=timezone.now() - timedelta(hours=1))
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_good', sig_hash='abc', is_pending=True)
+        out = StringIO()
+        call_command('run_keybase_proof_worker', once=True, batch_size=1, stdout=out)
+        # A batch of failed checks doesn't end the run.
+        self.assertIn('verified 0 proofs, rejected 0, failed 1', out.getvalue())
+        self.assertIn('verified 1 proofs, rejected 0, failed 0', out.getvalue())
+        self.assertEqual(list(KeybaseProof.objects.pending().values_list('kb_username', flat=True)),
+                         ['kb_failing'])
+
+    @override_settings(KEYBASE_PROOFS_BREAKER_FAILURE_THRESHOLD=1)
+    @patch('requests.Session.get', side_effect=requests.ConnectionError())
+    def test_worker_keybase_unavailable(self, mock_requests):
+        for i in range(3):
+            KeybaseProof.objects.create(user=self.user, kb_username='kb_{}'.format(i),
+                                        sig_hash='abc', is_pending=True)
+        with self.assertRaises(CommandError):
+            call_command('run_keybase_proof_worker', once=True, workers=1, stdout=StringIO())
+        # The failed check opened the breaker, all proofs stay pending.
+        self.assertEqual(KeybaseProof.objects.pending().count(), 3)
+
+
+class TestExportCommand(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.start = timezone.now() - timedelta(days=1)
+        # Several proofs share a timestamp to exercise paging on ties.
+        for i in range(7):
+            user = UserModel().objects.create_user('user{}'.format(i))
+            KeybaseProof.objects.create(user=user, kb_username='kb{}'.format(i), sig_hash='abc{}'.format(i),
+                                        is_verified=i % 2 == 0,
+                                        created_at=self.start + timedelta(minutes=i // 2))
+
+    def export(self, *args, **options):
+        path = os.path.join(self.tmpdir, 'proofs.ndjson')
+        err = StringIO()
+        call_command('export_keybase_proofs', *args, output=path, stderr=err, **options)
+        opener = gzip.open if options.get('gzip') else open
+        with opener(path, 'rb') as f:
+            lines = [json.loads(line.decode('utf-8')) for line in f]
+        return lines, err.getvalue()
+
+    def test_export(self):
+        with self.assertNumQueries(4):
+            lines, err = self.export(chunk_size=2)
+        self.assertEqual([line['kb_username'] for line in lines], ['kb{}'.format(i) for i in range(7)])
+        self.assertEqual(lines[1], {
+            'kb_username': 'kb1',
+            'sig_hash': 'abc1',
+            'username': 'user1',
+            'is_verified': False,
+            'created_at': self.start.isoformat(),
+        })
+        self.assertIn('exported 7 proofs, watermark {}'.format(lines[-1]['created_at']), err)
+
+        gzipped, _ = self.export(chunk_size=3, gzip=True)
+        self.assertEqual(gzipped, lines)
+
+        # Incremental export after a watermark.
+        lines, err = self.export(since=lines[3]['created_at'])
+        self.assertEqual([line['kb_username'] for line in lines], ['kb4', 'kb5', 'kb6'])
+
+        lines, err = self.export(since=(timezone.now() + timedelta(days=1)).isoformat())
+        self.assertEqual(lines, [])
+        self.assertIn('exported 0 proofs', err)
+
+        with self.assertRaises(CommandError):
+            self.export(since='yesterday')
+
+
+def import_proof_valid_response(url, params=None, timeout=None):
+    if params['sig_hash'] == 'eee0':
+        return MagicMock(status_code=503)
+    return MagicMock(status_code=200, json=lambda: {'proof_valid': params['sig_hash'] != 'bad0'})
+
+
+class TestImportCommand(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        keybase_breaker.reset()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.alice = UserModel().objects.create_user('alice')
+        self.bob = UserModel().objects.create_user('bob')
+        self.existing = KeybaseProof.objects.create(user=self.bob, kb_username='kb_bob', sig_hash='abc0')
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmpdir, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wb') as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)).encode('utf-8') + b'\n')
+        return path
+
+    def test_import(self):
+        path = self.write('proofs.ndjson', [
+            {'username': 'alice', 'kb_username': 'kb_alice', 'sig_hash': 'abc1', 'is_verified': True,
+             'created_at': '2019-01-01T00:00:00'},
+            {'username': 'alice', 'kb_username': 'kb_alice2', 'sig_hash': 'abc2'},
+            {'username': 'bob', 'kb_username': 'kb_bob', 'sig_hash': 'def0', 'is_verified': True},
+            {'username': 'carol', 'kb_username': 'kb_carol', 'sig_hash': 'abc3'},
+            {'username': 'alice', 'kb_username': 'kb_alice3', 'sig_hash': 'xyz'},
+            'not json',
+            '',
+        ])
+        gz_path = self.write('more.ndjson.gz', [
+            {'username': 'bob', 'kb_username': 'kb_bob2', 'sig_hash': 'abc4', 'is_verified': True},
+        ])
+        out, err = StringIO(), StringIO()
+        # A single chunk: users, existing proofs, one INSERT and one UPDATE,
+        # plus the savepoint queries of the transaction.
+        with self.assertNumQueries(6):
+            call_command('import_keybase_proofs', path, gz_path, stdout=out, stderr=err)
+        self.assertIn('created 3 proofs, updated 1, skipped 3, rejected 0', out.getvalue())
+        self.assertIn('unknown user carol', err.getvalue())
+        self.assertIn('sig_hash must be a hex string', err.getvalue())
+
+        proofs = {proof.kb_username: proof for proof in KeybaseProof.objects.all()}
+        self.assertEqual(len(proofs), 4)
+        self.assertEqual(proofs['kb_alice'].created_at.year, 2019)
+        self.assertTrue(proofs['kb_alice'].is_verified)
+        self.assertIsNotNone(proofs['kb_alice'].next_check_at)
+        self.assertEqual(proofs['kb_alice'].user_lookup_key, 'alice')
+        self.assertFalse(proofs['kb_alice2'].is_verified)
+        self.assertEqual(proofs['kb_bob'].pk, self.existing.pk)
+        self.assertEqual(proofs['kb_bob'].sig_hash, 'def0')
+        self.assertEqual(list(KeybaseProof.objects.by_sig_hash('def0')), [proofs['kb_bob']])
+        self.assertTrue(proofs['kb_bob2'].is_verified)
+
+    @patch('requests.Session.get', side_effect=import_proof_valid_response)
+    def test_import_verify(self, mock_requests):
+        path = self.write('proofs.ndjson', [
+            {'username': 'alice', 'kb_username': 'kb_alice{}'.format(i), 'sig_hash': sig_hash}
+            for i, sig_hash in enumerate(['abc0', 'bad0', 'abc2', 'abc3', 'abc4', 'eee0'])
+        ])
+        out, err = StringIO(), StringIO()
+        call_command('import_keybase_proofs', path, verify=True, chunk_size=2, workers=2,
+                     stdout=out, stderr=err)
+        self.assertEqual(mock_requests.call_count, 6)
+        self.assertIn('created 4 proofs, updated 0, skipped 0, rejected 1, failed 1', out.getvalue())
+        # Errors are reported apart from invalid signatures.
+        self.assertIn('proofs.ndjson:2: invalid signature', err.getvalue())
+        self.assertIn('proofs.ndjson:6: could not be verified', err.getvalue())
+        self.assertFalse(KeybaseProof.objects.filter(sig_hash='eee0').exists())
+        self.assertEqual(KeybaseProof.objects.verified().filter(user=self.alice).count(), 4)
@@ -0,0 +1,85 @@
+"""
+Import-time budget. Loading the app, its urlconf and admin happens in every
+worker and management command, so it must not pull in the dependencies only
+needed to serve or verify proofs. Measured in a fresh interpreter with
+`python -X importtime`; the budget in seconds can be overridden with the
+`KEYBASE_PROOFS_IMPORT_BUDGET` environment variable.
+"""
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.client import Client
+from django.urls import reverse
+
+from keybase_proofs.users import UserModel
+
+IMPORT_BUDGET = float(os.environ.get('KEYBASE_PROOFS_IMPORT_BUDGET', 0.05))
+
+# Modules that must only be imported on use.
+LAZY_MODULES = ('requests', 'jsonview', 'py2casefold', 'keybase_proofs.views')
+
+SCRIPT = """
+import sys
+import django
+django.setup()
+import keybase_proofs.admin
+import keybase_proofs.urls
+sys.stdout.write(' '.join(sorted(sys.modules)))
+"""
+
+
+def import_app():
+    """
+    Returns the modules loaded by setting up Django and importing the app,
+    and the cumulative import time in seconds of the `keybase_proofs`
+    modules, including the dependencies they imported first.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='test_app.settings')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+                          universal_newlines=True)
+    total = 0
+    # Lines are printed after the imports they triggered, so walk them in
+    # reverse to see each module before its dependencies.
+    stack = []
+    for line in reversed(proc.stderr.splitlines()):
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        counted = bool(stack) and stack[-1][1]
+        if name.startswith('keybase_proofs') and not counted:
+            total += int(cumulative)
+            counted = True
+        stack.append((depth, counted))
+    return set(proc.stdout.split()), total / 1e6
+
+
+class TestImportTime(SimpleTestCase):
+
+    def test_import_budget(self):
+        if sys.version_info < (3, 7):
+            self.skipTest('python -X importtime requires Python 3.7')
+        results = [import_app() for _ in range(3)]
+        modules = results[0][0]
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+        # The fastest run is the least disturbed by other load.
+        duration = min(duration for _, duration in results)
+        self.assertLess(duration, IMPORT_BUDGET,
+                        'importing keybase_proofs took {:.3f}s'.format(duration))
+
+
+class TestLazyViews(TestCase):
+
+    def test_batch_view_csrf_exempt(self):
+        UserModel().objects.create_user('bob')
+        client = Client(enforce_csrf_checks=True)
+        resp = client.post(reverse('keybase_proofs:list-proofs-batch-api'), data={'username': 'bob'})
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,89 @@
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.instrumentation import MetricsBackend
+from keybase_proofs.instrumentation import cache_access
+from keybase_proofs.instrumentation import keybase_call
+from keybase_proofs.instrumentation import view_timing
+from keybase_proofs.users import UserModel
+from keybase_proofs.verifiers import PROOF_VALID_ENDPOINT
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+
+
+class RecordingBackend(MetricsBackend):
+    metrics = []
+
+    def timing(self, name, seconds, tags):
+        self.metrics.append(name)
+
+    def increment(self, name, tags, value=1):
+        self.metrics.append(name)
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        RecordingBackend.metrics = []
+        self.events = []
+        for signal in (keybase_call, view_timing, cache_access):
+            signal.connect(self.receiver)
+        UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+
+    def tearDown(self):
+        for signal in (keybase_call, view_timing, cache_access):
+            signal.disconnect(self.receiver)
+
+    def receiver(self, signal, **kwargs):
+        kwargs.pop('sender')
+        self.events.append((signal, kwargs))
+
+    def get_events(self, signal):
+        return [kwargs for s, kwargs in self.events if s is signal]
+
+    @override_settings(KEYBASE_PROOFS_SERVER_TIMING=True,
+                       KEYBASE_PROOFS_METRICS_BACKEND='keybase_proofs.tests.instrumentation.RecordingBackend')
+    def test_list_view(self):
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+        resp = self.client.get(url)
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('total;dur=', resp['Server-Timing'])
+        resp = self.client.get(url)
+        self.assertNotIn('db;dur=', resp['Server-Timing'])
+
+        self.assertEqual([e['hit'] for e in self.get_events(cache_access)], [False, True])
+        timings = self.get_events(view_timing)
+        self.assertEqual([(e['view'], e['status'], e['db_queries']) for e in timings],
+                         [('KeybaseProofListView', 200, 1), ('KeybaseProofListView', 200, 0)])
+        self.assertIn('keybase_proofs.cache.hit', RecordingBackend.metrics)
+        self.assertIn('keybase_proofs.view.db_queries', RecordingBackend.metrics)
+
+    @override_settings(KEYBASE_PROOFS_SERVER_TIMING=True)
+    @patch('requests.Session.get')
+    def test_keybase_calls(self, mock_requests):
+        mock_requests.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+        self.client.login(username='bob', password='bobo')
+        resp = self.client.post(reverse('keybase_proofs:new-proof'), data={
+            'username': 'bob',
+            'kb_username': 'kb_bob',
+            'sig_hash': 'abc123',
+        })
+        self.assertEqual(resp.status_code, 301)
+        self.assertIn('keybase;dur=', resp['Server-Timing'])
+        calls = self.get_events(keybase_call)
+        self.assertEqual([(e['endpoint'], e['status']) for e in calls], [(PROOF_VALID_ENDPOINT, 200)])
+
+    def test_no_server_timing_by_default(self):
+        resp = self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'bob'}))
+        self.assertNotIn('Server-Timing', resp)
+        self.assertEqual(self.get_events(view_timing)[0]['view'], 'KeybaseProofProfileView')
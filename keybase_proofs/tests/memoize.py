@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from keybase_proofs.memoize import SingleFlight
+from keybase_proofs.memoize import TTLCache
+from keybase_proofs.memoize import memoize_verification
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestMemoize(SimpleTestCase):
+
+    def test_ttl_cache(self):
+        cache = TTLCache(maxsize=2)
+        with patch('keybase_proofs.memoize.monotonic', return_value=100):
+            cache.set('a', 1, ttl=10)
+            cache.set('b', 2, ttl=10)
+            cache.set('c', 3, ttl=0)
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIsNone(cache.get('c'))
+
+            # `b` is the least recently used entry.
+            cache.set('d', 4, ttl=10)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(len(cache), 2)
+
+        with patch('keybase_proofs.memoize.monotonic', return_value=110):
+            self.assertIsNone(cache.get('a'))
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+                     for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while flight.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 4)
+
+    @override_settings(KEYBASE_PROOFS_VERIFY_CACHE_TTL=60,
+                       KEYBASE_PROOFS_VERIFY_CACHE_NEGATIVE_TTL=0)
+    def test_memoize_verification(self):
+        results = {'valid': True, 'invalid': False}
+        calls = []
+
+        @memoize_verification(lambda key: key)
+        def check(key):
+            calls.append(key)
+            return results[key]
+
+        self.assertTrue(check('valid'))
+        self.assertTrue(check('valid'))
+        self.assertEqual(calls, ['valid'])
+
+        # Negative results are not cached with a ttl of 0.
+        self.assertFalse(check('invalid'))
+        self.assertFalse(check('invalid'))
+        self.assertEqual(calls, ['valid', 'invalid', 'invalid'])
+
+        check.cache_clear()
+        check('valid')
+        self.assertEqual(calls, ['valid', 'invalid', 'invalid', 'valid'])
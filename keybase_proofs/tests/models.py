@@ -0,0 +1,70 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+
+
+class TestKeybaseProofQuerySet(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.alice = UserModel().objects.create_user('alice')
+        self.bob = UserModel().objects.create_user('bob')
+        self.verified = KeybaseProof.objects.create(
+            user=self.alice, kb_username='kb_alice', sig_hash='abc123', is_verified=True)
+        self.pending = KeybaseProof.objects.create(
+            user=self.alice, kb_username='kb_alice2', sig_hash='abc456', is_verified=False)
+        KeybaseProof.objects.create(
+            user=self.bob, kb_username='kb_bob', sig_hash='def123', is_verified=True)
+
+    def test_lookups(self):
+        self.assertEqual(set(KeybaseProof.objects.for_user(self.alice)), {self.verified, self.pending})
+        self.assertEqual(set(KeybaseProof.objects.for_username('alice')), {self.verified, self.pending})
+        self.assertEqual(list(KeybaseProof.objects.verified_for(self.alice)), [self.verified])
+        self.assertEqual(KeybaseProof.objects.verified().count(), 2)
+
+    def test_views_only_show_verified(self):
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'alice'}))
+        self.assertEqual(resp.json(), {'keybase_sigs': [self.verified.to_dict()]})
+
+        resp = self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'alice'}))
+        self.assertEqual(list(resp.context['object_list']), [self.verified])
+
+    def test_case_insensitive_usernames(self):
+        self.assertEqual(set(KeybaseProof.objects.for_lookup_key('ALICE')), {self.verified, self.pending})
+
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'Alice'}))
+        self.assertEqual(resp.json(), {'keybase_sigs': [self.verified.to_dict()]})
+        resp = self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'ALICE'}))
+        self.assertEqual(list(resp.context['object_list']), [self.verified])
+
+        # Renames are synced to the lookup key.
+        self.alice.username = 'Carol'
+        self.alice.save()
+        self.assertEqual(KeybaseProof.objects.for_lookup_key('carol').count(), 2)
+        self.assertFalse(KeybaseProof.objects.for_lookup_key('alice').exists())
+
+        # Users differing only in case are ambiguous.
+        KeybaseProof.objects.create(user=UserModel().objects.create_user('CAROL'),
+                                    kb_username='kb_carol', sig_hash='abc789', is_verified=True)
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'carol'}))
+        self.assertEqual(resp.status_code, 404)
+
+        with self.settings(KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES=False):
+            resp = self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'BOB'}))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_by_sig_hash(self):
+        self.assertEqual(bytes(self.verified.sig_hash_bin), b'\xab\xc1\x23')
+        self.assertEqual(list(KeybaseProof.objects.by_sig_hash('abc123')), [self.verified])
+        self.assertEqual(list(KeybaseProof.objects.by_sig_hash('ABC123')), [self.verified])
+        self.assertFalse(KeybaseProof.objects.by_sig_hash('abc12').exists())
+
+        # Updating `sig_hash` updates its binary form.
+        self.pending.sig_hash = 'abc12'
+        self.pending.save(update_fields=['sig_hash'])
+        self.assertIsNone(KeybaseProof.objects.get(pk=self.pending.pk).sig_hash_bin)
+        self.assertEqual(list(KeybaseProof.objects.by_sig_hash('abc12')), [self.pending])
+        self.assertFalse(KeybaseProof.objects.by_sig_hash('abc456').exists())
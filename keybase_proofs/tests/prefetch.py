@@ -0,0 +1,64 @@
+from django.db.models import Prefetch
+from django.template import Context
+from django.template import Template
+from django.test import TestCase
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.prefetch import keybase_proofs_prefetch
+from keybase_proofs.prefetch import prefetch_keybase_proofs
+from keybase_proofs.users import UserModel
+
+
+class TestPrefetch(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+
+    def add_users(self, count):
+        users = []
+        for i in range(count):
+            user = UserModel().objects.create_user('user{}_{}'.format(count, i))
+            KeybaseProof.objects.create(user=user, kb_username='kb{}'.format(i),
+                                        sig_hash='abc', is_verified=True)
+            KeybaseProof.objects.create(user=user, kb_username='kb_unverified',
+                                        sig_hash='abc')
+            users.append(user)
+        return users
+
+    def test_constant_queries(self):
+        template = Template('{% load keybase_proofs %}'
+                            '{% for user in users %}{% keybase_proofs user %}{% endfor %}')
+        for count in (1, 10, 50):
+            users = self.add_users(count)
+            queryset = UserModel().objects.filter(pk__in=[user.pk for user in users]).order_by('pk')
+            # One query for the users and one for all of their proofs.
+            with self.assertNumQueries(2):
+                page = list(prefetch_keybase_proofs(queryset))
+                self.assertEqual([[proof.kb_username for proof in user.keybase_proofs] for user in page],
+                                 [['kb{}'.format(i)] for i in range(count)])
+                html = template.render(Context({'users': page}))
+            self.assertEqual(html.count('proof_badge'), count)
+
+            # Users that are already loaded only need the proofs query.
+            get_cache().clear()
+            with self.assertNumQueries(1):
+                page = prefetch_keybase_proofs(users)
+                template.render(Context({'users': page}))
+
+    def test_prefetch(self):
+        users = self.add_users(2)
+        KeybaseProof.objects.create(user=users[0], kb_username='kb_other', sig_hash='abc',
+                                    is_verified=True)
+        # Through a relation, e.g. from comments to their authors.
+        proofs = KeybaseProof.objects.filter(kb_username='kb_unverified').order_by('pk')
+        with self.assertNumQueries(2):
+            authors = [proof.user for proof in proofs.select_related('user').prefetch_related(
+                keybase_proofs_prefetch('user'))]
+            self.assertEqual([len(author.keybase_proofs) for author in authors], [2, 1])
+
+        # `displayed()` fits custom `Prefetch`es.
+        with self.assertNumQueries(2):
+            page = UserModel().objects.filter(pk__in=[user.pk for user in users]).prefetch_related(
+                Prefetch('keybaseproof_set', queryset=KeybaseProof.objects.displayed(), to_attr='badges'))
+            self.assertEqual(sorted(len(user.badges) for user in page), [1, 2])
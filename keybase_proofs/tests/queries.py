@@ -0,0 +1,129 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.users import UserModel
+from keybase_proofs.users import username_lookup_key
+from keybase_proofs.views import is_proof_live
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from io import StringIO
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+    from StringIO import StringIO
+
+
+def keybase_response(url, params=None, timeout=None):
+    return MagicMock(status_code=200, json=lambda: {'proof_valid': False, 'proof_live': False})
+
+
+@patch('requests.Session.get', side_effect=keybase_response)
+class TestQueryBudgets(TestCase):
+    """
+    Query counts per view. These must not grow with the number of proofs, so
+    a failure here means a query-count regression (e.g. an N+1) rather than a
+    behavior change.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        is_proof_live.cache_clear()
+        keybase_breaker.reset()
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        self.add_proofs(self.user, 1)
+
+    def add_proofs(self, user, count):
+        KeybaseProof.objects.bulk_create([
+            KeybaseProof(user=user, kb_username='kb_{}_{}'.format(user.username, i),
+                         user_lookup_key=username_lookup_key(user.username),
+                         sig_hash='abc{}'.format(i), is_verified=True)
+            for i in range(count)])
+
+    def test_list_view(self, mock_requests):
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        # Cached responses don't touch the database.
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        KeybaseProof.objects.filter(user=self.user).delete()
+        self.add_proofs(self.user, 50)
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertEqual(len(resp.json()['keybase_sigs']), 50)
+
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('keybase_proofs:list-proofs-api',
+                                           kwargs={'username': 'nobody'}))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_list_view_case_insensitive(self, mock_requests):
+        # A differently cased username costs one indexed query more than an
+        # exact match, and is cached under its own spelling.
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'BOB'})
+        with self.assertNumQueries(2):
+            resp = self.client.get(url)
+        self.assertEqual(len(resp.json()['keybase_sigs']), 1)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_profile_view(self, mock_requests):
+        url = reverse('keybase_proofs:profile', kwargs={'username': 'bob'})
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        KeybaseProof.objects.filter(user=self.user).delete()
+        self.add_proofs(self.user, 50)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_new_proof_view(self, mock_requests):
+        self.client.force_login(self.user)
+        url = reverse('keybase_proofs:new-proof')
+        data = {'username': 'bob', 'kb_username': 'kb_bob_0', 'sig_hash': 'abc0'}
+        # Session and user lookups.
+        with self.assertNumQueries(2):
+            self.client.get(url, data=data)
+        # Invalid proofs are rejected before touching the proofs table.
+        with self.assertNumQueries(2):
+            resp = self.client.post(url, data=data)
+        self.assertEqual(resp.status_code, 400)
+
+        is_proof_valid.cache_clear()
+        mock_requests.side_effect = None
+        mock_requests.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+        # Plus the proof lookup and its update, in a transaction (a savepoint
+        # within the test's).
+        with self.assertNumQueries(6):
+            resp = self.client.post(url, data=data)
+        self.assertEqual(resp.status_code, 301)
+        # A new proof is inserted in a savepoint by `get_or_create`.
+        data['kb_username'] = 'kb_bob_new'
+        with self.assertNumQueries(9):
+            self.client.post(url, data=data)
+
+    def test_recheck_command(self, mock_requests):
+        # A count, one streaming select and one UPDATE per chunk of changes,
+        # however many proofs there are.
+        with self.assertNumQueries(3):
+            call_command('recheck_keybase_proofs', workers=2, stdout=StringIO())
+        self.assertFalse(KeybaseProof.objects.filter(is_verified=True).exists())
+
+        for i in range(20):
+            self.add_proofs(UserModel().objects.create_user('user{}'.format(i)), 5)
+        is_proof_live.cache_clear()
+        with self.assertNumQueries(3):
+            call_command('recheck_keybase_proofs', workers=2, chunk_size=500, stdout=StringIO())
+
+        KeybaseProof.objects.update(is_verified=True)
+        is_proof_live.cache_clear()
+        with self.assertNumQueries(2 + 5):
+            call_command('recheck_keybase_proofs', workers=2, chunk_size=25, stdout=StringIO())
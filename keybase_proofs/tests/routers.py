@@ -0,0 +1,106 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.routers import STICKY_COOKIE_NAME
+from keybase_proofs.routers import ReplicaRouter
+from keybase_proofs.routers import use_primary
+from keybase_proofs.routers import use_replica
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+
+
+class RecordingRouter(ReplicaRouter):
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        db = super(RecordingRouter, self).db_for_read(model, **hints)
+        self.reads.append((model, db))
+        return db
+
+
+# The default database stands in for the replica, reads routed to it are
+# told apart from reads left to the default routing by the router's result.
+@override_settings(DATABASE_ROUTERS=['keybase_proofs.tests.routers.RecordingRouter'],
+                   KEYBASE_PROOFS_REPLICAS=['default'])
+class TestReplicaRouter(TestCase):
+
+    def setUp(self):
+        is_proof_valid.cache_clear()
+        del RecordingRouter.reads[:]
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob', sig_hash='abc123',
+                                    is_verified=True)
+        # Long after the proof was written.
+        get_cache().clear()
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(KeybaseProof))
+        with use_replica():
+            self.assertEqual(router.db_for_read(KeybaseProof), 'default')
+            self.assertEqual(router.db_for_read(UserModel()), 'default')
+            self.assertIsNone(router.db_for_read(Session))
+            with use_primary():
+                self.assertIsNone(router.db_for_read(KeybaseProof))
+            self.assertEqual(router.db_for_read(KeybaseProof), 'default')
+        self.assertIsNone(router.db_for_read(KeybaseProof))
+        with override_settings(KEYBASE_PROOFS_REPLICAS=[]), use_replica():
+            self.assertIsNone(router.db_for_read(KeybaseProof))
+        self.assertFalse(router.allow_migrate('default', 'keybase_proofs'))
+        self.assertIsNone(router.allow_migrate('other', 'keybase_proofs'))
+
+    def test_views_read_from_replicas(self):
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'}))
+        self.assertEqual(len(resp.json()['keybase_sigs']), 1)
+        self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'bob'}))
+        self.assertTrue(RecordingRouter.reads)
+        self.assertTrue(all(db == 'default' for model, db in RecordingRouter.reads))
+
+    @patch('requests.Session.get', return_value=MagicMock(
+        status_code=200, json=lambda: {'proof_valid': True}))
+    def test_sticky_after_write(self, mock_requests):
+        self.client.login(username='bob', password='bobo')
+        resp = self.client.post(reverse('keybase_proofs:new-proof'), data={
+            'username': 'bob',
+            'kb_username': 'kb_bob2',
+            'sig_hash': 'abc456',
+        })
+        self.assertEqual(resp.status_code, 301)
+        self.assertEqual(resp.cookies[STICKY_COOKIE_NAME]['max-age'], 10)
+
+        del RecordingRouter.reads[:]
+        resp = self.client.get(reverse('keybase_proofs:profile', kwargs={'username': 'bob'}))
+        self.assertEqual(len(resp.context['object_list']), 2)
+        self.assertTrue(RecordingRouter.reads)
+        self.assertTrue(all(db is None for model, db in RecordingRouter.reads))
+
+    def test_lists_loaded_from_primary_after_write(self):
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+        # Written by another client, e.g. a worker, Keybase's crawler isn't
+        # sticky.
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob2', sig_hash='abc456',
+                                    is_verified=True)
+        resp = self.client.get(url)
+        self.assertEqual(len(resp.json()['keybase_sigs']), 2)
+        self.assertTrue(RecordingRouter.reads)
+        self.assertTrue(all(db is None for model, db in RecordingRouter.reads))
+
+        KeybaseProof.objects.filter(kb_username='kb_bob2').delete()
+        del RecordingRouter.reads[:]
+        with patch('keybase_proofs.routers.time.time', return_value=time.time() + 60):
+            resp = self.client.get(url)
+        self.assertEqual(len(resp.json()['keybase_sigs']), 1)
+        self.assertTrue(all(db == 'default' for model, db in RecordingRouter.reads))
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.scheduler import liveness_update
+from keybase_proofs.scheduler import next_check_delay
+from keybase_proofs.users import UserModel
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from io import StringIO
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+    from StringIO import StringIO
+
+
+def proof_live_response(url, params=None, timeout=None):
+    proof_valid = params['kb_username'] != 'kb_revoked'
+    proof_live = params['kb_username'] == 'kb_live'
+    if params['kb_username'] == 'kb_error':
+        return MagicMock(status_code=502)
+    if params['kb_username'] == 'kb_limited':
+        return MagicMock(status_code=429)
+    return MagicMock(status_code=200,
+                     json=lambda: {'proof_valid': proof_valid, 'proof_live': proof_live})
+
+
+@override_settings(KEYBASE_PROOFS_LIVENESS_INITIAL_INTERVAL=60,
+                   KEYBASE_PROOFS_LIVENESS_MAX_INTERVAL=3600,
+                   KEYBASE_PROOFS_LIVENESS_LIVE_INTERVAL=86400)
+@patch('keybase_proofs.scheduler.random.uniform', return_value=1)
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        keybase_breaker.reset()
+
+    def test_next_check_delay(self, mock_uniform):
+        self.assertEqual([next_check_delay(False, i) for i in range(8)],
+                         [60, 120, 240, 480, 960, 1920, 3600, 3600])
+        self.assertEqual(next_check_delay(False, 10 ** 6), 3600)
+        self.assertEqual(next_check_delay(True, 3), 86400)
+
+    def test_liveness_update(self, mock_uniform):
+        now = timezone.now()
+        self.assertEqual(liveness_update(2, (True, False), now), {
+            'is_verified': True,
+            'is_live': False,
+            'check_failures': 3,
+            'last_checked_at': now,
+            'next_check_at': now + timedelta(seconds=240),
+        })
+        self.assertEqual(liveness_update(2, (True, True), now)['next_check_at'],
+                         now + timedelta(seconds=86400))
+        self.assertIsNone(liveness_update(2, (False, False), now)['next_check_at'])
+        # Failed checks keep the previous result.
+        self.assertEqual(liveness_update(0, None, now), {
+            'check_failures': 1,
+            'next_check_at': now + timedelta(seconds=60),
+        })
+
+    @patch('requests.Session.get', side_effect=proof_live_response)
+    def test_command(self, mock_requests, mock_uniform):
+        user = UserModel().objects.create_user('bob')
+        now = timezone.now()
+        for kb_username in ('kb_live', 'kb_pending', 'kb_revoked', 'kb_error', 'kb_limited'):
+            KeybaseProof.objects.create(user=user, kb_username=kb_username, sig_hash='abc',
+                                        is_verified=True, next_check_at=now)
+        KeybaseProof.objects.create(user=user, kb_username='kb_later', sig_hash='abc',
+                                    is_verified=True, next_check_at=now + timedelta(hours=1))
+        KeybaseProof.objects.create(user=user, kb_username='kb_unscheduled', sig_hash='abc',
+                                    is_verified=True)
+
+        out = StringIO()
+        call_command('run_keybase_liveness_scheduler', once=True, stdout=out)
+        self.assertIn('checked 5 proofs', out.getvalue())
+        # Only due proofs are checked.
+        self.assertEqual(sorted(call[1]['params']['kb_username'] for call in mock_requests.call_args_list),
+                         ['kb_error', 'kb_limited', 'kb_live', 'kb_pending', 'kb_revoked'])
+
+        proofs = {proof.kb_username: proof for proof in KeybaseProof.objects.all()}
+        self.assertTrue(proofs['kb_live'].is_live)
+        self.assertEqual(proofs['kb_live'].check_failures, 0)
+        self.assertGreater(proofs['kb_live'].next_check_at, now + timedelta(hours=23))
+        self.assertFalse(proofs['kb_pending'].is_live)
+        self.assertEqual(proofs['kb_pending'].check_failures, 1)
+        self.assertLess(proofs['kb_pending'].next_check_at, now + timedelta(minutes=5))
+        self.assertFalse(proofs['kb_revoked'].is_verified)
+        self.assertIsNone(proofs['kb_revoked'].next_check_at)
+        self.assertTrue(proofs['kb_error'].is_verified)
+        self.assertEqual(proofs['kb_error'].check_failures, 1)
+        self.assertIsNone(proofs['kb_error'].last_checked_at)
+        # Rate limiting is retried rather than taken as a revocation.
+        self.assertTrue(proofs['kb_limited'].is_verified)
+        self.assertEqual(proofs['kb_limited'].check_failures, 1)
+        self.assertIsNotNone(proofs['kb_limited'].next_check_at)
+
+        mock_requests.reset_mock()
+        call_command('run_keybase_liveness_scheduler', once=True, stdout=StringIO())
+        mock_requests.assert_not_called()
+
+    def test_schedule_migration(self, mock_uniform):
+        migration = import_module('keybase_proofs.migrations.0013_schedule_liveness_checks')
+        user = UserModel().objects.create_user('bob')
+        later = timezone.now() + timedelta(hours=1)
+        for kb_username, is_verified, is_pending, next_check_at in (
+                ('kb_old', True, False, None),
+                ('kb_scheduled', True, False, later),
+                ('kb_revoked', False, False, None),
+                ('kb_pending', False, True, None)):
+            KeybaseProof.objects.create(user=user, kb_username=kb_username, sig_hash='abc',
+                                        is_verified=is_verified, is_pending=is_pending,
+                                        next_check_at=next_check_at)
+        with patch.object(migration, 'BATCH_SIZE', 1):
+            migration.schedule_liveness_checks(apps, None)
+        self.assertEqual(list(KeybaseProof.objects.due().values_list('kb_username', flat=True)), ['kb_old'])
+        self.assertEqual(KeybaseProof.objects.get(kb_username='kb_scheduled').next_check_at, later)
+
+    @patch('requests.Session.get', side_effect=proof_live_response)
+    def test_new_proofs_are_scheduled(self, mock_requests, mock_uniform):
+        UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        self.client.login(username='bob', password='bobo')
+        start = timezone.now()
+        self.client.post(reverse('keybase_proofs:new-proof'), data={
+            'username': 'bob',
+            'kb_username': 'kb_pending',
+            'sig_hash': 'abc123',
+        })
+        proof = KeybaseProof.objects.get()
+        self.assertTrue(proof.is_verified)
+        self.assertGreaterEqual(proof.next_check_at, start + timedelta(seconds=60))
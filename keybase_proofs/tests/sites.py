@@ -0,0 +1,143 @@
+from django.contrib.sites.models import Site
+from django.db import IntegrityError
+from django.db import transaction
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.cache import get_cache
+from keybase_proofs.cache import proof_list_cache_key
+from keybase_proofs.client import get_keybase_client
+from keybase_proofs.client import keybase_client
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.sites import NO_SITE
+from keybase_proofs.sites import get_current_site_id
+from keybase_proofs.sites import use_site
+from keybase_proofs.users import UserModel
+from keybase_proofs.verifiers import BatchingVerifier
+from keybase_proofs.verifiers import InMemoryVerifier
+from keybase_proofs.views import get_domain
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+except ImportError:
+    from mock import MagicMock
+    from mock import patch
+
+
+@override_settings(SITE_ID=None, KEYBASE_PROOFS_SITES={
+    'a.com': {'HTTP_POOL_SIZE': 3},
+    'b.com': {'DOMAIN': 'keybase.b.com'},
+})
+class TestSites(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        self.site_a = Site.objects.create(domain='a.com', name='a')
+        self.site_b = Site.objects.create(domain='b.com', name='b')
+        self.user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        KeybaseProof.objects.create(user=self.user, site_id=self.site_a.pk, kb_username='kb_bob',
+                                    sig_hash='aa', is_verified=True)
+        KeybaseProof.objects.create(user=self.user, site_id=self.site_b.pk, kb_username='kb_bob',
+                                    sig_hash='bb', is_verified=True)
+
+    def test_unique(self):
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob', sig_hash='cc')
+        # Proofs without a site are unique per Keybase account too.
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            KeybaseProof.objects.create(user=self.user, kb_username='kb_bob', sig_hash='dd')
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            KeybaseProof.objects.create(user=self.user, site_id=self.site_a.pk, kb_username='kb_bob',
+                                        sig_hash='dd')
+
+    def test_batching(self):
+        backend = InMemoryVerifier()
+        site_ids = []
+        verify_batch = backend.verify_batch
+
+        def record_site(*args):
+            site_ids.append(get_current_site_id())
+            return verify_batch(*args)
+
+        backend.verify_batch = record_site
+        verifier = BatchingVerifier(backend=backend)
+        with use_site(self.site_b):
+            self.assertTrue(verifier.proof_valid('keybase.b.com', 'bob', 'abc', 'kb_bob'))
+        self.assertTrue(verifier.proof_valid('example.com', 'bob', 'abc', 'kb_bob'))
+        # Batches are sent for the site of their checks.
+        self.assertEqual(site_ids, [self.site_b.pk, NO_SITE])
+
+    def get_list(self, host):
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+        return self.client.get(url, HTTP_HOST=host).json()['keybase_sigs']
+
+    def test_config(self):
+        with use_site(self.site_a):
+            self.assertEqual(get_domain(), 'a.com')
+            client = get_keybase_client()
+            self.assertIsNot(client, keybase_client)
+            self.assertIs(client, get_keybase_client())
+            self.assertEqual(client.pool_size, 3)
+        with use_site(self.site_b.pk):
+            self.assertEqual(get_domain(), 'keybase.b.com')
+            self.assertIsNot(get_keybase_client(), client)
+        # Outside of a site the global settings apply.
+        self.assertIs(get_keybase_client(), keybase_client)
+
+    def test_list_api(self):
+        self.assertEqual(self.get_list('a.com'), [{'kb_username': 'kb_bob', 'sig_hash': 'aa'}])
+        self.assertEqual(self.get_list('b.com'), [{'kb_username': 'kb_bob', 'sig_hash': 'bb'}])
+
+        # Each site has its own cache entries, saving a proof leaves the
+        # other site's cached.
+        with use_site(self.site_b):
+            key_b = proof_list_cache_key('bob')
+        self.assertIsNotNone(get_cache().get(key_b))
+        KeybaseProof.objects.filter(site_id=self.site_a.pk).get().save()
+        self.assertIsNotNone(get_cache().get(key_b))
+        with use_site(self.site_a):
+            self.assertIsNone(get_cache().get(proof_list_cache_key('bob')))
+
+        # Deleting a user drops their entries on all sites.
+        carol = UserModel().objects.create_user('carol')
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'carol'})
+        self.client.get(url, HTTP_HOST='b.com')
+        with use_site(self.site_b):
+            key_b = proof_list_cache_key('carol')
+        self.assertIsNotNone(get_cache().get(key_b))
+        carol.delete()
+        self.assertIsNone(get_cache().get(key_b))
+
+    def test_profile_and_batch(self):
+        url = reverse('keybase_proofs:profile', kwargs={'username': 'bob'})
+        resp = self.client.get(url, HTTP_HOST='b.com')
+        self.assertEqual([proof.sig_hash for proof in resp.context['object_list']], ['bb'])
+
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-batch-api'),
+                               data={'username': ['bob', 'BOB']}, HTTP_HOST='a.com')
+        self.assertEqual(resp.json()['keybase_sigs'], {
+            'bob': [{'kb_username': 'kb_bob', 'sig_hash': 'aa'}],
+            'BOB': [{'kb_username': 'kb_bob', 'sig_hash': 'aa'}],
+        })
+
+    @patch('requests.Session.get')
+    def test_post(self, mock_requests):
+        mock_requests.return_value = MagicMock(status_code=200, json=lambda: {'proof_valid': True})
+        self.client.login(username='bob', password='bobo')
+        resp = self.client.post(reverse('keybase_proofs:new-proof'), data={
+            'username': 'bob',
+            'kb_username': 'kb_bob',
+            'sig_hash': 'bb22',
+        }, HTTP_HOST='b.com')
+        self.assertEqual(resp.status_code, 301)
+        self.assertIn('domain=keybase.b.com', resp['Location'])
+        self.assertEqual(mock_requests.call_args[1]['params']['domain'], 'keybase.b.com')
+        # The proof of the other site is untouched.
+        self.assertEqual(dict(KeybaseProof.objects.values_list('site_id', 'sig_hash')), {
+            self.site_a.pk: 'aa',
+            self.site_b.pk: 'bb22',
+        })
+        self.assertEqual(self.get_list('b.com'), [{'kb_username': 'kb_bob', 'sig_hash': 'bb22'}])
@@ -0,0 +1,110 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from keybase_proofs.bulk import VerifiedFlagWriter
+from keybase_proofs.cache import get_cache
+from keybase_proofs.models import KeybaseProof
+from keybase_proofs.models import KeybaseProofSnapshot
+from keybase_proofs.users import UserModel
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+@override_settings(KEYBASE_PROOFS_LIST_SNAPSHOTS=True)
+class TestSnapshots(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserModel().objects.create_user('bob')
+        self.proof = KeybaseProof.objects.create(
+            user=self.user, kb_username='kb_bob', sig_hash='abc123', is_verified=True)
+        self.url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'bob'})
+
+    def snapshot(self, username='bob'):
+        return json.loads(KeybaseProofSnapshot.objects.get(username=username).content)
+
+    def test_maintained(self):
+        self.assertEqual(self.snapshot(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]})
+        KeybaseProof.objects.create(user=self.user, kb_username='kb_bob2', sig_hash='abc456')
+        self.assertEqual(len(self.snapshot()['keybase_sigs']), 1)
+
+        self.proof.sig_hash = 'def123'
+        self.proof.save()
+        self.assertEqual(self.snapshot()['keybase_sigs'][0]['sig_hash'], 'def123')
+
+        # Bulk writers refresh snapshots too.
+        writer = VerifiedFlagWriter()
+        writer.add(self.proof, False)
+        writer.flush()
+        self.assertEqual(self.snapshot(), {'keybase_sigs': []})
+
+        self.user.username = 'robert'
+        self.user.save()
+        self.assertFalse(KeybaseProofSnapshot.objects.filter(username='bob').exists())
+        self.assertEqual(self.snapshot('robert'), {'keybase_sigs': []})
+
+        self.user.delete()
+        self.assertFalse(KeybaseProofSnapshot.objects.exists())
+
+    def test_list_view(self):
+        # A single indexed read, also after the cache is flushed.
+        for _ in range(2):
+            get_cache().clear()
+            with self.assertNumQueries(1):
+                resp = self.client.get(self.url)
+            self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]})
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        # Users without a snapshot fall back to querying their proofs.
+        UserModel().objects.create_user('alice')
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'alice'}))
+        self.assertEqual(resp.json(), {'keybase_sigs': []})
+
+    def test_username_case(self):
+        url = reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'Bob'})
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]})
+
+        # Another user's spelling gets their own snapshot.
+        UserModel().objects.create_user('BOB')
+        KeybaseProof.objects.create(user=UserModel().objects.get(username='BOB'), kb_username='kb_BOB',
+                                    sig_hash='abc456', is_verified=True)
+        get_cache().clear()
+        resp = self.client.get(reverse('keybase_proofs:list-proofs-api', kwargs={'username': 'BOB'}))
+        self.assertEqual(resp.json(), {'keybase_sigs': [{'kb_username': 'kb_BOB', 'sig_hash': 'abc456'}]})
+        # Ambiguous spellings aren't served from snapshots.
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        UserModel().objects.filter(username='BOB').delete()
+        get_cache().clear()
+        with override_settings(KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES=False):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_rebuild(self):
+        alice = UserModel().objects.create_user('alice')
+        with self.settings(KEYBASE_PROOFS_LIST_SNAPSHOTS=False):
+            KeybaseProof.objects.create(user=alice, kb_username='kb_alice', sig_hash='abc456', is_verified=True)
+            self.proof.delete()
+        KeybaseProofSnapshot.objects.filter(username='bob').update(content='{}')
+
+        out = StringIO()
+        call_command('rebuild_keybase_proof_snapshots', chunk_size=1, stdout=out)
+        self.assertIn('rebuilt 1 snapshots, deleted 1 stale', out.getvalue())
+        self.assertEqual(list(KeybaseProofSnapshot.objects.values_list('username', flat=True)), ['alice'])
+        self.assertEqual(self.snapshot('alice')['keybase_sigs'][0]['kb_username'], 'kb_alice')
+
+        with self.settings(KEYBASE_PROOFS_LIST_SNAPSHOTS=False), self.assertRaises(CommandError):
+            call_command('rebuild_keybase_proof_snapshots', stdout=out)
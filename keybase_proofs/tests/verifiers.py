@@ -0,0 +1,123 @@
+import threading
+
+import requests
+
+from django.test import TestCase
+from django.test import override_settings
+
+from keybase_proofs.breaker import OPEN
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.breaker import deadline
+from keybase_proofs.breaker import keybase_breaker
+from keybase_proofs.instrumentation import keybase_call
+from keybase_proofs.users import UserModel
+from keybase_proofs.verifiers import PROOF_LIVE
+from keybase_proofs.verifiers import PROOF_LIVE_ENDPOINT
+from keybase_proofs.verifiers import PROOF_VALID_ENDPOINT
+from keybase_proofs.verifiers import BatchingVerifier
+from keybase_proofs.verifiers import InMemoryVerifier
+from keybase_proofs.verifiers import get_verifier
+from keybase_proofs.views import is_proof_live
+from keybase_proofs.views import is_proof_valid
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+@override_settings(KEYBASE_PROOFS_VERIFIER_BACKEND='keybase_proofs.verifiers.InMemoryVerifier')
+class TestVerifiers(TestCase):
+
+    def setUp(self):
+        is_proof_valid.cache_clear()
+        is_proof_live.cache_clear()
+        keybase_breaker.reset()
+        self.calls = []
+        keybase_call.connect(self.receiver)
+
+    def tearDown(self):
+        keybase_call.disconnect(self.receiver)
+        keybase_breaker.reset()
+
+    def receiver(self, sender, endpoint, status, **kwargs):
+        self.calls.append((endpoint, status))
+
+    @override_settings(KEYBASE_PROOFS_STUB_VALID_RATE=0.5, KEYBASE_PROOFS_STUB_LIVE_RATE=0.5)
+    @patch('requests.Session.get')
+    def test_in_memory_backend(self, mock_requests):
+        user = UserModel().objects.create_user('bob', 'bob@bob.com', 'bobo')
+        results = [is_proof_live(user, 'abc{}'.format(i), 'kb_bob') for i in range(200)]
+        valid = sum(proof_valid for proof_valid, _ in results)
+        live = sum(proof_live for _, proof_live in results)
+        self.assertTrue(60 < valid < 140)
+        self.assertTrue(20 < live < valid)
+        self.assertNotIn((False, True), results)
+        mock_requests.assert_not_called()
+        self.assertEqual(set(self.calls), {(PROOF_LIVE_ENDPOINT, 200)})
+
+        # Outcomes are stable across calls.
+        is_proof_live.cache_clear()
+        self.assertEqual(results, [is_proof_live(user, 'abc{}'.format(i), 'kb_bob') for i in range(200)])
+
+        get_verifier().set_outcome('pinned', False)
+        self.assertFalse(is_proof_valid('bob', 'pinned', 'kb_bob'))
+        self.assertEqual(self.calls[-1], (PROOF_VALID_ENDPOINT, 200))
+
+    @override_settings(KEYBASE_PROOFS_STUB_ERROR_RATE=1, KEYBASE_PROOFS_BREAKER_FAILURE_THRESHOLD=2)
+    def test_in_memory_errors(self):
+        for i in range(2):
+            self.assertFalse(is_proof_valid('bob', 'abc{}'.format(i), 'kb_bob'))
+        self.assertEqual(keybase_breaker.state, OPEN)
+        with self.assertRaises(KeybaseUnavailable):
+            is_proof_valid('bob', 'abc', 'kb_bob')
+        self.assertEqual(self.calls, [(PROOF_VALID_ENDPOINT, 503)] * 2 + [(PROOF_VALID_ENDPOINT, 'unavailable')])
+
+    @override_settings(KEYBASE_PROOFS_HTTP_READ_TIMEOUT=0.01)
+    def test_in_memory_timeout(self):
+        verifier = InMemoryVerifier(latency=1)
+        with self.assertRaises(requests.Timeout):
+            verifier.proof_valid('example.com', 'bob', 'abc', 'kb_bob')
+        self.assertEqual(self.calls, [(PROOF_VALID_ENDPOINT, 'error')])
+
+    @override_settings(KEYBASE_PROOFS_BATCH_WAIT=0.05, KEYBASE_PROOFS_BATCH_SIZE=10,
+                       KEYBASE_PROOFS_BATCH_WORKERS=2)
+    def test_batching_backend(self):
+        backend = InMemoryVerifier(latency=0.01)
+        backend.set_outcome('revoked', False)
+        verifier = BatchingVerifier(backend=backend)
+        results = {}
+
+        def check(i):
+            sig_hash = 'revoked' if i == 0 else 'abc{}'.format(i)
+            results[i] = verifier.proof_live('example.com', 'bob', sig_hash, 'kb_bob')
+
+        threads = [threading.Thread(target=check, args=(i,)) for i in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[0], (False, False))
+        self.assertEqual([results[i] for i in range(1, 30)], [(True, True)] * 29)
+        # Each round trip answers up to 10 checks.
+        self.assertTrue(3 <= len(self.calls) < 30)
+
+        with patch.object(backend, 'verify_batch', side_effect=KeybaseUnavailable()):
+            with self.assertRaises(KeybaseUnavailable):
+                verifier.proof_valid('example.com', 'bob', 'abc', 'kb_bob')
+
+        with patch.object(backend, 'verify_batch', side_effect=lambda *args: threading.Event().wait(1)):
+            with deadline(0.1):
+                with self.assertRaises(DeadlineExceeded):
+                    verifier.proof_valid('example.com', 'bob', 'abc', 'kb_bob')
+
+    def test_verify_batch(self):
+        verifier = InMemoryVerifier()
+        verifier.set_outcome('pending', True, False)
+        self.assertEqual(verifier.verify_batch(PROOF_LIVE, 'example.com', [
+            ('bob', 'abc', 'kb_bob'),
+            ('bob', 'pending', 'kb_bob'),
+        ]), [(True, True), (True, False)])
+        self.assertEqual(self.calls, [(PROOF_LIVE_ENDPOINT, 200)])
@@ -1,12 +1,26 @@
+import json
+import threading
+import time
 from copy import copy
 from operator import itemgetter
 
 from django.conf import settings
+from django.test import RequestFactory
+from django.test import SimpleTestCase
 from django.test import TestCase
 from django.urls import reverse
 
+from keybase_proofs.cache import get_cache
+from keybase_proofs.client import keybase_client
+from keybase_proofs.instrumentation import call_coalesced
+from keybase_proofs.models import KeybaseProof
 from keybase_proofs.users import UserModel
+from keybase_proofs.views import KeybaseProofListView
+from keybase_proofs.views import KeybaseProofProfileView
 from keybase_proofs.views import is_proof_live
+from keybase_proofs.views import is_proof_valid
+from keybase_proofs.views import profile_flight
+from keybase_proofs.views import proof_list_flight
 
 try:
     from unittest.mock import MagicMock
@@ -20,7 +34,12 @@ except ImportError:
 
 class TestViews(TestCase):
 
-    @patch('requests.get')
+    def setUp(self):
+        get_cache().clear()
+        is_proof_valid.cache_clear()
+        is_proof_live.cache_clear()
+
+    @patch('requests.Session.get')
     def test_is_proof_live(self, mock_requests):
         mock_requests.return_value = MagicMock(status_code=200,
                                                json=lambda: {'proof_valid': True, 'proof_live': True})
@@ -32,19 +51,22 @@ class TestViews(TestCase):
         self.assertEqual(proof_valid, True)
         self.assertEqual(proof_live, True)
 
+        # Results are memoized, drop them before changing the response.
+        is_proof_live.cache_clear()
         mock_requests.return_value = MagicMock(status_code=200,
                                                json=lambda: 'invalid')
         proof_valid, proof_live = is_proof_live(user, 'sig_hash', 'kb_username')
         self.assertEqual(proof_valid, False)
         self.assertEqual(proof_live, False)
 
+        is_proof_live.cache_clear()
         mock_requests.return_value = MagicMock(status_code=400,
                                                json=lambda: {'proof_valid': False, 'proof_live': False})
         proof_valid, proof_live = is_proof_live(user, 'sig_hash', 'kb_username')
         self.assertEqual(proof_valid, False)
         self.assertEqual(proof_live, False)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_views(self, mock_requests):
         mock_requests.return_value = MagicMock(status_code=200,
                                                json=lambda: {'proof_valid': True})
@@ -120,7 +142,7 @@ class TestViews(TestCase):
             'kb_username': valid_data['kb_username'],
             'username': username,
             'sig_hash': valid_data['sig_hash']
-        })
+        }, timeout=keybase_client.timeout)
         mock_requests.reset_mock()
 
         resp = self.client.get(list_proofs_url)
@@ -142,7 +164,7 @@ class TestViews(TestCase):
             'kb_username': valid_data['kb_username'],
             'username': username,
             'sig_hash': valid_data['sig_hash']
-        })
+        }, timeout=keybase_client.timeout)
         mock_requests.reset_mock()
 
         resp = self.client.get(list_proofs_url)
@@ -169,7 +191,7 @@ class TestViews(TestCase):
             'username': username,
             'kb_username': valid_data2['kb_username'],
             'sig_hash': valid_data2['sig_hash']
-        })
+        }, timeout=keybase_client.timeout)
         mock_requests.reset_mock()
 
         resp = self.client.get(list_proofs_url)
@@ -187,3 +209,114 @@ class TestViews(TestCase):
 
         resp = self.client.get(reverse('keybase_proofs:new-proof'))
         self.assertEqual(resp.status_code, 200)
+
+    def test_batch_list_view(self):
+        url = reverse('keybase_proofs:list-proofs-batch-api')
+        for i in range(3):
+            user = UserModel().objects.create_user('user{}'.format(i))
+            for j in range(i):
+                KeybaseProof.objects.create(user=user, kb_username='kb{}'.format(j),
+                                            sig_hash='abc{}'.format(j), is_verified=j != 1)
+
+        expected = {
+            'keybase_sigs': {
+                'user0': [],
+                'user1': [{'kb_username': 'kb0', 'sig_hash': 'abc0'}],
+                'user2': [{'kb_username': 'kb0', 'sig_hash': 'abc0'}],
+            },
+            'not_found': ['nobody'],
+        }
+        usernames = ['user0', 'user1', 'nobody', 'user2', 'user1']
+        # Unknown usernames are looked up case-insensitively with one more query.
+        with self.assertNumQueries(2):
+            resp = self.client.get(url, data={'username': usernames})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), expected)
+
+        resp = self.client.post(url, data={'username': usernames})
+        self.assertEqual(resp.json(), expected)
+        resp = self.client.post(url, data=json.dumps({'usernames': usernames}),
+                                content_type='application/json')
+        self.assertEqual(resp.json(), expected)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(url, data='{"usernames": "user0"}', content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        with self.settings(KEYBASE_PROOFS_LIST_BATCH_MAX_SIZE=2):
+            resp = self.client.get(url, data={'username': usernames})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {'error': 'at most 2 usernames are allowed per request'})
+
+
+class TestSingleFlight(SimpleTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.flights = []
+        call_coalesced.connect(self.receiver)
+
+    def tearDown(self):
+        call_coalesced.disconnect(self.receiver)
+
+    def receiver(self, flight, **kwargs):
+        self.flights.append(flight)
+
+    def request_concurrently(self, view, flight, method, result, count=4):
+        """
+        Requests `view` for bob from `count` threads while the first request
+        is blocked in `method`, returns the responses and the number of calls
+        to `method`.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow(*args):
+            calls.append(args)
+            started.set()
+            release.wait()
+            return result
+
+        responses = []
+
+        def request():
+            response = view.as_view()(RequestFactory().get('/'), username='bob')
+            if callable(getattr(response, 'render', None)):
+                response.render()
+            responses.append(response)
+
+        coalesced = flight.coalesced
+        with patch.object(view, method, side_effect=slow):
+            leader = threading.Thread(target=request)
+            leader.start()
+            started.wait()
+            followers = [threading.Thread(target=request) for _ in range(count - 1)]
+            for thread in followers:
+                thread.start()
+            while flight.coalesced < coalesced + count - 1:
+                time.sleep(0.001)
+            release.set()
+            for thread in [leader] + followers:
+                thread.join()
+        return responses, len(calls)
+
+    def test_list_view(self):
+        sigs = [{'kb_username': 'kb_bob', 'sig_hash': 'abc123'}]
+        responses, calls = self.request_concurrently(
+            KeybaseProofListView, proof_list_flight, 'get_keybase_sigs', sigs)
+        self.assertEqual(calls, 1)
+        self.assertEqual([r.status_code for r in responses], [200] * 4)
+        for response in responses:
+            self.assertEqual(json.loads(response.content.decode('utf-8')), {'keybase_sigs': sigs})
+        self.assertEqual(self.flights, ['proof_list'] * 3)
+
+    def test_profile_view(self):
+        proofs = [KeybaseProof(kb_username='kb_bob', sig_hash='abc123', is_verified=True)]
+        responses, calls = self.request_concurrently(
+            KeybaseProofProfileView, profile_flight, 'get_queryset', proofs)
+        self.assertEqual(calls, 1)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context_data['object_list'], proofs)
+        self.assertEqual(self.flights, ['profile'] * 3)
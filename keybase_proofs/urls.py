@@ -1,12 +1,31 @@
-from django.conf.urls import url
+from importlib import import_module
+
+from django.views.decorators.csrf import csrf_exempt
+
+from keybase_proofs.compat import re_path
+
+
+def lazy_view(name):
+    """
+    Returns a view that imports `keybase_proofs.views.<name>` on its first
+    request, so that loading the urlconf (e.g. for the system checks of
+    management commands) doesn't import the views and their dependencies.
+    """
+    views = []
+
+    def view(request, *args, **kwargs):
+        if not views:
+            views.append(getattr(import_module('keybase_proofs.views'), name).as_view())
+        return views[0](request, *args, **kwargs)
+    view.__name__ = name
+    return view
 
-from keybase_proofs.views import KeybaseProofListView
-from keybase_proofs.views import KeybaseProofProfileView
-from keybase_proofs.views import KeybaseProofView
 
 app_name = 'keybase_proofs'
 urlpatterns = [
-    url(r'^api/(?P<username>.+)?', KeybaseProofListView.as_view(), name='list-proofs-api'),
-    url(r'^profile/(?P<username>.+)?', KeybaseProofProfileView.as_view(), name='profile'),
-    url(r'^new-proof/?', KeybaseProofView.as_view(), name='new-proof'),
+    # The CSRF middleware checks the exemption before the view is loaded.
+    re_path(r'^batch-api/?$', csrf_exempt(lazy_view('KeybaseProofBatchListView')), name='list-proofs-batch-api'),
+    re_path(r'^api/(?P<username>.+)?', lazy_view('KeybaseProofListView'), name='list-proofs-api'),
+    re_path(r'^profile/(?P<username>.+)?', lazy_view('KeybaseProofProfileView'), name='profile'),
+    re_path(r'^new-proof/?', lazy_view('KeybaseProofView'), name='new-proof'),
 ]
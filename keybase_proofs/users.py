@@ -13,3 +13,21 @@ def UserModelString():
 
 def UsernameField():
     return getattr(UserModel(), 'USERNAME_FIELD', 'username')
+
+
+def username_lookup_key(username):
+    """
+    Canonical (casefolded) form of `username`, stored on each proof as
+    `KeybaseProof.user_lookup_key` for indexed case-insensitive lookups.
+    """
+    from py2casefold import casefold
+    return casefold(username)
+
+
+def is_case_insensitive():
+    """
+    Whether the list and profile views resolve usernames case-insensitively,
+    from the optional `KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES` setting
+    (default True, matching `KeybaseProofView.username_eq`).
+    """
+    return getattr(settings, 'KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES', True)
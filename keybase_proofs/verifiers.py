@@ -0,0 +1,341 @@
+"""
+Verifier backends which answer `is_proof_valid` and `is_proof_live`.
+
+The backend is selected with the `KEYBASE_PROOFS_VERIFIER_BACKEND` setting, a
+dotted path to a `BaseVerifier` subclass (default `HTTPVerifier`). Result
+memoization stays in `keybase_proofs.views`, and all shipped backends go
+through the circuit breaker, deadline budget and instrumentation.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from keybase_proofs.breaker import DeadlineExceeded
+from keybase_proofs.breaker import remaining_budget
+from keybase_proofs.client import get_keybase_client
+from keybase_proofs.client import guarded_call
+from keybase_proofs.compat import monotonic
+from keybase_proofs.compat import queue
+from keybase_proofs.sites import get_current_site_id
+from keybase_proofs.sites import use_site
+
+logger = logging.getLogger(__name__)
+
+PROOF_VALID_ENDPOINT = "https://keybase.io/_/api/1.0/sig/proof_valid.json"
+PROOF_LIVE_ENDPOINT = "https://keybase.io/_/api/1.0/sig/proof_live.json"
+
+DEFAULT_VERIFIER_BACKEND = 'keybase_proofs.verifiers.HTTPVerifier'
+
+# Defaults for the `KEYBASE_PROOFS_BATCH_*` settings.
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_BATCH_WAIT = 0.005
+DEFAULT_BATCH_WORKERS = 4
+
+PROOF_VALID = 'proof_valid'
+PROOF_LIVE = 'proof_live'
+
+ENDPOINTS = {
+    PROOF_VALID: PROOF_VALID_ENDPOINT,
+    PROOF_LIVE: PROOF_LIVE_ENDPOINT,
+}
+
+
+class KeybaseError(Exception):
+    """
+    Raised by verifiers for error responses, where Keybase did not answer
+    whether a proof is valid.
+    """
+
+
+class BaseVerifier(object):
+    """
+    Interface for verifier backends. `proof_valid` returns a boolean and
+    `proof_live` a `(proof_valid, proof_live)` tuple, see
+    `keybase_proofs.views.is_proof_valid` and `is_proof_live`. Both may
+    raise, e.g. `KeybaseError`; the views treat errors other than
+    `KeybaseUnavailable` as a failed verification.
+    """
+
+    def proof_valid(self, domain, username, sig_hash, kb_username):
+        raise NotImplementedError
+
+    def proof_live(self, domain, username, sig_hash, kb_username):
+        raise NotImplementedError
+
+    def verify_batch(self, method, domain, checks):
+        """
+        Runs `method` (`PROOF_VALID` or `PROOF_LIVE`) for each
+        `(username, sig_hash, kb_username)` in `checks`, returning the results
+        in order with an exception in place of each failed check. Backends
+        that can check several proofs per round trip should override this.
+        """
+        results = []
+        for check in checks:
+            try:
+                results.append(getattr(self, method)(domain, *check))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class HTTPVerifier(BaseVerifier):
+    """
+    Verifies proofs with the Keybase API through the pooled client of the
+    current site (see `get_keybase_client`), or `client` if given. Keybase has
+    no batch endpoint, so batches are checked one by one.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def _get(self, method, domain, username, sig_hash, kb_username):
+        r = (self.client or get_keybase_client()).get(ENDPOINTS[method], params={
+            'domain': domain,
+            'username': username,
+            'kb_username': kb_username,
+            'sig_hash': sig_hash,
+        })
+        # Only a 200 with a `proof_valid` answers the check. Anything else,
+        # e.g. a 429 or a 4xx for a request Keybase could not process, must
+        # not be mistaken for a revocation.
+        if r.status_code != 200:
+            raise KeybaseError('Invalid response from Keybase: {}'.format(r))
+        r_json = r.json()
+        if not isinstance(r_json, dict) or 'proof_valid' not in r_json:
+            raise KeybaseError('Invalid response from Keybase: {!r}'.format(r_json))
+        return r_json
+
+    def proof_valid(self, domain, username, sig_hash, kb_username):
+        r_json = self._get(PROOF_VALID, domain, username, sig_hash, kb_username)
+        return r_json['proof_valid']
+
+    def proof_live(self, domain, username, sig_hash, kb_username):
+        r_json = self._get(PROOF_LIVE, domain, username, sig_hash, kb_username)
+        return r_json['proof_valid'], r_json.get('proof_live', False)
+
+
+class StubResponse(object):
+
+    def __init__(self, status_code, results=None):
+        self.status_code = status_code
+        self.results = results
+
+    def __repr__(self):
+        return '<StubResponse [{}]>'.format(self.status_code)
+
+
+class InMemoryVerifier(BaseVerifier):
+    """
+    In-process stand-in for Keybase, for load and capacity tests that must
+    not reach keybase.io. Calls go through the circuit breaker, deadline
+    budget and instrumentation just like real ones.
+
+    Outcomes are derived from a hash of the proof, so repeated checks of the
+    same proof agree. Configured with keyword arguments or the optional
+    settings:
+
+    `KEYBASE_PROOFS_STUB_LATENCY`: seconds each round trip takes (default 0).
+    `KEYBASE_PROOFS_STUB_ERROR_RATE`: fraction of round trips answered with
+        a 503 (default 0).
+    `KEYBASE_PROOFS_STUB_VALID_RATE`: fraction of proofs that are valid
+        (default 1).
+    `KEYBASE_PROOFS_STUB_LIVE_RATE`: fraction of valid proofs that are live
+        (default 1).
+
+    A batch is answered in a single round trip, simulating a batch endpoint.
+    Outcomes of individual proofs can be pinned with `set_outcome`.
+    """
+
+    def __init__(self, latency=None, error_rate=None, valid_rate=None, live_rate=None, seed=None):
+        self._options = {
+            'LATENCY': latency,
+            'ERROR_RATE': error_rate,
+            'VALID_RATE': valid_rate,
+            'LIVE_RATE': live_rate,
+        }
+        self._random = random.Random(seed)
+        self._outcomes = {}
+
+    def _option(self, name, default):
+        value = self._options[name]
+        if value is None:
+            value = getattr(settings, 'KEYBASE_PROOFS_STUB_' + name, default)
+        return value
+
+    def set_outcome(self, sig_hash, proof_valid, proof_live=None):
+        self._outcomes[sig_hash] = (proof_valid, proof_valid if proof_live is None else proof_live)
+
+    def _fraction(self, *parts):
+        digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) / float(0xffffffff)
+
+    def _outcome(self, domain, username, sig_hash, kb_username):
+        if sig_hash in self._outcomes:
+            return self._outcomes[sig_hash]
+        parts = (domain, username, sig_hash, kb_username)
+        proof_valid = self._fraction('valid', *parts) < self._option('VALID_RATE', 1)
+        proof_live = proof_valid and self._fraction('live', *parts) < self._option('LIVE_RATE', 1)
+        return proof_valid, proof_live
+
+    def _send(self, domain, checks, timeout):
+        latency = self._option('LATENCY', 0)
+        read_timeout = timeout[1]
+        if latency > read_timeout:
+            import requests
+            time.sleep(read_timeout)
+            raise requests.Timeout('Stub latency exceeds the read timeout')
+        if latency:
+            time.sleep(latency)
+        if self._random.random() < self._option('ERROR_RATE', 0):
+            return StubResponse(503)
+        return StubResponse(200, [self._outcome(domain, *check) for check in checks])
+
+    def verify_batch(self, method, domain, checks):
+        r = guarded_call(ENDPOINTS[method], lambda timeout: self._send(domain, checks, timeout),
+                         get_keybase_client().timeout)
+        if r.status_code != 200:
+            raise KeybaseError('Invalid response from Keybase: {}'.format(r))
+        if method == PROOF_LIVE:
+            return r.results
+        return [proof_valid for proof_valid, _ in r.results]
+
+    def proof_valid(self, domain, username, sig_hash, kb_username):
+        return self.verify_batch(PROOF_VALID, domain, [(username, sig_hash, kb_username)])[0]
+
+    def proof_live(self, domain, username, sig_hash, kb_username):
+        return self.verify_batch(PROOF_LIVE, domain, [(username, sig_hash, kb_username)])[0]
+
+
+class _Pending(object):
+
+    def __init__(self, method, domain, check):
+        self.method = method
+        self.domain = domain
+        self.check = check
+        # The workers don't inherit the caller's site, see `use_site`.
+        self.site_id = get_current_site_id()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingVerifier(BaseVerifier):
+    """
+    Collects checks made concurrently, e.g. by the threads of a busy server
+    or by `recheck_keybase_proofs`, into batches for another verifier's
+    `verify_batch`. While all workers are busy checks keep queueing up, so
+    batches grow with load while the number of concurrent round trips stays
+    bounded. Configured with the optional settings:
+
+    `KEYBASE_PROOFS_BATCH_BACKEND`: dotted path of the wrapped verifier
+        (default `HTTPVerifier`).
+    `KEYBASE_PROOFS_BATCH_SIZE`: maximum number of checks per batch.
+    `KEYBASE_PROOFS_BATCH_WAIT`: seconds to wait for more checks before
+        sending a batch.
+    `KEYBASE_PROOFS_BATCH_WORKERS`: maximum number of batches in flight.
+
+    Callers wait at most for the remaining deadline budget and then raise
+    `DeadlineExceeded`.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._dispatcher = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = import_string(getattr(
+                settings, 'KEYBASE_PROOFS_BATCH_BACKEND', DEFAULT_VERIFIER_BACKEND))()
+        return self._backend
+
+    def _start(self):
+        # The dispatcher is started lazily and restarted after a fork.
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                workers = getattr(settings, 'KEYBASE_PROOFS_BATCH_WORKERS', DEFAULT_BATCH_WORKERS)
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_forever, args=(workers,), name='keybase-proofs-batching')
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        max_size = getattr(settings, 'KEYBASE_PROOFS_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        send_at = monotonic() + getattr(settings, 'KEYBASE_PROOFS_BATCH_WAIT', DEFAULT_BATCH_WAIT)
+        while len(batch) < max_size:
+            timeout = send_at - monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_forever(self, workers):
+        slots = threading.BoundedSemaphore(workers)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        while True:
+            groups = OrderedDict()
+            for pending in self._collect():
+                groups.setdefault((pending.method, pending.domain, pending.site_id), []).append(pending)
+            for (method, domain, site_id), batch in groups.items():
+                slots.acquire()
+                executor.submit(self._send, slots, method, domain, site_id, batch)
+
+    def _send(self, slots, method, domain, site_id, batch):
+        try:
+            # Sent with the client and settings of the callers' site.
+            with use_site(site_id):
+                results = self.backend.verify_batch(method, domain, [pending.check for pending in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            slots.release()
+        for pending, result in zip(batch, results):
+            if isinstance(result, Exception):
+                pending.error = result
+            else:
+                pending.result = result
+            pending.event.set()
+
+    def _submit(self, method, domain, check):
+        self._start()
+        pending = _Pending(method, domain, check)
+        self._queue.put(pending)
+        if not pending.event.wait(remaining_budget()):
+            raise DeadlineExceeded('Deadline exceeded waiting for a batched Keybase call')
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def proof_valid(self, domain, username, sig_hash, kb_username):
+        return self._submit(PROOF_VALID, domain, (username, sig_hash, kb_username))
+
+    def proof_live(self, domain, username, sig_hash, kb_username):
+        return self._submit(PROOF_LIVE, domain, (username, sig_hash, kb_username))
+
+
+_verifiers = {}
+
+
+def get_verifier():
+    """
+    Returns the verifier named by `KEYBASE_PROOFS_VERIFIER_BACKEND`, one
+    instance per backend per process.
+    """
+    path = getattr(settings, 'KEYBASE_PROOFS_VERIFIER_BACKEND', DEFAULT_VERIFIER_BACKEND)
+    if path not in _verifiers:
+        _verifiers[path] = import_string(path)()
+    return _verifiers[path]
@@ -1,21 +1,56 @@
+import json
+import math
 import re
 
-import requests
 from jsonview.views import JsonView
-from py2casefold import casefold
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ImproperlyConfigured
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import Http404
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import ListView
 
+from keybase_proofs import cache
+from keybase_proofs import sites
+from keybase_proofs import snapshots
+from keybase_proofs.breaker import KeybaseUnavailable
+from keybase_proofs.breaker import deadline
+from keybase_proofs.compat import text_type
+from keybase_proofs.instrumentation import InstrumentedViewMixin
+from keybase_proofs.memoize import SingleFlight
+from keybase_proofs.memoize import memoize_verification
 from keybase_proofs.models import KeybaseProof
+from keybase_proofs.routers import is_sticky
+from keybase_proofs.routers import may_lag
+from keybase_proofs.routers import stick_to_primary
+from keybase_proofs.routers import use_primary
+from keybase_proofs.routers import use_replica
+from keybase_proofs.scheduler import first_check
+from keybase_proofs.serializers import dumps
+from keybase_proofs.serializers import proof_rows_to_dicts
+from keybase_proofs.sites import CurrentSiteMixin
+from keybase_proofs.users import is_case_insensitive
+from keybase_proofs.users import username_lookup_key
+from keybase_proofs.verifiers import PROOF_LIVE_ENDPOINT  # noqa: F401
+from keybase_proofs.verifiers import PROOF_VALID_ENDPOINT  # noqa: F401
+from keybase_proofs.verifiers import get_verifier
+
+DEFAULT_LIST_BATCH_MAX_SIZE = 100
+
+# Concurrent cache misses for the same user share one database fetch, e.g.
+# during Keybase crawler bursts.
+proof_list_flight = SingleFlight(name='proof_list')
+profile_flight = SingleFlight(name='profile')
 
 
 def fullmatch(regex, string, flags=0):
@@ -24,12 +59,19 @@ def fullmatch(regex, string, flags=0):
 
 
 def get_domain():
-    domain = getattr(settings, 'KEYBASE_PROOFS_DOMAIN')
+    """
+    The domain registered with Keybase for the current site (see
+    `keybase_proofs.sites`), `KEYBASE_PROOFS_DOMAIN` unless proofs are scoped
+    to sites.
+    """
+    domain = sites.get_current_config().domain
     if not domain:
         raise ImproperlyConfigured('KEYBASE_PROOFS_DOMAIN must be set when using.')
     return domain
 
 
+@memoize_verification(lambda username, sig_hash, kb_username: (
+    'proof_valid', get_domain(), username, sig_hash, kb_username))
 def is_proof_valid(username, sig_hash, kb_username):
     """
     Check the proof validity in Keybase via the `sig/proof_valid` endpoint.
@@ -37,26 +79,23 @@ def is_proof_valid(username, sig_hash, kb_username):
     the given domain/kb_username/username/sig_hash combination.
 
     Before storing a signature `proof_valid=True` must hold.
+
+    The check is made by the `KEYBASE_PROOFS_VERIFIER_BACKEND` (see
+    `keybase_proofs.verifiers`). Raises `KeybaseUnavailable` if the circuit
+    breaker is open or the current deadline is spent.
     """
 
     domain = get_domain()
-    endpoint = "https://keybase.io/_/api/1.0/sig/proof_valid.json"
     try:
-        r = requests.get(endpoint, params={
-            'domain': domain,
-            'username': username,
-            'kb_username': kb_username,
-            'sig_hash': sig_hash,
-        })
-        if r.status_code != 200:
-            print("Invalid response:", r)
-            return False
-        r_json = r.json()
-        return r_json.get('proof_valid', False)
+        return get_verifier().proof_valid(domain, username, sig_hash, kb_username)
+    except KeybaseUnavailable:
+        raise
     except Exception:
         return False
 
 
+@memoize_verification(lambda user, sig_hash, kb_username: (
+    'proof_live', get_domain(), user.username, sig_hash, kb_username))
 def is_proof_live(user, sig_hash, kb_username):
     """
     Checks the proof status in Keybase via the `sig/proof_live` endpoint.
@@ -72,26 +111,45 @@ def is_proof_live(user, sig_hash, kb_username):
     whenever a user inspects their own proof/profile/settings to update local
     records.  If a user revokes their proof from Keybase, this will return
     (profo_valid=False, proof_live=False).
+
+    The check is made by the `KEYBASE_PROOFS_VERIFIER_BACKEND` (see
+    `keybase_proofs.verifiers`). Raises `KeybaseUnavailable` if the circuit
+    breaker is open or the current deadline is spent.
     """
     domain = get_domain()
-    endpoint = "https://keybase.io/_/api/1.0/sig/proof_live.json"
     try:
-        r = requests.get(endpoint, params={
-            'domain': domain,
-            'username': user.username,
-            'kb_username': kb_username,
-            'sig_hash': sig_hash,
-        })
-        if r.status_code != 200:
-            print("Invalid response:", r)
-            return False, False
-        r_json = r.json()
-        return r_json.get('proof_valid', False), r_json.get('proof_live', False)
+        return get_verifier().proof_live(domain, user.username, sig_hash, kb_username)
+    except KeybaseUnavailable:
+        raise
     except Exception:
         return False, False
 
 
-class KeybaseProofProfileView(ListView):
+def _is_listed(is_verified, site_id):
+    # Whether a row of a join over all of a user's proofs is listed on the
+    # current site.
+    return bool(is_verified) and (not sites.is_enabled() or site_id == sites.get_current_site_id())
+
+
+class ReplicaReadMixin(object):
+    """
+    Serves the view's reads from `KEYBASE_PROOFS_REPLICAS` with
+    `keybase_proofs.routers.ReplicaRouter`, except for clients which posted a
+    proof recently.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if is_sticky(request):
+            return super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+        with use_replica():
+            response = super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+            # Template responses query lazily while rendering.
+            if callable(getattr(response, 'render', None)):
+                response.render()
+        return response
+
+
+class KeybaseProofProfileView(InstrumentedViewMixin, CurrentSiteMixin, ReplicaReadMixin, ListView):
     """
     Example endpoint for showing existing keybase proofs on a user's profile.
     Can be integrated into an existing profile page in production apps.
@@ -104,11 +162,42 @@ class KeybaseProofProfileView(ListView):
         context['domain'] = get_domain()
         return context
 
+    def get_user(self, username):
+        """
+        Looks up the user by exact username. If there is none and usernames
+        are case-insensitive (`KEYBASE_PROOFS_CASE_INSENSITIVE_USERNAMES`),
+        falls back to the indexed `KeybaseProof.user_lookup_key`, which only
+        resolves users with proofs.
+        """
+        User = get_user_model()
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            if is_case_insensitive():
+                users = list(User.objects.filter(
+                    keybaseproof__user_lookup_key=username_lookup_key(username)).distinct()[:2])
+                # Several users differing only in case are ambiguous.
+                if len(users) == 1:
+                    return users[0]
+        raise Http404('No user found matching the query')
+
     def get_queryset(self):
         username = self.kwargs.get('username', '')
-        user = get_object_or_404(get_user_model(), username=username)
-        queryset = self.model.objects.filter(user=user)
-        return queryset
+        return self.model.objects.verified_for(self.get_user(username))
+
+    def get_proofs(self):
+        """
+        Returns the evaluated `get_queryset`, fetched once for concurrent
+        requests for the same username.
+        """
+        username = self.kwargs.get('username', '')
+        # Clients reading from the primary don't share replica reads.
+        key = (username, sites.get_current_site_id(), is_sticky(self.request))
+        return profile_flight.do(key, lambda: list(self.get_queryset()))
+
+    def get(self, request, *args, **kwargs):
+        self.object_list = self.get_proofs()
+        return self.render_to_response(self.get_context_data())
 
 
 class KeybaseProofListView(JsonView, KeybaseProofProfileView):
@@ -116,19 +205,177 @@ class KeybaseProofListView(JsonView, KeybaseProofProfileView):
     API endpoint that the Keybase servers/clients will use to validate proofs.
     Returns a json list of proofs for the given username. Must be a publicly
     accessible url.
+
+    The encoded response is cached per user (see `keybase_proofs.cache`) and
+    served with `ETag`/`Last-Modified` headers, so conditional requests for
+    an unchanged list return a 304 without touching the database.
+    With `KEYBASE_PROOFS_LIST_SNAPSHOTS` enabled cache misses are served from
+    the user's `KeybaseProofSnapshot` (see `keybase_proofs.snapshots`).
+    Concurrent misses for the same user are coalesced into one fetch.
     """
 
+    def get_keybase_sigs(self, username):
+        """
+        Resolves the user and their verified proofs with a single outer join,
+        without instantiating any models. Raises a 404 for missing users and
+        returns an empty list for a valid username without proofs.
+
+        Usernames without an exact match are resolved case-insensitively like
+        `get_user`, with one more indexed query.
+        """
+        fields = ['keybaseproof__{}'.format(field) for field in KeybaseProof.LIST_FIELDS]
+        rows = list(get_user_model().objects.filter(username=username).values_list(
+            'keybaseproof__is_verified', 'keybaseproof__site_id', *fields))
+        if not rows and is_case_insensitive():
+            rows = list(KeybaseProof.objects.for_lookup_key(username).values_list(
+                'user', 'is_verified', 'site_id', *KeybaseProof.LIST_FIELDS))
+            if len(set(row[0] for row in rows)) == 1:
+                rows = [row[1:] for row in rows]
+            else:
+                rows = []
+        if not rows:
+            raise Http404('No user found matching the query')
+        return proof_rows_to_dicts(row[2:] for row in rows if _is_listed(row[0], row[1]))
+
+    def load_proof_list(self, username):
+        """
+        Loads and caches the list of a user that isn't cached.
+        """
+        # Read first, so that a list loaded before an invalidation is stale.
+        generation = cache.get_proof_list_generation(username)
+        if may_lag(cache.get_invalidated_at(generation)):
+            # A replica may not have the change yet, which would be cached
+            # for everyone under the new generation. Keybase crawls the list
+            # right after a proof is posted, so read it from the primary.
+            with use_primary():
+                return self._load_proof_list(username, generation)
+        return self._load_proof_list(username, generation)
+
+    def _load_proof_list(self, username, generation):
+        if snapshots.is_enabled():
+            snapshot = snapshots.get_snapshot(username)
+            if snapshot is not None:
+                return cache.set_proof_list_content(username, *snapshot, generation=generation)
+        return cache.set_proof_list(username, self.get_keybase_sigs(username), generation)
+
+    def get_proof_list_flight_key(self, username):
+        return (cache.proof_list_cache_key(username), is_sticky(self.request))
+
+    def get_proof_list(self):
+        username = self.kwargs.get('username', '')
+        entry = cache.get_proof_list(username)
+        if entry is None:
+            entry = proof_list_flight.do(
+                self.get_proof_list_flight_key(username), self.load_proof_list, username)
+        return entry
+
     def get_context_data(self, **kwargs):
-        # Will throw a 404 for missing users (from the URL parameter) or return
-        # an empty queryset for a valid username.
-        queryset = self.get_queryset()
-        return {
-            'keybase_sigs': [x.to_dict() for x in queryset]
-        }
+        return json.loads(self.get_proof_list()['content'].decode('utf-8'))
+
+    def get(self, request, *args, **kwargs):
+        entry = self.get_proof_list()
+        response = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'])
+        if response is None:
+            response = HttpResponse(entry['content'], content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class KeybaseProofBatchListView(InstrumentedViewMixin, CurrentSiteMixin, ReplicaReadMixin, View):
+    """
+    Batch version of `KeybaseProofListView` for crawlers syncing many users.
+    Usernames are given as repeated `username` query parameters, or in a
+    POST body either form encoded the same way or as json
+    `{"usernames": [...]}`, and are all resolved with a single query.
+    Responds with `{"keybase_sigs": {username: [...]}, "not_found": [...]}`.
+
+    At most `KEYBASE_PROOFS_LIST_BATCH_MAX_SIZE` (default 100) usernames are
+    accepted per request.
+    """
+
+    def get_max_size(self):
+        return getattr(settings, 'KEYBASE_PROOFS_LIST_BATCH_MAX_SIZE', DEFAULT_LIST_BATCH_MAX_SIZE)
+
+    def get_usernames(self, request):
+        if request.method == 'POST' and request.content_type == 'application/json':
+            try:
+                usernames = json.loads(request.body.decode('utf-8')).get('usernames')
+            except (ValueError, AttributeError):
+                usernames = None
+            if not isinstance(usernames, list) or not all(
+                    isinstance(username, text_type) for username in usernames):
+                return None
+        elif request.method == 'POST':
+            usernames = request.POST.getlist('username')
+        else:
+            usernames = request.GET.getlist('username')
+        # Dedupe, keeping the requested order.
+        seen = set()
+        return [username for username in usernames
+                if username and not (username in seen or seen.add(username))]
+
+    def get_keybase_sigs(self, usernames):
+        """
+        Maps each existing username to its verified proofs, using a single
+        outer join over all users. Usernames without an exact match are
+        resolved case-insensitively like `KeybaseProofProfileView.get_user`,
+        with one more indexed query for all of them.
+        """
+        fields = ['keybaseproof__{}'.format(field) for field in KeybaseProof.LIST_FIELDS]
+        rows = get_user_model().objects.filter(username__in=usernames).values_list(
+            'username', 'keybaseproof__is_verified', 'keybaseproof__site_id', *fields)
+        keybase_sigs = {}
+        for row in rows:
+            sigs = keybase_sigs.setdefault(row[0], [])
+            if _is_listed(row[1], row[2]):
+                sigs.extend(proof_rows_to_dicts([row[3:]]))
+
+        missing = {}
+        if is_case_insensitive():
+            for username in usernames:
+                if username not in keybase_sigs:
+                    missing.setdefault(username_lookup_key(username), []).append(username)
+        if missing:
+            rows = KeybaseProof.objects.filter(user_lookup_key__in=list(missing)).values_list(
+                'user_lookup_key', 'user', 'is_verified', 'site_id', *KeybaseProof.LIST_FIELDS)
+            matches = {}
+            for row in rows:
+                matches.setdefault(row[0], []).append(row[1:])
+            for key, key_rows in matches.items():
+                # Several users differing only in case are ambiguous.
+                if len(set(row[0] for row in key_rows)) != 1:
+                    continue
+                sigs = proof_rows_to_dicts(row[3:] for row in key_rows if _is_listed(row[1], row[2]))
+                for username in missing[key]:
+                    keybase_sigs[username] = sigs
+        return keybase_sigs
+
+    def json_response(self, data, status=200):
+        return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+    def get(self, request, *args, **kwargs):
+        usernames = self.get_usernames(request)
+        if not usernames:
+            return self.json_response({'error': 'at least one username is required'}, status=400)
+        max_size = self.get_max_size()
+        if len(usernames) > max_size:
+            return self.json_response(
+                {'error': 'at most {} usernames are allowed per request'.format(max_size)}, status=400)
+        keybase_sigs = self.get_keybase_sigs(usernames)
+        return self.json_response({
+            'keybase_sigs': keybase_sigs,
+            'not_found': [username for username in usernames if username not in keybase_sigs],
+        })
+
+    def post(self, request, *args, **kwargs):
+        return self.get(request, *args, **kwargs)
 
 
 @method_decorator(login_required, name='dispatch')
-class KeybaseProofView(View):
+class KeybaseProofView(InstrumentedViewMixin, CurrentSiteMixin, View):
     """
     Handles posting a new keybase proof. On GET requests the user can confirm
     the `kb_username` and `sig_hash` posted in the GET parameters from the
@@ -139,6 +386,10 @@ class KeybaseProofView(View):
     to repost the proof.
 
     `sig_hash` must validate as a hex string
+
+    With `KEYBASE_PROOFS_DEFERRED_VERIFICATION` set, proofs are stored as
+    pending without calling Keybase and verified by
+    `manage.py run_keybase_proof_worker`.
     """
     template_name = 'keybase_proofs/profile_confirm.html'
 
@@ -153,6 +404,7 @@ class KeybaseProofView(View):
         Force each username to lowercase and compare them. Can be overridden if
         the service has case sensitive usernames.
         """
+        from py2casefold import casefold
         return casefold(u1) == casefold(u2)
 
     def _validate(self, user, username, sig_hash, kb_username):
@@ -178,28 +430,80 @@ class KeybaseProofView(View):
             'error': error
         })
 
+    def save_proof(self, user, kb_username, sig_hash, is_verified, is_pending=False):
+        # A created proof is saved twice, readers must not see (and
+        # snapshots must not be refreshed from) the row in between.
+        with transaction.atomic():
+            kb_proof, created = KeybaseProof.objects.get_or_create(
+                user=user, kb_username=kb_username, site_id=sites.get_current_site_id())
+            # Fetched proofs don't carry `user`, reuse it instead of querying
+            # it again in the cache invalidation signal.
+            kb_proof.user = user
+            kb_proof.is_verified = is_verified
+            kb_proof.is_pending = is_pending
+            kb_proof.sig_hash = sig_hash
+            # Verified proofs are polled until Keybase reports them live,
+            # pending ones once the worker has verified them.
+            schedule = first_check() if is_verified else {
+                'is_live': False, 'check_failures': 0, 'next_check_at': None}
+            for field, value in schedule.items():
+                setattr(kb_proof, field, value)
+            kb_proof.save()
+        return kb_proof
+
+    def is_deferred(self):
+        """
+        Whether proofs are stored as pending and verified later by
+        `run_keybase_proof_worker`, from the optional
+        `KEYBASE_PROOFS_DEFERRED_VERIFICATION` setting.
+        """
+        return getattr(settings, 'KEYBASE_PROOFS_DEFERRED_VERIFICATION', False)
+
+    def get_verify_deadline(self):
+        """
+        Seconds the Keybase verification may take in total, from the
+        optional `KEYBASE_PROOFS_VERIFY_DEADLINE` setting.
+        """
+        return getattr(settings, 'KEYBASE_PROOFS_VERIFY_DEADLINE', None)
+
+    def unavailable_response(self, request, error):
+        response = render(request, self.template_name, {
+            'error': 'Keybase is temporarily unavailable, please try again shortly',
+        }, status=503)
+        if error.retry_after:
+            response['Retry-After'] = int(math.ceil(error.retry_after))
+        return response
+
+    def success_redirect(self, request, kb_ua, kb_username, sig_hash):
+        response = redirect(self.get_redirect_url(**{
+            'kb_ua': kb_ua,
+            'kb_username': kb_username,
+            'sig_hash': sig_hash,
+            'username': request.user.username,
+            'domain': get_domain(),
+        }), permanent=True)
+        # Called after saving a proof, see `keybase_proofs.routers`.
+        return stick_to_primary(response)
+
     def post(self, request, *args, **kwargs):
         sig_hash = request.POST.get('sig_hash')
         kb_username = request.POST.get('kb_username')
         username = request.POST.get('username')
         kb_ua = request.POST.get('kb_ua')
         error = self._validate(request.user, username, sig_hash, kb_username)
+        if error is None and self.is_deferred():
+            self.save_proof(request.user, kb_username, sig_hash, False, is_pending=True)
+            return self.success_redirect(request, kb_ua, kb_username, sig_hash)
         if error is None:
-            proof_valid = is_proof_valid(username, sig_hash, kb_username)
+            try:
+                with deadline(self.get_verify_deadline()):
+                    proof_valid = is_proof_valid(username, sig_hash, kb_username)
+            except KeybaseUnavailable as e:
+                return self.unavailable_response(request, e)
             if not proof_valid:
                 error = "Invalid signature, please retry"
             else:
-                kb_proof, created = KeybaseProof.objects.get_or_create(
-                    user=request.user, kb_username=kb_username)
-                kb_proof.is_verified = proof_valid
-                kb_proof.sig_hash = sig_hash
-                kb_proof.save()
-                return redirect(self.get_redirect_url(**{
-                    'kb_ua': kb_ua,
-                    'kb_username': kb_username,
-                    'sig_hash': sig_hash,
-                    'username': request.user.username,
-                    'domain': get_domain(),
-                }), permanent=True)
+                self.save_proof(request.user, kb_username, sig_hash, proof_valid)
+                return self.success_redirect(request, kb_ua, kb_username, sig_hash)
 
         return render(request, self.template_name, {'error': error}, status=400)
@@ -36,8 +36,13 @@ setup(
     install_requires=[
         'py2casefold>=1.0.1,<1.1',
         'requests>=2.20.0,<2.30.0',
-        'django-jsonview>=1.2.0,<1.3.0',
+        'django-jsonview>=1.2.0,<3.0.0',
+        'futures>=3.0.0;python_version<"3"',
     ],
+    extras_require={
+        'async': ['httpx>=0.18'],
+        'orjson': ['orjson'],
+    },
     cmdclass={'test': PyTest},
     include_package_data=True,
     classifiers=[
@@ -48,6 +53,8 @@ setup(
         'Framework :: Django :: 2.0',
         'Framework :: Django :: 2.1',
         'Framework :: Django :: 2.2',
+        'Framework :: Django :: 3.2',
+        'Framework :: Django :: 4.2',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
@@ -59,6 +66,10 @@ setup(
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: Utilities'
     ],
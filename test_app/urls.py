@@ -1,5 +1,4 @@
 from django.conf.urls import include
-from django.conf.urls import url
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.views.generic import TemplateView
@@ -7,13 +6,17 @@ from django.views.generic import TemplateView
 from .views import LoginView
 from .views import LogoutView
 
+from keybase_proofs.compat import re_path
+
 urlpatterns = [
-    url(r'^$',
-        TemplateView.as_view(template_name='index.html'), name='index'),
+    re_path(r'^$',
+            TemplateView.as_view(template_name='index.html'), name='index'),
+
+    re_path(r'^accounts/login/(?P<username>.+)?', LoginView.as_view(), name='auth_login'),
+    re_path(r'^accounts/logout/?', LogoutView.as_view(), name='auth_logout'),
 
-    url(r'^accounts/login/(?P<username>.+)?', LoginView.as_view(), name='auth_login'),
-    url(r'^accounts/logout/?', LogoutView.as_view(), name='auth_logout'),
+    re_path(r'^admin/', admin.site.urls),
 
-    url(r'^keybase-proofs/',
-        include('keybase_proofs.urls', namespace="keybase_proofs")),
+    re_path(r'^keybase-proofs/',
+            include('keybase_proofs.urls', namespace="keybase_proofs")),
 ]